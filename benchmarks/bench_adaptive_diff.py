@@ -0,0 +1,102 @@
+"""
+Compare reading the whole diff with the adaptive strategy, which runs
+"git diff --numstat" first and only reads the patches of the files that fit
+the prompt, on a mass-refactor change.
+
+Usage:
+    python benchmarks/bench_adaptive_diff.py [n_files] [runs]
+
+A throwaway repository with n_files tracked files (default 500), all of them
+modified, is created in a temporary directory. One of them holds a larger,
+meaningful change. The time is that of reading the diff from git and building
+the prompt from it, which compacts it to fit MAX_PROMPT_TOKENS. The prompt's
+size is what the LLM has to prefill.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from git_repo import make_repo
+
+from commizard import commands, compaction, config, git_utils, llm_providers
+
+
+def make_changes(path: Path, n_files: int) -> None:
+    make_repo(
+        path,
+        {
+            f"mod{i}.py": "".join(
+                f"value_{j} = old_name({j})\n" for j in range(40)
+            )
+            for i in range(n_files)
+        },
+    )
+    os.chdir(path)
+    # rename a function everywhere, and rewrite one module
+    for i in range(n_files):
+        text = (path / f"mod{i}.py").read_text()
+        (path / f"mod{i}.py").write_text(text.replace("old_name", "new_name"))
+    (path / "mod0.py").write_text(
+        "".join(f"def handler_{j}(req):\n    return {j}\n" for j in range(60))
+    )
+
+
+def measure(func, runs: int) -> tuple[float, float, str, str]:
+    """
+    Returns:
+        the best times to read the diff and to build the prompt, the diff and
+        the prompt.
+    """
+    best_git = best_prompt = float("inf")
+    diff = prompt = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        diff, _ = func()
+        read = time.perf_counter()
+        _, prompt = commands.build_prompt(diff, map_reduce=False)
+        best_git = min(best_git, read - start)
+        best_prompt = min(best_prompt, time.perf_counter() - read)
+    return best_git, best_prompt, diff, prompt
+
+
+def main() -> None:
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    cwd = Path.cwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_changes(Path(tmp), n_files)
+        budget = commands.adaptive_budget()
+        strategies = {
+            "full diff": lambda: git_utils.stream_clean_diff(
+                config.MAX_DIFF_BYTES
+            ),
+            "adaptive": lambda: git_utils.adaptive_clean_diff(budget),
+        }
+
+        print(f"{n_files} modified files, best of {runs} runs")
+        print(
+            f"{'strategy':<10} {'git':>9} {'prompt':>9} {'diff':>9} "
+            f"{'prompt size':>13}"
+        )
+        for name, func in strategies.items():
+            git_time, prompt_time, diff, prompt = measure(func, runs)
+            tokens = compaction.estimate_tokens(prompt)
+            print(
+                f"{name:<10} {git_time * 1000:>7.1f}ms "
+                f"{prompt_time * 1000:>7.1f}ms {len(diff) / 1000:>7.1f}kB "
+                f"{tokens:>6} tokens"
+            )
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    # build_prompt's warnings about compaction aren't relevant here
+    commands.output.print_warning = lambda message: None
+    llm_providers.selected_model = None
+    main()
@@ -0,0 +1,64 @@
+"""
+Compare the time to print the gradient banner from Rich markup with writing
+the pre-rendered escape codes, for both color systems that get a gradient.
+
+Usage:
+    python benchmarks/bench_banner.py [runs]
+
+The output goes to an in-memory terminal, so only rendering is measured.
+"""
+
+from __future__ import annotations
+
+import io
+import sys
+import time
+
+from rich.color import Color
+from rich.console import Console
+
+from commizard import start
+
+START, END = "#FF5E00", "#00F2FE"
+
+
+def best_time(func, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(f"time to print the banner, best of {runs} runs")
+    print(f"{'colors':<10} {'markup':>9} {'first':>9} {'cached':>9}")
+    for system in ("truecolor", "256"):
+        console = Console(
+            file=io.StringIO(), force_terminal=True, color_system=system
+        )
+        markup = best_time(
+            lambda: console.print(  # noqa: B023
+                start.gradient_text(
+                    start.text_banner, Color.parse(START), Color.parse(END)
+                )
+            ),
+            runs,
+        )
+
+        def write() -> None:
+            console.file.write(start.gradient_banner(START, END, system))  # noqa: B023
+
+        start.gradient_banner.cache_clear()
+        first = best_time(write, 1)
+        cached = best_time(write, runs)
+        print(
+            f"{system:<10} {markup * 1000:>7.2f}ms {first * 1000:>7.2f}ms "
+            f"{cached * 1000:>7.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
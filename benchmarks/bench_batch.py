@@ -0,0 +1,61 @@
+"""
+Measure the throughput of `commizard batch` against a stub server that takes a
+fixed time per generation, for several numbers of jobs.
+
+Usage:
+    python benchmarks/bench_batch.py [n_repos] [generation_seconds]
+
+n_repos throwaway repositories (default 24), each with a modified file, are
+created in a temporary directory. The stub server runs any number of
+generations in parallel, so throughput should grow with the number of jobs
+until git or the client become the bottleneck.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from git_repo import make_repo
+from stub_server import StubServer
+
+from commizard import batch, config
+
+JOBS = (1, 2, 4, 8)
+
+
+def main() -> None:
+    n_repos = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    gen_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    # every run must reach the server
+    config.USE_CACHE = False
+
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        StubServer(prefill_delay=lambda payload: gen_seconds) as server,
+    ):
+        repos = [str(Path(tmp) / f"repo{i}") for i in range(n_repos)]
+        for repo in repos:
+            make_repo(Path(repo), {"app.py": "a = 1\n" * 50})
+            (Path(repo) / "app.py").write_text("a = 2\n" * 50)
+        config.set_url(server.url)
+
+        print(f"{n_repos} repositories, {gen_seconds}s per generation")
+        print(f"{'jobs':>4} {'time':>8} {'repos/s':>8}")
+        for jobs in JOBS:
+            argv = ["-m", "stub", "-j", str(jobs), *repos]
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                code = batch.main(argv)
+            elapsed = time.perf_counter() - start
+            if code != 0 or out.getvalue().count('"ok"') != n_repos:
+                sys.exit(f"batch failed with {jobs} jobs:\n{out.getvalue()}")
+            print(f"{jobs:>4} {elapsed:>7.2f}s {n_repos / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
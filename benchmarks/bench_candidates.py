@@ -0,0 +1,85 @@
+"""
+Measure the wall time of `gen -n N` against a stub server that runs requests
+in parallel, like a GPU server with several slots, compared to generating the
+candidates one after another.
+
+Usage:
+    python benchmarks/bench_candidates.py [generation_seconds]
+
+Both the plain and the streamed generation are measured. With parallel slots,
+N candidates should take about as long as one.
+"""
+
+from __future__ import annotations
+
+import io
+import sys
+import time
+
+from rich.console import Console
+from stub_server import StubServer
+
+from commizard import config, llm_providers, output
+
+COUNTS = (1, 2, 4, 8)
+TOKENS = [
+    "Fix ",
+    "the ",
+    "parser\n\n",
+    "It ",
+    "dropped ",
+    "the ",
+    "last ",
+    "line.",
+]
+
+
+def sequential(prompt: str, n: int, stream: bool) -> list[tuple[int, str]]:
+    if stream:
+        return [
+            llm_providers.stream_chat(prompt, lambda delta: None)
+            for _ in range(n)
+        ]
+    return [llm_providers.generate(prompt, use_cache=False) for _ in range(n)]
+
+
+def timed(func, *args) -> float:
+    start = time.perf_counter()
+    results = func(*args)
+    elapsed = time.perf_counter() - start
+    if any(stat != 0 for stat, _ in results):
+        sys.exit(f"generation failed: {results}")
+    return elapsed
+
+
+def main() -> None:
+    gen_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    # every request must reach the server
+    config.USE_CACHE = False
+    output.console = Console(file=io.StringIO(), width=120)
+    llm_providers.selected_model = "stub"
+    prompt = llm_providers.generation_prompt + "some diff"
+
+    with StubServer(
+        TOKENS,
+        token_delay=gen_seconds / 2 / len(TOKENS),
+        prefill_delay=lambda payload: gen_seconds / 2,
+    ) as server:
+        config.set_url(server.url)
+        # open the first connection
+        sequential(prompt, 1, stream=False)
+        print(f"{gen_seconds}s per generation")
+        print(f"{'mode':>6} {'n':>2} {'one by one':>11} {'gen -n':>8}")
+        for stream in (False, True):
+            mode = "stream" if stream else "plain"
+            for n in COUNTS:
+                before = timed(sequential, prompt, n, stream)
+                after = timed(
+                    llm_providers.generate_candidates, prompt, n, stream
+                )
+                print(f"{mode:>6} {n:>2} {before:>10.2f}s {after:>7.2f}s")
+    llm_providers.close_session()
+
+
+if __name__ == "__main__":
+    main()
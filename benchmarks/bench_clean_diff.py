@@ -0,0 +1,72 @@
+"""
+Benchmark the diff sanitizer on synthetic diffs of 10k, 100k and 1M lines.
+
+Usage:
+    python benchmarks/bench_clean_diff.py [--legacy]
+
+The --legacy flag also times the previous list.remove based implementation.
+It is quadratic, so it is skipped on the largest diff.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+
+from commizard import git_utils
+
+SIZES = (10_000, 100_000, 1_000_000)
+LEGACY_MAX_LINES = 100_000
+
+
+def make_diff(n_lines: int, hunk_len: int = 40) -> str:
+    """
+    Build a synthetic diff with a file header every hunk_len lines.
+    """
+    lines: list[str] = []
+    i = 0
+    while len(lines) < n_lines:
+        lines += [
+            f"diff --git a/src/file{i}.py b/src/file{i}.py",
+            "index 1234567..89abcde 100644",
+            f"--- a/src/file{i}.py",
+            f"+++ b/src/file{i}.py",
+            "@@ -1,20 +1,20 @@",
+        ]
+        for j in range(hunk_len - 5):
+            lines.append(("+" if j % 2 else "-") + f"value_{j} = {i * j}")
+        i += 1
+    return "\n".join(lines[:n_lines])
+
+
+def legacy_clean_diff(diff: str) -> str:
+    lines = diff.splitlines()
+    for line in lines[:]:
+        if line.startswith(("diff --git", "index ", "warning:")):
+            lines.remove(line)
+    return "\n".join(lines)
+
+
+def timed(func, arg) -> tuple[float, str]:
+    start = time.perf_counter()
+    res = func(arg)
+    return time.perf_counter() - start, res
+
+
+def main() -> None:
+    with_legacy = "--legacy" in sys.argv[1:]
+    print(f"{'lines':>10} {'clean_diff':>12} {'legacy':>12}")
+    for size in SIZES:
+        diff = make_diff(size)
+        new_t, new_res = timed(git_utils.clean_diff, diff)
+        legacy = "skipped"
+        if with_legacy and size <= LEGACY_MAX_LINES:
+            old_t, old_res = timed(legacy_clean_diff, diff)
+            if old_res != new_res:
+                sys.exit("the legacy and current outputs differ")
+            legacy = f"{old_t:.3f}s"
+        print(f"{size:>10} {new_t:>11.3f}s {legacy:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Measure what diff compaction costs and what it buys, on synthetic diffs of 1k,
+10k and 100k lines mixing small source hunks, a regenerated lock file and a
+bulk deletion.
+
+For each diff it reports the time compaction takes, the prompt's estimated
+tokens before and after, the share of changed source lines kept (a proxy of
+the quality trade-off), and the time to first token of the generation.
+
+Usage:
+    python benchmarks/bench_compaction.py [--url URL --model NAME]
+                                          [--prefill-rate TOKENS_PER_SEC]
+
+By default, generations go to a local stub server that emulates prompt
+processing at --prefill-rate tokens per second (2000 by default, in the range
+of a small model on a GPU), up to a 32k context window. Pass --url and --model
+to time a real server.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import time
+
+from stub_server import StubServer
+
+from commizard import compaction, config, git_utils, llm_providers
+
+SIZES = (1_000, 10_000, 100_000)
+# Like real servers, the stub only processes this many tokens of a prompt and
+# drops the rest.
+CONTEXT_WINDOW = 32_768
+
+
+def make_diff(n_lines: int) -> str:
+    """
+    Build a raw git diff of about n_lines lines: 60% source hunks, 30% lock
+    file churn and 10% deleted file.
+    """
+    lines: list[str] = []
+    i = 0
+    while len(lines) < n_lines * 0.6:
+        lines += [
+            f"diff --git a/src/mod{i}.py b/src/mod{i}.py",
+            "index 1234567..89abcde 100644",
+            f"--- a/src/mod{i}.py",
+            f"+++ b/src/mod{i}.py",
+            f"@@ -{i * 10 + 1},7 +{i * 10 + 1},7 @@ def func_{i}():",
+            "     x = compute()",
+            "     y = transform(x)",
+            "     z = validate(y)",
+            f"-    return old_value_{i}(z)",
+            f"+    return new_value_{i}(z, strict=True)",
+            "     # end",
+            "     pass",
+            "     pass",
+        ]
+        i += 1
+    n_lock = int(n_lines * 0.3)
+    lines += [
+        "diff --git a/package-lock.json b/package-lock.json",
+        "index 1234567..89abcde 100644",
+        "--- a/package-lock.json",
+        "+++ b/package-lock.json",
+        f"@@ -1,{n_lock} +1,{n_lock} @@",
+    ]
+    lines += [
+        f'{"-" if j % 2 else "+"}    "dep-{j}": "^{j}.0.0",'
+        for j in range(n_lock)
+    ]
+    n_del = int(n_lines * 0.1)
+    lines += [
+        "diff --git a/legacy/old.py b/legacy/old.py",
+        "deleted file mode 100644",
+        "index 1234567..0000000",
+        "--- a/legacy/old.py",
+        "+++ /dev/null",
+        f"@@ -1,{n_del} +0,0 @@",
+    ]
+    lines += [f"-legacy_line_{j} = {j}" for j in range(n_del)]
+    return "\n".join(lines)
+
+
+def source_lines(diff: str) -> set[str]:
+    return {
+        line
+        for f in compaction.parse_diff(diff)
+        if f.tier == compaction.TIER_SOURCE
+        for h in f.hunks
+        for line in h.lines
+        if line[:1] in ("+", "-")
+    }
+
+
+def time_to_first_token(prompt: str) -> float:
+    start = time.perf_counter()
+    with llm_providers.StreamRequest(
+        "POST",
+        config.gen_request_url(),
+        json=llm_providers.chat_payload(prompt, stream=True),
+        headers=llm_providers.chat_headers,
+        timeout=(1, 600),
+    ) as stream:
+        for raw in stream:
+            if llm_providers.parse_sse_line(raw):
+                break
+    return time.perf_counter() - start
+
+
+def run() -> None:
+    budget = config.MAX_PROMPT_TOKENS or 6_000
+    print(f"budget: {budget} tokens")
+    print(
+        f"{'lines':>8} {'compact':>9} {'tokens':>8} {'compacted':>10} "
+        f"{'src kept':>9} {'ttft full':>10} {'ttft compact':>13}"
+    )
+    for size in SIZES:
+        diff = git_utils.clean_diff(make_diff(size))
+        start = time.perf_counter()
+        compacted, _, _ = compaction.compact_diff(diff, budget)
+        elapsed = time.perf_counter() - start
+
+        src = source_lines(diff)
+        kept = len(src & set(compacted.splitlines())) / len(src)
+        full_ttft = time_to_first_token(diff)
+        compact_ttft = time_to_first_token(compacted)
+        print(
+            f"{size:>8} {elapsed * 1000:>7.1f}ms "
+            f"{compaction.estimate_tokens(diff):>8} "
+            f"{compaction.estimate_tokens(compacted):>10} {kept:>9.0%} "
+            f"{full_ttft:>9.2f}s {compact_ttft:>12.2f}s"
+        )
+    llm_providers.close_session()
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    opts = dict(zip(args[::2], args[1::2]))
+    prefill_rate = float(opts.get("--prefill-rate", 2_000))
+    if "--url" in opts:
+        config.set_url(opts["--url"].rstrip("/") + "/")
+        llm_providers.selected_model = opts.get("--model")
+        run()
+        return
+
+    def prefill_delay(payload: dict) -> float:
+        tokens = compaction.estimate_tokens(json.dumps(payload["messages"]))
+        return min(tokens, CONTEXT_WINDOW) / prefill_rate
+
+    llm_providers.selected_model = "stub"
+    with StubServer(prefill_delay=prefill_delay) as server:
+        config.set_url(server.url)
+        run()
+
+
+if __name__ == "__main__":
+    main()
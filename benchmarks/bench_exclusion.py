@@ -0,0 +1,104 @@
+"""
+Compare reading the diff with and without leaving generated files out of it,
+on a dependency update that touches a lock file, a minified bundle and test
+snapshots along with a few source files.
+
+Usage:
+    python benchmarks/bench_exclusion.py [lock_lines] [runs]
+
+A throwaway repository is created in a temporary directory, with a
+package-lock.json of lock_lines lines (default 30000) that's rewritten. The
+time is that of reading the diff from git and building the prompt from it,
+which compacts it to fit MAX_PROMPT_TOKENS.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from git_repo import make_repo
+
+from commizard import commands, compaction, config, llm_providers
+
+
+def write_tree(path: Path, lock_lines: int, version: int) -> None:
+    lock = "".join(
+        f'    "node_modules/pkg{i}": {{"version": "{version}.{i}.0"}},\n'
+        for i in range(lock_lines)
+    )
+    (path / "package-lock.json").write_text(f"{{\n{lock}}}\n")
+    (path / "static").mkdir(exist_ok=True)
+    (path / "static" / "app.min.js").write_text(
+        ";".join(f"var a{i}={version}" for i in range(20_000))
+    )
+    (path / "__snapshots__").mkdir(exist_ok=True)
+    for i in range(20):
+        (path / "__snapshots__" / f"view{i}.test.js.snap").write_text(
+            "".join(f"<div>{version} {j}</div>\n" for j in range(200))
+        )
+    for i in range(3):
+        (path / f"src{i}.js").write_text(
+            "".join(
+                f"export const f{j} = () => {version * j};\n" for j in range(30)
+            )
+        )
+
+
+def make_changes(path: Path, lock_lines: int) -> None:
+    write_tree(path, lock_lines, 1)
+    make_repo(path)
+    os.chdir(path)
+    write_tree(path, lock_lines, 2)
+
+
+def measure(runs: int) -> tuple[float, float, str, str]:
+    """
+    Returns:
+        the best times to read the diff and to build the prompt, the diff and
+        the prompt.
+    """
+    best_git = best_prompt = float("inf")
+    diff = prompt = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        diff, _ = commands.read_diff(None, adaptive=False)
+        read = time.perf_counter()
+        _, prompt = commands.build_prompt(diff, map_reduce=False)
+        best_git = min(best_git, read - start)
+        best_prompt = min(best_prompt, time.perf_counter() - read)
+    return best_git, best_prompt, diff, prompt
+
+
+def main() -> None:
+    lock_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 30_000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    cwd = Path.cwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_changes(Path(tmp), lock_lines)
+        print(f"{lock_lines} lock file lines, best of {runs} runs")
+        print(
+            f"{'exclusion':<10} {'git':>9} {'prompt':>9} {'diff':>9} "
+            f"{'prompt size':>13}"
+        )
+        for enabled in (False, True):
+            config.EXCLUDE_FILES = enabled
+            git_time, prompt_time, diff, prompt = measure(runs)
+            tokens = compaction.estimate_tokens(prompt)
+            print(
+                f"{'on' if enabled else 'off':<10} {git_time * 1000:>7.1f}ms "
+                f"{prompt_time * 1000:>7.1f}ms {len(diff) / 1000:>7.1f}kB "
+                f"{tokens:>6} tokens"
+            )
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    # the warnings about compaction and exclusion aren't relevant here
+    commands.output.print_warning = lambda message: None
+    llm_providers.selected_model = None
+    main()
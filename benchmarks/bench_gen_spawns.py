@@ -0,0 +1,102 @@
+"""
+Count the git processes spawned by each `gen` and measure its wall time, with
+the LLM call stubbed out.
+
+Usage:
+    python benchmarks/bench_gen_spawns.py [n_files] [runs]
+
+A throwaway repository with n_files tracked files (default 2000), half of
+them modified, is created in a temporary directory. The "is_changed + diff"
+row emulates the previous two-pass diff acquisition for comparison. The
+files to leave out of the diff (see config.EXCLUDE_FILES) are chosen from
+stats that the same git process prints before the diff, which takes git
+longer but no other spawn. The session's first gen spends one more looking
+the repository's root up, and repositories with gitattributes files another
+on each gen, reading them.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+from git_repo import make_repo
+
+from commizard import commands, config, git_utils, llm_providers
+
+
+def make_changes(path: Path, n_files: int) -> None:
+    make_repo(
+        path, {f"file{i}.txt": f"line {i}\n" * 20 for i in range(n_files)}
+    )
+    os.chdir(path)
+    for i in range(0, n_files, 2):
+        (path / f"file{i}.txt").write_text(f"changed {i}\n" * 20)
+
+
+def measure(func, runs: int) -> tuple[float, float]:
+    """
+    Returns:
+        the average number of spawned processes and wall time per run
+    """
+    real_popen = subprocess.Popen
+    spawns = 0
+
+    def counting_popen(*args, **kwargs):
+        nonlocal spawns
+        spawns += 1
+        return real_popen(*args, **kwargs)
+
+    with patch("subprocess.Popen", counting_popen):
+        start = time.perf_counter()
+        for _ in range(runs):
+            func()
+        elapsed = time.perf_counter() - start
+    return spawns / runs, elapsed / runs
+
+
+def gen_without_exclusion() -> None:
+    config.EXCLUDE_FILES = False
+    try:
+        commands.generate_message([])
+    finally:
+        config.EXCLUDE_FILES = True
+
+
+def legacy_diff() -> None:
+    if git_utils.is_changed():
+        git_utils.stream_clean_diff(config.MAX_DIFF_BYTES)
+
+
+def main() -> None:
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    cwd = Path.cwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        make_changes(Path(tmp), n_files)
+        config.STREAM = True
+        # stay out of the user's cache
+        config.USE_CACHE = False
+        with patch.object(
+            llm_providers, "stream_generate", return_value=(0, "title")
+        ):
+            rows = [
+                ("gen", lambda: commands.generate_message([])),
+                ("gen, no exclusion", gen_without_exclusion),
+                ("is_changed + diff", legacy_diff),
+            ]
+            print(f"{n_files} files, {runs} runs")
+            print(f"{'':<20} {'spawns/run':>10} {'ms/run':>10}")
+            for name, func in rows:
+                spawns, wall = measure(func, runs)
+                print(f"{name:<20} {spawns:>10.1f} {wall * 1000:>10.1f}")
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
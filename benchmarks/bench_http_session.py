@@ -0,0 +1,53 @@
+"""
+Compare the per-request latency of 100 sequential generations against a local
+stub server, with and without the pooled keep-alive session.
+
+Usage:
+    python benchmarks/bench_http_session.py [n_requests]
+"""
+
+from __future__ import annotations
+
+import statistics
+import sys
+import time
+
+from stub_server import StubServer
+
+from commizard import config, llm_providers
+
+
+def run(n_requests: int) -> list[float]:
+    timings = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        stat, _ = llm_providers.generate("prompt")
+        timings.append(time.perf_counter() - start)
+        if stat != 0:
+            sys.exit("generation against the stub server failed")
+    return timings
+
+
+def main() -> None:
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    # every request must reach the server
+    config.USE_CACHE = False
+    llm_providers.selected_model = "stub"
+    with StubServer() as server:
+        config.set_url(server.url)
+        print(f"{n_requests} sequential generations")
+        print(f"{'':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for keep_alive in (False, True):
+            config.HTTP_KEEP_ALIVE = keep_alive
+            run(5)  # warm up
+            timings = sorted(run(n_requests))
+            name = "keep-alive" if keep_alive else "new conn"
+            mean = statistics.mean(timings) * 1000
+            p50 = timings[len(timings) // 2] * 1000
+            p95 = timings[int(len(timings) * 0.95)] * 1000
+            print(f"{name:<12} {mean:>9.2f} {p50:>9.2f} {p95:>9.2f}")
+        llm_providers.close_session()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare the JSON backends decoding the chunks of streamed chat completions,
+by the time they take per chunk. Backends that aren't installed are skipped.
+
+Usage:
+    python benchmarks/bench_json_decode.py [RECORDED_STREAM ...]
+
+A recorded stream is the raw body of a /v1/chat/completions response, e.g.
+saved with curl -N. Without one, a synthetic stream of Ollama-like chunks is
+decoded.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import timeit
+from pathlib import Path
+
+from commizard import llm_providers
+
+N_CHUNKS = 10_000
+REPEAT = 5
+
+
+def record_stream(n_chunks: int) -> bytes:
+    events = []
+    for i in range(n_chunks):
+        chunk = {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 1767616167,
+            "model": "qwen2.5-coder:7b",
+            "system_fingerprint": "fp_ollama",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": f" token{i}"},
+                    "finish_reason": None,
+                }
+            ],
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode()
+
+
+def events_of(raw: bytes) -> list[str]:
+    decoder = llm_providers.SSEDecoder()
+    events = decoder.feed(raw) + decoder.flush()
+    return [data for data in events if data != "[DONE]"]
+
+
+def time_backend(name: str, events: list[str]) -> float | None:
+    """
+    Returns:
+        the best time to decode a chunk, in seconds, or None if the backend
+        isn't installed.
+    """
+    try:
+        decode = llm_providers.json_backends[name]()
+    except ImportError:
+        return None
+
+    def run() -> None:
+        for data in events:
+            decode(data)
+
+    return min(timeit.repeat(run, number=1, repeat=REPEAT)) / len(events)
+
+
+def main() -> None:
+    streams = {path: Path(path).read_bytes() for path in sys.argv[1:]}
+    if not streams:
+        streams = {f"{N_CHUNKS} chunks": record_stream(N_CHUNKS)}
+
+    print("time per chunk")
+    names = list(llm_providers.json_backends)
+    print(f"{'stream':<16}" + "".join(f"{n:>10}" for n in names))
+    for stream, raw in streams.items():
+        events = events_of(raw)
+        row = f"{stream:<16}"
+        for name in names:
+            t = time_backend(name, events)
+            row += f"{'-':>10}" if t is None else f"{t * 1e9:>8.0f}ns"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Measure the time of refining a message with `regen`, against a stub server
+that keeps the KV cache of its last prompt like Ollama does: only the part of
+a prompt that doesn't start like the last one (and its response) is
+processed, at a fixed cost per character.
+
+Usage:
+    python benchmarks/bench_regenerate.py [diff_kb] [ms_per_kb]
+
+Refining through the conversation is compared with sending a fresh prompt
+holding the feedback, the last draft and the diff, for each refinement.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+
+from stub_server import PrefixCache, StubServer
+
+from commizard import config, llm_providers
+
+TOKENS = [
+    "Fix ",
+    "the ",
+    "parser\n\n",
+    "It ",
+    "dropped ",
+    "the ",
+    "last ",
+    "line.",
+]
+FEEDBACK = ("shorter", "mention the tests", "imperative mood")
+
+
+def fresh(diff: str) -> None:
+    draft = ""
+    for feedback in (None, *FEEDBACK):
+        # the instructions come before the diff, as in the generation prompt
+        prompt = llm_providers.generation_prompt + diff
+        if feedback is not None:
+            prompt = (
+                f"Rewrite this commit message following this feedback: "
+                f"{feedback}\n\n{draft}\n\nHere is the diff:\n{diff}"
+            )
+        stat, draft = llm_providers.generate(prompt, use_cache=False)
+        if stat != 0:
+            sys.exit(draft)
+
+
+def conversation(diff: str) -> None:
+    prompt = llm_providers.generation_prompt + diff
+    stat, res = llm_providers.generate(prompt, use_cache=False)
+    if stat != 0:
+        sys.exit(res)
+    llm_providers.conversation = llm_providers.Conversation(prompt, res)
+    for feedback in FEEDBACK:
+        stat, res = llm_providers.regenerate(feedback)
+        if stat != 0:
+            sys.exit(res)
+
+
+def main() -> None:
+    diff_kb = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    ms_per_kb = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    diff = "+ a changed line of code\n" * int(diff_kb * 1000 / 25)
+    config.STREAM = False
+    config.USE_CACHE = False
+    llm_providers.selected_model = "stub"
+    prefill = PrefixCache(ms_per_kb / 1000 / 1000, "".join(TOKENS))
+
+    with StubServer(TOKENS, prefill_delay=prefill) as server:
+        config.set_url(server.url)
+        print(f"{diff_kb:.0f} kB diff, {ms_per_kb:.0f}ms of prefill per kB")
+        print(f"gen, then {len(FEEDBACK)} refinements:")
+        for name, func in (("fresh", fresh), ("conversation", conversation)):
+            prefill.last = ""
+            prefill.processed = 0
+            start = time.perf_counter()
+            func(diff)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>12} {elapsed:>6.2f}s, "
+                f"{prefill.processed / 1000:>6.1f} kB prefilled"
+            )
+    llm_providers.close_session()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure how long `gen` takes after an edit with and without `watch on`,
+against a stub server that takes a fixed time per generation.
+
+Usage:
+    python benchmarks/bench_speculation.py [generation_seconds]
+
+A throwaway repository is edited, then `gen` is run after the user has
+"thought" for a while. The watcher waits for the changes to be still for
+WATCH_DEBOUNCE seconds, then generates their message in the background, so a
+`gen` typed after that only waits for what's left of the generation.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from git_repo import make_repo
+from rich.console import Console
+from stub_server import StubServer
+
+from commizard import commands, config, llm_providers, output
+
+INTERVAL = 0.05
+DEBOUNCE = 0.3
+
+
+def timed_gen(repo: Path, edit: int, think: float) -> float:
+    (repo / "app.py").write_text(f"a = {edit}\n" * 50)
+    time.sleep(think)
+    start = time.perf_counter()
+    commands.generate_message([])
+    elapsed = time.perf_counter() - start
+    if llm_providers.gen_message is None:
+        sys.exit("gen failed")
+    llm_providers.gen_message = None
+    return elapsed
+
+
+def main() -> None:
+    gen_seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    output.console = Console(file=io.StringIO())
+    config.STREAM = False
+    config.WATCH_INTERVAL = INTERVAL
+    config.WATCH_DEBOUNCE = DEBOUNCE
+    thinks = (0.0, DEBOUNCE + gen_seconds / 2, DEBOUNCE + 2 * gen_seconds)
+
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        StubServer(prefill_delay=lambda payload: gen_seconds) as server,
+    ):
+        os.environ["XDG_CACHE_HOME"] = str(Path(tmp) / "cache")
+        repo = Path(tmp) / "repo"
+        make_repo(repo, {"app.py": "a = 1\n" * 50})
+        os.chdir(repo)
+        config.set_url(server.url)
+        llm_providers.selected_model = "stub"
+
+        print(f"{gen_seconds}s per generation, {DEBOUNCE}s debounce")
+        print(f"{'think':>6} {'gen':>7} {'watched gen':>12}")
+        edit = 2
+        for think in thinks:
+            before = timed_gen(repo, edit, think)
+            commands.watch_command(["on"])
+            after = timed_gen(repo, edit + 1, think)
+            commands.watch_command(["off"])
+            edit += 2
+            print(f"{think:>5.2f}s {before:>6.2f}s {after:>11.2f}s")
+    llm_providers.close_session()
+
+
+if __name__ == "__main__":
+    main()
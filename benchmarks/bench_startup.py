@@ -0,0 +1,101 @@
+"""
+Measure the time from launching the interactive session to its first prompt,
+with the local Ollama server up, down, and unresponsive.
+
+Usage:
+    python benchmarks/bench_startup.py [runs]
+
+The session is started in a throwaway repository with its output piped, so
+the banner is printed without colors. The server is emulated on Ollama's
+port, 11434, which must be free:
+  up            the stub server answers the startup probe
+  down          nothing listens on the port, so the connection is refused
+  unresponsive  the port accepts connections but never answers, so the
+                probe waits for its whole timeout
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from git_repo import git
+from stub_server import StubServer
+
+import commizard
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+OLLAMA_PORT = 11434
+PROMPT = b"CommiZard> "
+
+
+@contextlib.contextmanager
+def unresponsive_server():
+    with socket.socket() as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", OLLAMA_PORT))
+        # connections complete in the backlog, but are never accepted
+        sock.listen(16)
+        yield
+
+
+def time_to_prompt(repo: Path) -> float:
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(Path(commizard.__file__).parents[1]),
+        "PYTHONIOENCODING": "utf-8",
+        # keep the user's cache out of it
+        "XDG_CACHE_HOME": str(repo / ".cache"),
+    }
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", "from commizard import cli; cli.main()"],
+        cwd=repo,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if proc.stdout is None:
+        sys.exit("the session's output isn't piped")
+    out = b""
+    while PROMPT not in out:
+        chunk = os.read(proc.stdout.fileno(), 4096)
+        if not chunk:
+            sys.exit(f"the session exited before its prompt:\n{out.decode()}")
+        out += chunk
+    elapsed = time.perf_counter() - start
+    proc.communicate(b"exit\n")
+    return elapsed
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    servers: dict[str, Callable[[], contextlib.AbstractContextManager]] = {
+        "up": lambda: StubServer(port=OLLAMA_PORT),
+        "down": contextlib.nullcontext,
+        "unresponsive": unresponsive_server,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        git(repo, "init", "-q")
+        print(f"time to the first prompt, best of {runs} runs")
+        print(f"{'server':<14} {'time':>9}")
+        for name, server in servers.items():
+            with server():
+                best = min(time_to_prompt(repo) for _ in range(runs))
+            print(f"{name:<14} {best * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Replay recorded streamed completions through the SSE decoding and live
+rendering of stream_generate, and measure the CPU time spent per token.
+
+The previous pipeline (decoded lines, a JSON parse per line, and a Live
+display redrawing the whole message 30 times a second) is replayed too, for
+comparison. Time is simulated, with tokens arriving at --rate tokens per
+second, so both renderers draw as many frames as they would live.
+
+Usage:
+    python benchmarks/bench_stream_render.py [--rate TOKENS_PER_SEC]
+                                             [RECORDED_STREAM ...]
+
+A recorded stream is the raw body of a /v1/chat/completions response, e.g.
+saved with curl -N. Without one, synthetic streams of 10k and 50k tokens are
+replayed. The legacy renderer's cost grows with the square of the message's
+length, so it's skipped for streams longer than LEGACY_MAX_TOKENS.
+"""
+
+from __future__ import annotations
+
+import codecs
+import io
+import json
+import random
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from rich.console import Console
+from rich.live import Live
+from rich.text import Text
+
+from commizard import llm_providers, output
+
+SIZES = (10_000, 50_000)
+LEGACY_MAX_TOKENS = 10_000
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def record_stream(n_tokens: int) -> list[bytes]:
+    """
+    Build the network chunks of a streamed completion of n_tokens tokens, in
+    paragraphs of about 60 tokens, like Ollama sends them.
+    """
+    rng = random.Random(0)
+    words = ["the", "parser", "config", "cache", "now", "handles", "diffs"]
+    events = []
+    for i in range(n_tokens):
+        token = " " + rng.choice(words)
+        if i % 60 == 59:
+            token += "\n\n"
+        chunk = {
+            "id": "chatcmpl-1",
+            "object": "chat.completion.chunk",
+            "created": 1767616167,
+            "model": "stub",
+            "system_fingerprint": "fp_ollama",
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": token},
+                    "finish_reason": None,
+                }
+            ],
+        }
+        events.append(f"data: {json.dumps(chunk)}\n\n".encode())
+    events.append(b"data: [DONE]\n\n")
+
+    # one to four events per network read, cut anywhere
+    raw = b"".join(events)
+    chunks = []
+    i = 0
+    while i < len(raw):
+        size = rng.randint(100, 1200)
+        chunks.append(raw[i : i + size])
+        i += size
+    return chunks
+
+
+def legacy_iter_lines(chunks: list[bytes]):
+    """
+    What requests' iter_lines(decode_unicode=True) does.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = None
+    for chunk in chunks:
+        data = decoder.decode(chunk)
+        if pending is not None:
+            data = pending + data
+        lines = data.splitlines()
+        if lines and data and lines[-1] and data[-1] == lines[-1][-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+@contextmanager
+def legacy_live_message(clock: SimulatedClock):
+    """
+    The previous renderer, with Live's 30 FPS auto refresh driven by the
+    simulated clock.
+    """
+    stream_txt = Text(style="blue")
+    console = output.console
+    prev_width = console.width
+    next_frame = 0.0
+
+    with Live(
+        stream_txt,
+        console=console,
+        auto_refresh=False,
+        vertical_overflow="visible",
+    ) as live:
+        console.width = 50
+
+        def print_chunk(delta: str) -> None:
+            nonlocal next_frame
+            if "\n\n" in delta:
+                console.width = 72
+            stream_txt.append(delta)
+            while clock.now >= next_frame:
+                next_frame += 1 / 30
+                live.refresh()
+
+        yield print_chunk
+    console.width = prev_width
+
+
+def replay_legacy(chunks: list[bytes], clock: SimulatedClock, rate: float):
+    with legacy_live_message(clock) as print_chunk:
+        for line in legacy_iter_lines(chunks):
+            delta = llm_providers.parse_sse_line(line)
+            if delta is None:
+                break
+            if delta:
+                clock.now += 1 / rate
+                print_chunk(delta)
+
+
+def replay(chunks: list[bytes], clock: SimulatedClock, rate: float):
+    with output.live_message() as print_chunk:
+        for delta in llm_providers.iter_deltas(chunks):
+            clock.now += 1 / rate
+            print_chunk(delta)
+
+
+def cpu_per_token(func, chunks: list[bytes], rate: float) -> float:
+    output.console = Console(file=io.StringIO(), force_terminal=True, width=100)
+    clock = SimulatedClock()
+    real_monotonic = time.monotonic
+    time.monotonic = clock
+    try:
+        start = time.process_time()
+        func(chunks, clock, rate)
+        elapsed = time.process_time() - start
+    finally:
+        time.monotonic = real_monotonic
+    return elapsed / count_tokens(chunks)
+
+
+def count_tokens(chunks: list[bytes]) -> int:
+    return sum(1 for _ in llm_providers.iter_deltas(chunks))
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    rate = 50.0
+    if "--rate" in args:
+        i = args.index("--rate")
+        rate = float(args[i + 1])
+        del args[i : i + 2]
+    streams = {}
+    for path in args:
+        raw = Path(path).read_bytes()
+        streams[path] = [raw[i : i + 1024] for i in range(0, len(raw), 1024)]
+    if not streams:
+        streams = {f"{n} tokens": record_stream(n) for n in SIZES}
+
+    print(f"{rate:g} tokens/s, CPU time per token")
+    print(f"{'stream':<14} {'legacy':>10} {'current':>10}")
+    for name, chunks in streams.items():
+        legacy = "-"
+        if count_tokens(chunks) <= LEGACY_MAX_TOKENS:
+            t = cpu_per_token(replay_legacy, chunks, rate)
+            legacy = f"{t * 1e6:.1f}us"
+        current = cpu_per_token(replay, chunks, rate)
+        print(f"{name:<14} {legacy:>10} {current * 1e6:>8.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure how long reading the diff takes on a large working tree, with git
+scanning the whole tree versus only the paths the change tracker saw change.
+
+Usage:
+    python benchmarks/bench_tracker.py [n_files]
+
+A throwaway repository of n_files files (default 50000) is created, a few of
+them are edited, and the diff is read several times either way. The tracker
+only works on Linux.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from git_repo import make_repo
+
+from commizard import config, git_utils, tracker
+
+RUNS = 5
+FILES_PER_DIR = 100
+
+
+def best_time(func) -> float:
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        print(f"creating {n_files} files...")
+        make_repo(
+            repo,
+            {
+                f"dir{i // FILES_PER_DIR}/file{i}.py": f"value = {i}\n"
+                for i in range(n_files)
+            },
+        )
+        os.chdir(repo)
+        for i in (0, n_files // 2, n_files - 1):
+            (repo / f"dir{i // FILES_PER_DIR}" / f"file{i}.py").write_text(
+                "value = None\n"
+            )
+
+        def full() -> str:
+            return git_utils.stream_clean_diff()[0]
+
+        def tracked() -> str:
+            scope = tracker.narrow_scope(git_utils.DiffScope())
+            if scope is None:
+                return ""
+            return git_utils.stream_clean_diff(scope=scope)[0]
+
+        start = time.perf_counter()
+        if tracker.get_tracker() is None:
+            sys.exit("the change tracker isn't available here")
+        setup = time.perf_counter() - start
+        if full() != tracked():
+            sys.exit("the diffs differ")
+
+        print(f"tracker setup (once, in the background): {setup * 1000:.0f}ms")
+        print(f"full scan:    {best_time(full) * 1000:7.1f}ms")
+        print(f"tracked diff: {best_time(tracked) * 1000:7.1f}ms")
+        tracker.stop()
+
+
+if __name__ == "__main__":
+    config.TRACK_CHANGES = True
+    main()
@@ -0,0 +1,145 @@
+"""
+Measure the time to the first token of repeated `gen` calls, as the changes
+they describe are edited.
+
+Usage:
+    python benchmarks/bench_ttft.py [diff_kb] [ms_per_kb]
+    python benchmarks/bench_ttft.py URL MODEL
+
+By default the server is a stub that keeps the KV cache of its last prompt,
+like Ollama and llama.cpp, and only processes the rest of a prompt, at a
+fixed cost per kB. It's compared with the same stub processing every prompt
+from scratch. Given a URL and a model, a real server is used instead.
+
+The response cache is disabled, so every gen reaches the server. Its prompt
+starts with the fixed system message, then the diff with its files in the
+order of their paths, so it only changes from the first edited file on.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from git_repo import make_repo
+from stub_server import PrefixCache, StubServer
+
+from commizard import commands, config, llm_providers
+
+FILES = 10
+TOKENS = ["Update ", "the ", "handlers\n\n", "Rename ", "the ", "options."]
+
+
+def write_file(repo: Path, i: int, version: int, lines: int) -> None:
+    (repo / f"module_{i:02}.py").write_text(
+        "".join(
+            f"value_{n} = compute({n}, version={version if n % 2 else 0})\n"
+            for n in range(lines)
+        )
+    )
+
+
+def build_prompt(diff: str) -> str:
+    stat, prompt = commands.build_prompt(diff, map_reduce=False, quiet=True)
+    if stat != 0:
+        sys.exit(prompt)
+    return prompt
+
+
+def time_to_first_token(prompt: str) -> float:
+    first: list[float] = []
+
+    def print_chunk(delta: str) -> None:
+        if not first:
+            first.append(time.perf_counter())
+
+    start = time.perf_counter()
+    stat, res = llm_providers.stream_chat(prompt, print_chunk)
+    if stat != 0 or not first:
+        sys.exit(res or "no response")
+    return first[0] - start
+
+
+def run(
+    repo: Path, lines: int, prefill: PrefixCache | None, reuse: bool = True
+) -> None:
+    """
+    Run gen after each edit, printing its time to the first token, and how
+    much of the prompt the stub processed if prefill is its prefix cache.
+    Without reuse, the cache is emptied before each request.
+    """
+    # the edits between two gens, the first gen starting from a cold cache
+    steps = [
+        ("first gen", None),
+        ("unchanged", None),
+        ("edit the last file", FILES - 1),
+        ("edit the first file", 0),
+    ]
+    for i in range(FILES):
+        write_file(repo, i, -1, lines)
+    if prefill is not None:
+        prefill.last = ""
+    for version, (name, edit) in enumerate(steps, 1):
+        if edit is not None:
+            write_file(repo, edit, version, lines)
+        diff, _ = commands.read_diff(None, adaptive=False, quiet=True)
+        prompt = build_prompt(diff)
+        line = f"  {name:<20}"
+        if prefill is None:
+            line += f" {time_to_first_token(prompt) * 1000:>7.0f}ms"
+        else:
+            if not reuse:
+                prefill.last = ""
+            processed = prefill.processed
+            ttft = time_to_first_token(prompt)
+            line += f" {ttft * 1000:>7.0f}ms, "
+            line += f"{(prefill.processed - processed) / 1000:>5.1f} kB"
+            line += " prefilled"
+        print(line)
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    real = bool(args) and args[0].startswith("http")
+    diff_kb = float(args[0]) if args and not real else 20
+    ms_per_kb = float(args[1]) if len(args) > 1 and not real else 50
+    # every other line changes, which takes about 100 bytes of the diff with
+    # its removed line and the context
+    lines = int(diff_kb * 1000 / FILES / 100 * 2)
+    config.USE_CACHE = False
+    config.MAX_PROMPT_TOKENS = None
+    config.MAX_DIFF_BYTES = None
+    config.EXCLUDE_FILES = False
+    config.TRACK_CHANGES = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        for i in range(FILES):
+            write_file(repo, i, 0, lines)
+        make_repo(repo)
+        os.chdir(repo)
+        if real:
+            config.set_url(args[0])
+            llm_providers.selected_model = args[1]
+            print(f"{args[1]} at {args[0]}, {FILES} files changed")
+            run(repo, lines, None)
+        else:
+            prefill = PrefixCache(ms_per_kb / 1000 / 1000, "".join(TOKENS))
+            llm_providers.selected_model = "stub"
+            with StubServer(TOKENS, prefill_delay=prefill) as server:
+                config.set_url(server.url)
+                print(
+                    f"~{diff_kb:.0f} kB diff over {FILES} files, "
+                    f"{ms_per_kb:.0f}ms of prefill per kB"
+                )
+                for reuse in (False, True):
+                    print("prefix cache:" if reuse else "no prefix reuse:")
+                    run(repo, lines, prefill, reuse)
+        llm_providers.close_session()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Helpers to set up the throwaway Git repositories the benchmarks run in.
+"""
+
+from __future__ import annotations
+
+import subprocess
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def git(path: Path, *args: str) -> None:
+    subprocess.run(  # noqa: S603
+        ["git", "-C", str(path), *args], check=True, capture_output=True
+    )
+
+
+def make_repo(path: Path, files: dict[str, str] | None = None) -> None:
+    """
+    Create a repository at path, with a first commit of the given files and
+    of whatever is already in path.
+
+    Args:
+        path: the directory of the repository, created if it doesn't exist
+        files: the text of the files to commit, by their relative paths
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    git(path, "init", "-q")
+    git(path, "config", "user.email", "bench@example.com")
+    git(path, "config", "user.name", "bench")
+    for name, text in (files or {}).items():
+        (path / name).parent.mkdir(parents=True, exist_ok=True)
+        (path / name).write_text(text)
+    git(path, "add", "-A")
+    git(path, "commit", "-q", "-m", "initial")
@@ -0,0 +1,154 @@
+"""
+A minimal local stand-in for an Ollama server, used by the benchmarks.
+
+It answers /api/version, /api/tags, /api/generate and /v1/chat/completions
+(both streamed and not) over HTTP/1.1 keep-alive connections.
+"""
+
+from __future__ import annotations
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StubServer
+
+    def setup(self):
+        super().setup()
+        # answer right away, like a real server, instead of waiting on Nagle
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def send_json(self, obj) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self.send_json({"version": "0.0.0-stub"})
+        elif self.path == "/api/tags":
+            self.send_json(
+                {
+                    "models": [
+                        {"name": "stub", "details": {"parameter_size": "0"}}
+                    ]
+                }
+            )
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append(payload)
+        if self.path == "/api/generate":
+            self.send_json({"done_reason": "load"})
+            return
+        if self.path != "/v1/chat/completions":
+            self.send_error(404)
+            return
+
+        time.sleep(self.server.prefill_delay(payload))
+        if not payload.get("stream"):
+            content = "".join(self.server.tokens)
+            self.send_json({"choices": [{"message": {"content": content}}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in self.server.tokens:
+            chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Serve in a background thread while used as a context manager.
+
+    Args:
+        tokens: the tokens every generation answers with
+        token_delay: seconds to wait between streamed tokens
+        prefill_delay: a function of the request payload returning the seconds
+            to wait before answering, to emulate prompt processing
+        port: the port to listen on, a free one by default
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, tokens=None, token_delay=0.0, prefill_delay=None, port=0
+    ):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.tokens = tokens or ["Fix", " the", " parser", "\n\n", "Body."]
+        self.token_delay = token_delay
+        self.prefill_delay = prefill_delay or (lambda payload: 0.0)
+        self.requests: list[dict] = []
+
+    def handle_error(self, request, client_address):
+        # clients hang up on cancelled generations, that's expected
+        pass
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class PrefixCache:
+    """
+    A prefill_delay emulating a server that keeps the KV cache of its last
+    prompt, like Ollama: only the characters of a prompt past the prefix it
+    shares with the last prompt and response are processed, at a fixed cost
+    per character.
+
+    Args:
+        seconds_per_char: the prefill time of a character
+        response: the response every generation answers with
+    """
+
+    def __init__(self, seconds_per_char: float, response: str):
+        self.seconds_per_char = seconds_per_char
+        self.response = response
+        self.last = ""
+        self.processed = 0
+
+    def __call__(self, payload: dict) -> float:
+        text = "".join(
+            f"<{m['role']}>{m['content']}" for m in payload["messages"]
+        )
+        shared = 0
+        for a, b in zip(text, self.last):
+            if a != b:
+                break
+            shared += 1
+        self.last = f"{text}<assistant>{self.response}"
+        self.processed += len(text) - shared
+        return (len(text) - shared) * self.seconds_per_char
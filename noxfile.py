@@ -66,6 +66,22 @@ def e2e_test(session):
     session.run("pytest", "-q", "./tests/e2e", external=True)
 
 
+@nox.session(reuse_venv=True, venv_backend=venv_list)
+def bench(session):
+    """
+    run the benchmarks. Only runs the ones whose name contains one of the
+    arguments, if any are sent (e.g. nox -s bench -- clean_diff)
+    """
+    import pathlib
+
+    for script in sorted(pathlib.Path("benchmarks").glob("bench_*.py")):
+        if session.posargs and not any(
+            a in script.stem for a in session.posargs
+        ):
+            continue
+        session.run("python", str(script), external=True)
+
+
 @nox.session(reuse_venv=True, venv_backend=venv_list)
 def check(session):
     """
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import batch, config, git_utils, llm_providers
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from typing import TextIO
+
+help_msg = """
+Generate commit messages for a range of past commits, without the interactive
+prompt
+
+Usage:
+  commizard backfill -m MODEL [-j JOBS] [--checkpoint FILE] RANGE
+
+Options:
+  -m, --model MODEL     The model to generate with
+  -j, --jobs JOBS       Number of messages generated at once (default: 2)
+  --checkpoint FILE     Also append the records to FILE, and skip the commits
+                        it already holds a message for. Run the same command
+                        again to resume an interrupted backfill.
+
+RANGE is any revision range git log understands (e.g. main~500..main). A JSON
+object is printed per commit as soon as its message is ready:
+  {"sha": SHA, "status": "ok", "message": MESSAGE}
+  {"sha": SHA, "status": "empty"}           (no diff, e.g. a merge)
+  {"sha": SHA, "status": "error", "error": MESSAGE}
+"""
+
+# starts the line of each commit's hash in the output of git log. No line of a
+# diff starts with a control character, so it can't be mixed up with one.
+COMMIT_MARKER = "\x01"
+
+# the records that don't need to be generated again
+DONE_STATUSES = ("ok", "empty")
+
+
+def iter_commits(
+    rev_range: str, max_bytes: int | None = None
+) -> Iterator[tuple[str, str, bool]]:
+    """
+    Stream the commits of a range along with their diffs, from a single git
+    log process. The diffs are sanitized as they're read.
+
+    Args:
+        rev_range: the revision range, e.g. "main~500..main"
+        max_bytes: the byte budget of each sanitized diff. Diffs are truncated
+            to fit it, if it's given.
+
+    Returns:
+        an iterator of tuples of each commit's hash, diff, and whether the
+        diff was truncated, newest first.
+
+    Raises:
+        RuntimeError: if git log fails, e.g. because the range is invalid
+    """
+    args = [
+        "--no-pager",
+        "log",
+        "-p",
+        "--no-color",
+        "--no-ext-diff",
+        f"--format={COMMIT_MARKER}%H",
+        rev_range,
+        "--",
+    ]
+    sha = None
+    lines: list[str] = []
+    size = 0
+    truncated = False
+
+    def record() -> tuple[str, str, bool]:
+        return sha or "", "\n".join(lines).strip(), truncated
+
+    with git_utils.GitStream(args) as stream:
+        for line in stream:
+            if line.startswith(COMMIT_MARKER):
+                if sha is not None:
+                    yield record()
+                sha = line[len(COMMIT_MARKER) :]
+                lines = []
+                size = 0
+                truncated = False
+                continue
+            if truncated or line.startswith(git_utils.DIFF_NOISE_PREFIXES):
+                continue
+            size += len(line) + 1
+            if max_bytes is not None and size > max_bytes:
+                truncated = True
+                continue
+            lines.append(line)
+        if sha is not None:
+            yield record()
+
+    if stream.returncode != 0:
+        raise RuntimeError(f"git log {rev_range} failed")
+
+
+def read_checkpoint(path: str) -> set[str]:
+    """
+    Get the commits a checkpoint file already holds a message for. Lines that
+    can't be parsed, like one cut short by an interruption, are skipped.
+
+    Returns:
+        the commits' hashes. It's empty if the file doesn't exist yet.
+    """
+    try:
+        text = Path(path).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return set()
+    done = set()
+    for line in text.splitlines():
+        try:
+            record = json.loads(line)
+        except json.decoder.JSONDecodeError:
+            continue
+        if not isinstance(record, dict):
+            continue
+        sha = record.get("sha")
+        if isinstance(sha, str) and record.get("status") in DONE_STATUSES:
+            done.add(sha)
+    return done
+
+
+def describe_commit(sha: str, diff: str, truncated: bool) -> dict:
+    """
+    Generate the message of a commit from its sanitized diff.
+
+    Returns:
+        the commit's JSON record.
+    """
+    if diff == "":
+        return {"sha": sha, "status": "empty"}
+    warnings = []
+    if truncated:
+        warnings.append(
+            f"The diff was truncated to {config.MAX_DIFF_BYTES} bytes."
+        )
+    return {"sha": sha, **batch.describe(diff, warnings)}
+
+
+def checkpoint_writer(checkpoint: TextIO | None):
+    """
+    Get the function writing a record to stdout and, if there's one, to the
+    checkpoint file. Records are flushed right away, so an interruption loses
+    at most the one being written.
+    """
+
+    def write(record: dict) -> None:
+        batch.write_jsonl(record)
+        if checkpoint is not None:
+            checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+
+    return write
+
+
+def main(argv: list[str]) -> int:
+    """
+    The entry point of "commizard backfill".
+
+    Returns:
+        the exit code: 0 if all messages were generated, 1 if some failed and
+        2 if the arguments are invalid.
+    """
+    if "-h" in argv or "--help" in argv:
+        print(help_msg.strip())
+        return 0
+    try:
+        opts, args = batch.parse_args(argv, {"--checkpoint": "checkpoint"})
+        if len(args) != 1 or args[0].startswith("-"):
+            raise ValueError("Expected a single revision range")
+        done: set[str] = set()
+        if opts["checkpoint"] is not None:
+            done = read_checkpoint(opts["checkpoint"])
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        print(
+            "try 'commizard backfill -h' for more information.",
+            file=sys.stderr,
+        )
+        return 2
+    if not batch.prepare(opts):
+        return 1
+
+    tasks = (
+        functools.partial(describe_commit, sha, diff, truncated)
+        for sha, diff, truncated in iter_commits(args[0], config.MAX_DIFF_BYTES)
+        if sha not in done
+    )
+    path = opts["checkpoint"]
+    try:
+        with (
+            contextlib.nullcontext()
+            if path is None
+            else Path(path).open("a", encoding="utf-8")
+        ) as checkpoint:
+            write = checkpoint_writer(checkpoint)
+            errors = batch.run(tasks, opts["jobs"], write)
+    except (RuntimeError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        llm_providers.close_session()
+    return 1 if errors else 0
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import concurrent.futures
+import functools
+import json
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import compaction, config, exclusion, git_utils, llm_providers
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+help_msg = """
+Generate commit messages for many repositories, without the interactive prompt
+
+Usage:
+  commizard batch -m MODEL [-j JOBS] [--repos-from FILE] [REPO ...]
+
+Options:
+  -m, --model MODEL     The model to generate with
+  -j, --jobs JOBS       Number of messages generated at once (default: 2)
+  --repos-from FILE     Read the repositories' paths from FILE, one per line
+                        ("-" reads them from stdin)
+
+A JSON object is printed per repository as soon as its message is ready:
+  {"repo": PATH, "status": "ok", "message": MESSAGE}
+  {"repo": PATH, "status": "clean"}           (no changes to describe)
+  {"repo": PATH, "status": "error", "error": MESSAGE}
+
+Generating several messages at once only helps if the server runs them in
+parallel too (e.g. OLLAMA_NUM_PARALLEL for Ollama).
+"""
+
+
+def read_repos(path: str) -> list[str]:
+    """
+    Read the paths of repositories from a file, one per line. Blank lines and
+    lines starting with "#" are skipped.
+
+    Args:
+        path: the file's path, or "-" for stdin
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(path).read_text(encoding="utf-8").splitlines()
+    return [
+        line.strip()
+        for line in lines
+        if line.strip() and not line.lstrip().startswith("#")
+    ]
+
+
+def build_prompt(diff: str) -> tuple[str, list[str]]:
+    """
+    Build the generation prompt, compacting the diff to fit
+    config.MAX_PROMPT_TOKENS if needed.
+
+    Returns:
+        a tuple of the prompt and the warnings about the parts of the diff
+        that were left out.
+    """
+    if config.MAX_PROMPT_TOKENS is None:
+        return llm_providers.generation_prompt + diff, []
+    budget = config.MAX_PROMPT_TOKENS - compaction.estimate_tokens(
+        llm_providers.system_prompt + llm_providers.generation_prompt
+    )
+    diff, kept, total = compaction.compact_diff(diff, budget)
+    warnings = []
+    if kept < total:
+        warnings.append(
+            f"The diff was compacted to fit {config.MAX_PROMPT_TOKENS} "
+            f"tokens. {kept} of its {total} hunks were used."
+        )
+    return llm_providers.generation_prompt + diff, warnings
+
+
+def describe(diff: str, warnings: list[str] | None = None) -> dict:
+    """
+    Generate the message of a sanitized diff.
+
+    Returns:
+        the record's status fields: the message, or the error.
+    """
+    prompt, compacted = build_prompt(diff)
+    warnings = (warnings or []) + compacted
+    stat, res = llm_providers.generate(prompt)
+    if stat != 0:
+        return {"status": "error", "error": res}
+    record: dict = {"status": "ok", "message": res.strip()}
+    if warnings:
+        record["warnings"] = warnings
+    return record
+
+
+def describe_repo(repo: str) -> dict:
+    """
+    Generate the message for the changes in a repository's working tree.
+
+    Returns:
+        the repository's JSON record.
+    """
+    if not git_utils.is_inside_working_tree(repo):
+        return {"repo": repo, "status": "error", "error": "not a work tree"}
+    excluded: list[tuple[int | None, int | None, str]] = []
+    if config.EXCLUDE_FILES:
+        diff, truncated, excluded = exclusion.read_diff(
+            None, config.MAX_DIFF_BYTES, repo
+        )
+    else:
+        diff, truncated = git_utils.stream_clean_diff(
+            config.MAX_DIFF_BYTES, repo, git_utils.DiffScope()
+        )
+    warnings = []
+    if excluded:
+        summary = exclusion.summarize(excluded)
+        diff = f"{diff}\n\n{summary}" if diff else summary
+        warnings.append(exclusion.report(excluded))
+    if diff == "":
+        return {"repo": repo, "status": "clean"}
+    if truncated:
+        warnings.append(
+            f"The diff was truncated to {config.MAX_DIFF_BYTES} bytes."
+        )
+    return {"repo": repo, **describe(diff, warnings)}
+
+
+def run(
+    tasks: Iterable[Callable[[], dict]],
+    jobs: int,
+    write: Callable[[dict], None],
+) -> int:
+    """
+    Run the tasks on a pool of jobs threads, writing their records as they
+    finish. At most twice as many tasks as there are threads are queued at
+    once, so tasks can be produced lazily.
+
+    Returns:
+        the number of records whose status is "error".
+    """
+    errors = 0
+    pending: set[concurrent.futures.Future] = set()
+
+    def drain(return_when: str) -> None:
+        nonlocal errors, pending
+        done, pending = concurrent.futures.wait(
+            pending, return_when=return_when
+        )
+        for future in done:
+            record = future.result()
+            errors += record.get("status") == "error"
+            write(record)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    try:
+        for task in tasks:
+            if len(pending) >= 2 * jobs:
+                drain(concurrent.futures.FIRST_COMPLETED)
+            pending.add(pool.submit(task))
+        drain(concurrent.futures.ALL_COMPLETED)
+    finally:
+        # don't wait for the remaining tasks after an error or Ctrl-C
+        pool.shutdown(wait=False, cancel_futures=True)
+    return errors
+
+
+def write_jsonl(record: dict) -> None:
+    print(json.dumps(record, ensure_ascii=False), flush=True)
+
+
+def parse_args(
+    argv: list[str], extra: dict[str, str] | None = None
+) -> tuple[dict, list[str]]:
+    """
+    Parse the options and the positional arguments of a batch subcommand.
+
+    Args:
+        argv: the arguments following the subcommand
+        extra: the subcommand's own options taking a value, mapped to their
+            keys in the result. They're None if not given.
+
+    Returns:
+        a tuple of the options and the positional arguments. The options have
+        the keys "model" and "jobs", and those of extra.
+
+    Raises:
+        ValueError: if the arguments are invalid, with the error message
+    """
+    extra = extra or {}
+    opts: dict = {"model": None, "jobs": config.MAX_CONCURRENCY}
+    opts.update(dict.fromkeys(extra.values()))
+    names = {
+        "-m": "model",
+        "--model": "model",
+        "-j": "jobs",
+        "--jobs": "jobs",
+        **extra,
+    }
+    args = []
+    it = iter(argv)
+    for arg in it:
+        if arg not in names:
+            if arg.startswith("-") and arg != "-":
+                raise ValueError(f"Unknown option: {arg}")
+            args.append(arg)
+            continue
+        value = next(it, None)
+        if value is None:
+            raise ValueError(f"{arg} requires a value")
+        opts[names[arg]] = value
+    try:
+        opts["jobs"] = int(opts["jobs"])
+    except ValueError:
+        raise ValueError(f"Invalid number of jobs: {opts['jobs']}") from None
+    if opts["jobs"] < 1:
+        raise ValueError("The number of jobs must be at least 1")
+    if opts["model"] is None:
+        raise ValueError("No model given. Use -m MODEL to choose one")
+    return opts, args
+
+
+def prepare(opts: dict) -> bool:
+    """
+    Select the model and size the connection pool for the batch.
+
+    Returns:
+        whether the model could be loaded. The error is printed otherwise.
+    """
+    # keep a connection alive per job
+    config.HTTP_POOL_SIZE = max(config.HTTP_POOL_SIZE, opts["jobs"])
+    stat, res = llm_providers.select_model(opts["model"])
+    if stat != 0:
+        print(f"Error: {res}", file=sys.stderr)
+        return False
+    return True
+
+
+def main(argv: list[str]) -> int:
+    """
+    The entry point of "commizard batch".
+
+    Returns:
+        the exit code: 0 if all messages were generated, 1 if some failed and
+        2 if the arguments are invalid.
+    """
+    if "-h" in argv or "--help" in argv:
+        print(help_msg.strip())
+        return 0
+    try:
+        opts, repos = parse_args(argv, {"--repos-from": "repos_from"})
+        if opts["repos_from"] is not None:
+            repos += read_repos(opts["repos_from"])
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        print("try 'commizard batch -h' for more information.", file=sys.stderr)
+        return 2
+    if not repos:
+        print("Error: no repositories given", file=sys.stderr)
+        return 2
+    if not prepare(opts):
+        return 1
+
+    tasks = (functools.partial(describe_repo, repo) for repo in repos)
+    try:
+        errors = run(tasks, opts["jobs"], write_jsonl)
+    finally:
+        llm_providers.close_session()
+    return 1 if errors else 0
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from contextlib import suppress
+from pathlib import Path
+
+from . import config
+
+# hits and misses in this session
+hits: int = 0
+misses: int = 0
+
+
+def cache_dir() -> Path:
+    """
+    The directory of the response cache: $XDG_CACHE_HOME/commizard/responses,
+    where XDG_CACHE_HOME defaults to ~/.cache.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "commizard" / "responses"
+
+
+def make_key(model: str, prompt: str, system: str = "") -> str:
+    """
+    Hash the model's name, the system message and the prompt (the template
+    and the diff) into a cache key.
+    """
+    h = hashlib.sha256()
+    for part in (model, system, prompt):
+        data = part.encode("utf-8", errors="ignore")
+        # length-prefixed, so ("ab", "c") and ("a", "bc") don't collide
+        h.update(len(data).to_bytes(8, "big") + data)
+    return h.hexdigest()
+
+
+def entries() -> list[Path]:
+    try:
+        return [p for p in cache_dir().iterdir() if p.suffix == ".txt"]
+    except OSError:
+        return []
+
+
+def lookup(model: str | None, prompt: str, system: str = "") -> str | None:
+    """
+    Get the cached response to prompt, sent after the system message, if
+    caching is enabled.
+
+    Returns:
+        the response, or None on a miss.
+    """
+    global hits, misses
+    if not config.USE_CACHE or model is None:
+        return None
+    path = cache_dir() / f"{make_key(model, prompt, system)}.txt"
+    try:
+        response = path.read_text(encoding="utf-8")
+        # mark it as recently used, so it's evicted last
+        os.utime(path)
+    except OSError:
+        misses += 1
+        return None
+    hits += 1
+    return response
+
+
+def contains(model: str | None, prompt: str, system: str = "") -> bool:
+    """
+    Check if there's a cached response to prompt, without counting it as a
+    hit or a miss.
+    """
+    if not config.USE_CACHE or model is None:
+        return False
+    return (cache_dir() / f"{make_key(model, prompt, system)}.txt").is_file()
+
+
+def store(
+    model: str | None, prompt: str, response: str, system: str = ""
+) -> None:
+    """
+    Cache the response to prompt, evicting the least recently used responses
+    once the cache grows past config.CACHE_MAX_BYTES. Errors are ignored, as
+    the cache is only an optimization.
+    """
+    if not config.USE_CACHE or model is None or response == "":
+        return
+    directory = cache_dir()
+    path = directory / f"{make_key(model, prompt, system)}.txt"
+    tmp = path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(response, encoding="utf-8")
+        # atomic, so concurrent sessions never read half a response
+        tmp.replace(path)
+    except OSError:
+        with suppress(OSError):
+            tmp.unlink()
+        return
+    evict(config.CACHE_MAX_BYTES)
+
+
+def evict(max_bytes: int) -> int:
+    """
+    Delete the least recently used responses until the cache is at most
+    max_bytes large.
+
+    Returns:
+        the number of responses deleted.
+    """
+    sized = []
+    for p in entries():
+        with suppress(OSError):
+            st = p.stat()
+            sized.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in sized)
+    removed = 0
+    for _, size, p in sorted(sized):
+        if total <= max_bytes:
+            break
+        with suppress(OSError):
+            p.unlink()
+            removed += 1
+        total -= size
+    return removed
+
+
+def stats() -> tuple[int, int]:
+    """
+    Returns:
+        a tuple of the number of cached responses and their total size in
+        bytes.
+    """
+    sizes = []
+    for p in entries():
+        with suppress(OSError):
+            sizes.append(p.stat().st_size)
+    return len(sizes), sum(sizes)
+
+
+def clear() -> int:
+    """
+    Delete all cached responses.
+
+    Returns:
+        the number of responses deleted.
+    """
+    return evict(-1)
@@ -1,17 +1,18 @@
 from __future__ import annotations
 
-import concurrent.futures
 import sys
 
 from . import __version__ as version
-from . import config, output, start
+from . import config
 
 help_msg = """
 Commit writing wizard
 
 Usage:
   commizard [-v | --version] [-h | --help] [--no-color] [--no-banner]
-            [--no-stream]
+            [--no-stream] [--no-keep-alive] [--no-cache]
+  commizard batch -m MODEL [-j JOBS] [--repos-from FILE] [REPO ...]
+  commizard backfill -m MODEL [-j JOBS] [--checkpoint FILE] RANGE
 
 Options:
   -h, --help       Show help for commizard
@@ -19,6 +20,14 @@ Options:
   --no-color       Don't colorize output
   --no-banner      Disable the ASCII welcome banner
   --no-stream      Disable streaming and return the full response at once
+  --no-keep-alive  Open a new connection to the LLM server for every request
+  --no-cache       Always generate, instead of reusing cached messages
+
+Commands:
+  batch            Generate messages for many repositories as JSON Lines
+                   (see 'commizard batch -h')
+  backfill         Generate messages for a range of past commits as JSON Lines
+                   (see 'commizard backfill -h')
 """
 
 
@@ -33,6 +42,8 @@ def handle_args():
         "--no-banner",
         "--no-color",
         "--no-stream",
+        "--no-keep-alive",
+        "--no-cache",
     ]
     for arg in sys.argv[1:]:
         if arg not in supported_args:
@@ -51,6 +62,10 @@ def handle_args():
             config.USE_COLOR = False
         elif arg == "--no-stream":
             config.STREAM = False
+        elif arg == "--no-keep-alive":
+            config.HTTP_KEEP_ALIVE = False
+        elif arg == "--no-cache":
+            config.USE_CACHE = False
 
 
 def main() -> int:
@@ -61,33 +76,54 @@ def main() -> int:
     Returns:
         int: Exit code (0 for success, non-zero for errors)
     """
+    if sys.argv[1:2] == ["batch"]:
+        from . import batch
+
+        return batch.main(sys.argv[2:])
+    if sys.argv[1:2] == ["backfill"]:
+        from . import backfill
+
+        return backfill.main(sys.argv[2:])
+
     handle_args()
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.submit(output.init_console, config.USE_COLOR)
-        fut_ai = executor.submit(start.local_ai_available)
-        fut_git = executor.submit(start.check_git_installed)
+    # imported only now, so "--version" and "--help" don't pay for rich and
+    # the other modules the session needs
+    from . import llm_providers, output, start
 
-        git_ok = fut_git.result()
+    output.init_console(config.USE_COLOR)
+    # The checks run in the background while the commands load. Only git's
+    # result is waited for, as it's quick and the session can't work without
+    # it. The local AI server's check can take up to its timeout, so its
+    # warning is only shown once it's known, before one of the prompts.
+    git_check = start.BackgroundCheck(start.check_git)
+    ai_check: start.BackgroundCheck | None = start.BackgroundCheck(
+        start.local_ai_available
+    )
 
-    if not git_ok:
-        output.print_error("git not installed")
-        return 1
-    if not start.is_inside_working_tree():
-        output.print_error("not inside work tree")
+    from . import commands
+
+    git_error = git_check.result()
+    if git_error is not None:
+        output.print_error(git_error)
         return 1
 
-    if config.SHOW_BANNER:
-        start.print_welcome(config.USE_COLOR)
+    if config.TRACK_CHANGES:
+        from . import tracker
 
-    local_ai_ok = fut_ai.result()
-    if not local_ai_ok:
-        output.print_warning("local AI not available")
+        # start watching the working tree while the user types, so even the
+        # first diff only looks at the changed files
+        start.BackgroundCheck(tracker.get_tracker)
 
-    from . import commands
+    if config.SHOW_BANNER:
+        start.print_welcome(config.USE_COLOR)
 
     try:
         while True:
+            if ai_check is not None and ai_check.done():
+                if not ai_check.result():
+                    output.print_warning("local AI not available")
+                ai_check = None
             user_input = input("CommiZard> ").strip()
             if user_input in ("exit", "quit"):
                 print("Goodbye!")
@@ -97,6 +133,12 @@ def main() -> int:
             commands.parser(user_input)
     except (EOFError, KeyboardInterrupt):
         print("\nGoodbye!")
+    finally:
+        if commands.watcher is not None:
+            commands.watcher.stop()
+        if config.TRACK_CHANGES:
+            tracker.stop()
+        llm_providers.close_session()
 
     return 0
 
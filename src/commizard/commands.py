@@ -2,11 +2,24 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from . import config, git_utils, llm_providers, output
+from . import cache, config, git_utils, llm_providers, output
 
 if TYPE_CHECKING:
+    import concurrent.futures
     from collections.abc import Callable
 
+    from .speculation import Watcher
+
+# the scope of the diff the last message was generated from, so that
+# committing it commits the same changes
+gen_scope: git_utils.DiffScope | None = None
+# speculatively generates the messages of the working tree's changes, while
+# "watch on" is in effect
+watcher: Watcher | None = None
+# the warm-up of the model started while collecting the diff, only waited for
+# if the message isn't cached
+warm_up: concurrent.futures.Future | None = None
+
 
 def handle_commit_req(opts: list[str]) -> None:
     """
@@ -15,7 +28,7 @@ def handle_commit_req(opts: list[str]) -> None:
     if llm_providers.gen_message is None or llm_providers.gen_message == "":
         output.print_warning("No commit message detected. Skipping.")
         return
-    out, msg = git_utils.commit(llm_providers.gen_message)
+    out, msg = git_utils.commit(llm_providers.gen_message, gen_scope)
     if out == 0:
         output.print_success(msg)
     else:
@@ -32,8 +45,19 @@ def print_help(opts: list[str]) -> None:
             "Selects the model to generate commit messages with.\n"
         ),
         "gen": (
-            "Usage: gen\n\n"
-            "Generates a commit message from the current Git diff.\n"
+            "Usage: gen [--staged] [--map-reduce | --adaptive] [-n N] "
+            "[-- <path>...]\n\n"
+            "Generates a commit message from the current Git diff.\n\n"
+            "Options:\n"
+            "  --staged      Only describe the staged changes.\n"
+            "  --map-reduce  Summarize the parts of a diff too large for the\n"
+            "                prompt, instead of leaving some of it out.\n"
+            "  --adaptive    Only read the full changes of the files that fit\n"
+            "                the prompt, and list the others' line counts.\n"
+            "  -n N          Generate N candidate messages at once, and pick\n"
+            "                the one to keep.\n"
+            "  -- <path>...  Only describe the changes to these paths.\n\n"
+            "The commit command then commits the same changes.\n"
         ),
         "cp": (
             "Usage: cp\n\nCopies the last generated message to the clipboard.\n"
@@ -42,6 +66,25 @@ def print_help(opts: list[str]) -> None:
             "Usage: commit\n\nCommits using the last generated message.\n"
         ),
         "list": "Usage: list\n\nLists all installed models.\n",
+        "cache": (
+            "Usage: cache stats | cache clear\n\n"
+            "Shows statistics about the cache of generated messages, or "
+            "clears it.\n"
+        ),
+        "regen": (
+            "Usage: regen [<feedback>...]\n\n"
+            "Rewrites the last generated message following the feedback\n"
+            "(e.g. regen shorter), or writes a different one without it.\n"
+            "The conversation with the model goes on, so the diff isn't\n"
+            "processed again.\n"
+        ),
+        "watch": (
+            "Usage: watch on | watch off\n\n"
+            "Watches the working tree's changes, and generates their message\n"
+            "in the background once they've been still for a moment, so gen\n"
+            "finds it in the cache. Only the message of a plain gen is\n"
+            "generated ahead. Uses the selected model.\n"
+        ),
         "cls": "Usage: cls | clear\n\nClears the terminal screen.\n",
         "clear": "Usage: cls | clear\n\nClears the terminal screen.\n",
         "exit": "Usage: exit | quit\n\nExits the program.\n",
@@ -53,8 +96,11 @@ def print_help(opts: list[str]) -> None:
             "  start             Select a model to generate for you.\n"
             "  list              List all available models.\n"
             "  gen               Generate a new commit message.\n"
+            "  regen             Rewrite the last message, e.g. regen shorter.\n"
             "  cp                Copy the last generated message to the clipboard.\n"
             "  commit            Commit the last generated message.\n"
+            "  cache             Show stats about or clear the message cache.\n"
+            "  watch             Generate messages ahead, as the changes are made.\n"
             "  cls  | clear      Clear the terminal screen.\n"
             "  exit | quit       Exit the program.\n"
             "\nTo view help for a command, type help, followed by a space, and the\n"
@@ -134,41 +180,441 @@ def print_available_models(opts: list[str]) -> None:
     output.print_table(["Model name", "Parameter size"], models)
 
 
+def adaptive_budget() -> int | None:
+    """
+    The byte budget of the full patches in an adaptive diff: what's left of
+    config.MAX_PROMPT_TOKENS after the generation prompt, within
+    config.MAX_DIFF_BYTES.
+    """
+    if config.MAX_PROMPT_TOKENS is None:
+        return config.MAX_DIFF_BYTES
+    from . import compaction
+
+    tokens = config.MAX_PROMPT_TOKENS - compaction.estimate_tokens(
+        llm_providers.system_prompt + llm_providers.generation_prompt
+    )
+    budget = max(0, tokens * compaction.CHARS_PER_TOKEN)
+    if config.MAX_DIFF_BYTES is None:
+        return budget
+    return min(budget, config.MAX_DIFF_BYTES)
+
+
+def read_diff(
+    scope: git_utils.DiffScope | None, adaptive: bool, quiet: bool = False
+) -> tuple[str, bool]:
+    """
+    Read the sanitized diff, leaving the files config.EXCLUDE_FILES applies to
+    out of it (see exclusion.find_excluded). They're listed after the diff
+    instead, and a warning tells how much was left out, unless quiet is set.
+    Only the files the change tracker saw change are diffed, if it's running.
+    """
+    if config.TRACK_CHANGES:
+        from . import tracker
+
+        narrowed = tracker.narrow_scope(scope or git_utils.DiffScope())
+        if narrowed is None:
+            return "", False
+        scope = narrowed
+    from . import exclusion
+
+    excluded: list[tuple[int | None, int | None, str]] = []
+    if adaptive:
+        stats = None
+        summary = ""
+        if config.EXCLUDE_FILES:
+            scope, stats, excluded = exclusion.exclude_files(scope)
+            if excluded:
+                summary = exclusion.summarize(excluded)
+        budget = adaptive_budget()
+        if budget is not None:
+            budget = max(0, budget - len(summary))
+        diff, truncated = git_utils.adaptive_clean_diff(
+            budget, scope, stats=stats
+        )
+    elif config.EXCLUDE_FILES:
+        diff, truncated, excluded = exclusion.read_diff(
+            scope, config.MAX_DIFF_BYTES
+        )
+    else:
+        diff, truncated = git_utils.stream_clean_diff(
+            config.MAX_DIFF_BYTES, scope=scope
+        )
+    if excluded:
+        summary = exclusion.summarize(excluded)
+        diff = f"{diff}\n\n{summary}" if diff else summary
+        if not quiet:
+            output.print_warning(exclusion.report(excluded))
+    return diff, truncated
+
+
+def collect_diff(
+    scope: git_utils.DiffScope | None = None, adaptive: bool = False
+) -> tuple[str, bool]:
+    """
+    Get the sanitized diff of the changes in scope. If pipelining is enabled,
+    the selected model is warmed up concurrently, so the model's load time
+    overlaps with git's work instead of adding to it. The warm-up is left
+    running, see finish_warm_up.
+
+    Args:
+        scope: the changes to diff
+        adaptive: whether to only read the full patches of the most
+            significant files, and list the others (see
+            git_utils.adaptive_clean_diff)
+
+    Returns:
+        a tuple of the diff and whether it was truncated
+    """
+    if not config.PIPELINE or llm_providers.selected_model is None:
+        return read_diff(scope, adaptive)
+
+    import concurrent.futures
+
+    global warm_up
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(llm_providers.warm_up_model)
+    try:
+        diff, truncated = read_diff(scope, adaptive)
+    finally:
+        pool.shutdown(wait=False)
+    # nothing will be sent if the diff is empty
+    warm_up = future if diff != "" else None
+    return diff, truncated
+
+
+def finish_warm_up() -> None:
+    """
+    Wait for the warm-up collect_diff started, if any, before a request is
+    sent.
+    """
+    global warm_up
+    if warm_up is not None:
+        warm_up.result()
+        warm_up = None
+
+
+def build_prompt(
+    diff: str, map_reduce: bool, quiet: bool = False
+) -> tuple[int, str]:
+    """
+    Build the generation prompt, fitting it into config.MAX_PROMPT_TOKENS if
+    needed. Diffs too large for it are either compacted, or summarized in
+    parts first (map-reduce).
+
+    Args:
+        diff: the sanitized diff
+        map_reduce: whether to summarize large diffs instead of compacting
+            them
+        quiet: whether to print nothing. Diffs that need summarizing aren't
+            summarized then, as it takes several requests, and 1 is returned.
+
+    Returns:
+        a tuple of the return code and the prompt. The return code is 0 if the
+        prompt is ok, and the prompt is the error message otherwise.
+    """
+    if config.MAX_PROMPT_TOKENS is None:
+        return 0, llm_providers.generation_prompt + diff
+    from . import compaction
+
+    budget = config.MAX_PROMPT_TOKENS - compaction.estimate_tokens(
+        llm_providers.system_prompt + llm_providers.generation_prompt
+    )
+    if map_reduce and compaction.estimate_tokens(diff) > budget:
+        if quiet:
+            return 1, "The diff needs summarizing."
+        from . import map_reduce as mr
+
+        print("Summarizing the diff...")
+        return mr.build_prompt(diff, config.MAX_PROMPT_TOKENS)
+
+    diff, kept, total = compaction.compact_diff(diff, budget)
+    if kept < total and not quiet:
+        output.print_warning(
+            f"The diff was compacted to fit {config.MAX_PROMPT_TOKENS} "
+            f"tokens. {kept} of its {total} hunks will be used."
+        )
+    return 0, llm_providers.generation_prompt + diff
+
+
+def parse_scope(opts: list[str]) -> tuple[list[str], git_utils.DiffScope]:
+    """
+    Split the paths following "--" from the options of a command.
+
+    Returns:
+        a tuple of the remaining options and the scope of the changes they
+        select.
+    """
+    paths: list[str] = []
+    if "--" in opts:
+        i = opts.index("--")
+        opts, paths = opts[:i], opts[i + 1 :]
+    return opts, git_utils.DiffScope("--staged" in opts, paths)
+
+
+def parse_count(opts: list[str]) -> int:
+    """
+    Get the number of candidate messages asked for with "-n N".
+
+    Returns:
+        the number of candidates, 1 if "-n" isn't given.
+
+    Raises:
+        ValueError: if the number is missing or invalid, with the error message
+    """
+    if "-n" not in opts:
+        return 1
+    i = opts.index("-n")
+    if i + 1 == len(opts):
+        raise ValueError("-n requires a number of candidates")
+    try:
+        n = int(opts[i + 1])
+    except ValueError:
+        raise ValueError(
+            f"Invalid number of candidates: {opts[i + 1]}"
+        ) from None
+    if not 1 <= n <= config.HTTP_POOL_SIZE:
+        raise ValueError(
+            f"The number of candidates must be between 1 and "
+            f"{config.HTTP_POOL_SIZE}"
+        )
+    return n
+
+
+def wrap_message(res: str) -> str:
+    """
+    Wrap a generated message's title at 50 characters and its body at 72.
+    """
+    res_paragraphs = res.strip().split("\n\n", 1)
+    title = output.wrap_text(res_paragraphs[0], 50)
+    if len(res_paragraphs) == 1:
+        return title
+    return title + "\n\n" + output.wrap_text(res_paragraphs[1], 72)
+
+
+def pick_candidate(messages: dict[int, str], printed: bool) -> int | None:
+    """
+    Ask which of the candidate messages to keep.
+
+    Args:
+        messages: the generated messages, by their candidate's number
+        printed: whether they were already printed, as they were streamed
+
+    Returns:
+        the picked message's number, or None if none was.
+    """
+    if not printed:
+        for number, message in messages.items():
+            output.print_success(f"Candidate {number}:")
+            output.print_generated(message)
+    numbers = ", ".join(map(str, messages))
+    while True:
+        try:
+            answer = input(f"Pick a message ({numbers}): ").strip()
+        except (EOFError, KeyboardInterrupt):
+            return None
+        if answer == "":
+            return None
+        if answer.isdigit() and int(answer) in messages:
+            return int(answer)
+        output.print_warning(f"Type one of {numbers}, or nothing to cancel.")
+
+
 def generate_message(opts: list[str]) -> None:
     """
     Generate a message based on the current Git repository changes.
     """
-    diff = git_utils.get_clean_diff()
+    global gen_scope
+    opts, scope = parse_scope(opts)
+    if scope.staged and scope.paths:
+        output.print_error("--staged can't be combined with paths.")
+        return
+    try:
+        n = parse_count(opts)
+    except ValueError as e:
+        output.print_error(str(e))
+        return
+    adaptive = config.ADAPTIVE_DIFF or "--adaptive" in opts
+    try:
+        diff, truncated = collect_diff(scope, adaptive)
+    except OSError as e:
+        # e.g. too many paths for git's command line
+        output.print_warning(f"Couldn't read the diff: {e}")
+        return
     if diff == "":
-        output.print_warning("No changes to the repository.")
+        if scope.staged:
+            output.print_warning("No staged changes.")
+        elif scope.paths:
+            output.print_warning("No changes to the given paths.")
+        else:
+            output.print_warning("No changes to the repository.")
+        return
+    if truncated and adaptive:
+        output.print_warning(
+            "The changes of the chosen files are larger than estimated. Only "
+            "the first part of them will be used."
+        )
+    elif truncated:
+        output.print_warning(
+            f"The diff is larger than {config.MAX_DIFF_BYTES} bytes. Only the "
+            "first part of it will be used."
+        )
+    map_reduce = config.MAP_REDUCE or "--map-reduce" in opts
+    try:
+        stat, prompt = build_prompt(diff, map_reduce)
+        if stat != 0:
+            output.print_error(prompt)
+            return
+        if watcher is not None and n == 1:
+            watcher.wait_for(prompt)
+        # a cached message doesn't need the model
+        if n > 1 or not cache.contains(
+            llm_providers.selected_model, prompt, llm_providers.system_prompt
+        ):
+            finish_warm_up()
+        if n > 1:
+            results = llm_providers.generate_candidates(
+                prompt, n, config.STREAM
+            )
+        elif config.STREAM:
+            results = [llm_providers.stream_generate(prompt)]
+        else:
+            results = [llm_providers.generate(prompt)]
+    except KeyboardInterrupt:
+        # only cancel the generation, not the whole session
+        results = [(1, "Generation cancelled.")]
+
+    messages = {
+        i: wrap_message(res)
+        for i, (stat, res) in enumerate(results, 1)
+        if stat == 0
+    }
+    errors = [res for stat, res in results if stat != 0]
+    if not messages:
+        output.print_error(errors[0])
         return
+    if errors:
+        output.print_warning(
+            f"{len(errors)} of the {n} candidates failed: {errors[0]}"
+        )
 
-    prompt = llm_providers.generation_prompt + diff
-    if config.STREAM:
-        stat, res = llm_providers.stream_generate(prompt)
+    if len(messages) > 1:
+        number = pick_candidate(messages, config.STREAM)
+        if number is None:
+            output.print_warning("No message was picked.")
+            return
     else:
-        stat, res = llm_providers.generate(prompt)
+        number = next(iter(messages))
+        if not config.STREAM or n > 1:
+            output.print_generated(messages[number])
+
+    llm_providers.gen_message = messages[number]
+    # the draft as the model wrote it, for regen to continue from
+    llm_providers.conversation = llm_providers.Conversation(
+        prompt, results[number - 1][1]
+    )
+    gen_scope = scope
+
 
+def regenerate_message(opts: list[str]) -> None:
+    """
+    Rewrite the last generated message following the user's feedback, by
+    continuing the conversation it came from.
+    """
+    try:
+        stat, res = llm_providers.regenerate(" ".join(opts))
+    except KeyboardInterrupt:
+        stat, res = 1, "Generation cancelled."
     if stat != 0:
         output.print_error(res)
         return
-
-    # separate the title and the body and wrap them
-    res_paragraphs = res.strip().split("\n\n", 1)
-    title = output.wrap_text(res_paragraphs[0], 50)
-    body = (
-        output.wrap_text(res_paragraphs[1], 72)
-        if len(res_paragraphs) > 1
-        else ""
-    )
-
-    wrapped_res = title + ("\n\n" + body if len(res_paragraphs) > 1 else "")
+    wrapped_res = wrap_message(res)
     llm_providers.gen_message = wrapped_res
-
     if not config.STREAM:
         output.print_generated(wrapped_res)
 
 
+def speculative_prompt() -> str | None:
+    """
+    Build the prompt a plain "gen" would send for the current changes,
+    without printing anything.
+
+    Returns:
+        the prompt, or None if there's nothing to generate ahead: no model is
+        selected, there are no changes, or the diff needs summarizing.
+    """
+    if llm_providers.selected_model is None:
+        return None
+    try:
+        diff, _ = read_diff(git_utils.DiffScope(), config.ADAPTIVE_DIFF, True)
+    except OSError:
+        return None
+    if diff == "":
+        return None
+    stat, prompt = build_prompt(diff, config.MAP_REDUCE, quiet=True)
+    return prompt if stat == 0 else None
+
+
+def watch_command(opts: list[str]) -> None:
+    """
+    Start or stop generating the messages of the working tree's changes ahead
+    of "gen".
+    """
+    global watcher
+    if opts == ["on"]:
+        if watcher is not None:
+            output.print_warning("Already watching the changes.")
+            return
+        if not config.USE_CACHE:
+            output.print_error("Watching needs the response cache.")
+            return
+        top = git_utils.get_toplevel()
+        if top is None:
+            output.print_error("Couldn't find the repository's root.")
+            return
+        from . import speculation
+
+        watcher = speculation.Watcher(speculative_prompt, top)
+        watcher.start()
+        output.print_success(
+            "Watching the changes. Their message will be generated once "
+            "they're still."
+        )
+    elif opts == ["off"]:
+        if watcher is None:
+            output.print_warning("Not watching the changes.")
+            return
+        watcher.stop()
+        watcher = None
+        output.print_success("Stopped watching the changes.")
+    else:
+        output.print_error("Usage: watch on | watch off")
+
+
+def cache_command(opts: list[str]) -> None:
+    """
+    Show statistics about the response cache, or clear it.
+    """
+    if opts == ["stats"]:
+        count, size = cache.stats()
+        output.print_table(
+            ["Messages", "Size", "Hits", "Misses"],
+            [
+                [
+                    str(count),
+                    f"{size / 1000:.1f} kB",
+                    str(cache.hits),
+                    str(cache.misses),
+                ]
+            ],
+            title=str(cache.cache_dir()),
+        )
+    elif opts == ["clear"]:
+        removed = cache.clear()
+        output.print_success(f"Removed {removed} cached messages.")
+    else:
+        output.print_error("Usage: cache stats | cache clear")
+
+
 def cmd_clear(opts: list[str]) -> None:
     """
     Clear terminal screen (Windows/macOS/Linux).
@@ -192,8 +638,11 @@ supported_commands: dict[str, Callable[[list[str]], None]] = {
     "list": print_available_models,
     "gen": generate_message,
     "generate": generate_message,
+    "regen": regenerate_message,
     "clear": cmd_clear,
     "cls": cmd_clear,
+    "cache": cache_command,
+    "watch": watch_command,
 }
 
 
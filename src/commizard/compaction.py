@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import re
+
+from . import config, exclusion
+
+# A rough estimate that holds well enough for code and English with most
+# tokenizers. It's only used to decide what fits, so it doesn't need to be
+# exact.
+CHARS_PER_TOKEN: int = 4
+
+# context lines kept around each change once the diff has to be compacted
+CONTEXT_LINES: int = 1
+
+# ranking tiers of files, lowest first
+TIER_SOURCE = 0
+TIER_BULK = 1
+TIER_GENERATED = 2
+
+# the prefixes of file header lines, in the order git prints them
+HEADER_ORDER: tuple[tuple[str, ...], ...] = (
+    ("old mode ",),
+    ("new mode ",),
+    ("deleted file mode ", "new file mode "),
+    ("similarity index ", "dissimilarity index "),
+    ("rename from ", "copy from "),
+    ("rename to ", "copy to "),
+    ("--- ", "Binary files "),
+    ("+++ ",),
+)
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens the LLM will see for text.
+    """
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def is_generated(path: str) -> bool:
+    """
+    Check if path looks like a lock file, a build artifact, or vendored code:
+    if it matches config.EXCLUDE_PATTERNS.
+    """
+    return exclusion.matches_patterns(path, tuple(config.EXCLUDE_PATTERNS))
+
+
+class Hunk:
+    """
+    A single "@@" hunk of a file's diff.
+    """
+
+    def __init__(self, header: str):
+        self.header = header
+        self.lines: list[str] = []
+
+    @property
+    def changed(self) -> int:
+        """
+        The number of added and removed lines.
+        """
+        return sum(1 for line in self.lines if line[:1] in ("+", "-"))
+
+    def trim_context(self, context: int) -> None:
+        """
+        Drop the unchanged lines further than context lines from a change.
+        """
+        changed = [
+            i for i, line in enumerate(self.lines) if line[:1] in ("+", "-")
+        ]
+        keep: set[int] = set()
+        for i in changed:
+            keep.update(range(i - context, i + context + 1))
+        self.lines = [
+            line
+            for i, line in enumerate(self.lines)
+            if i in keep or line[:1] not in (" ", "")
+        ]
+
+    def text(self) -> str:
+        return "\n".join([self.header, *self.lines])
+
+
+class FileDiff:
+    """
+    The diff of a single file: its header lines (e.g. "--- a/x", "+++ b/x",
+    "rename from x") and its hunks.
+    """
+
+    def __init__(self) -> None:
+        self.header: list[str] = []
+        self.hunks: list[Hunk] = []
+
+    @property
+    def path(self) -> str:
+        old = new = ""
+        for line in self.header:
+            if line.startswith("+++ "):
+                new = line[4:]
+            elif line.startswith("--- "):
+                old = line[4:]
+            elif line.startswith(("rename to ", "copy to ")):
+                new = line.split(" ", 2)[2]
+        return strip_prefix(new if new and new != "/dev/null" else old)
+
+    @property
+    def tier(self) -> int:
+        if is_generated(self.path):
+            return TIER_GENERATED
+        if any(
+            line.startswith(("rename from ", "copy from ", "deleted file"))
+            for line in self.header
+        ):
+            return TIER_BULK
+        return TIER_SOURCE
+
+    def header_text(self) -> str:
+        return "\n".join(self.header)
+
+    def text(self) -> str:
+        return "\n".join([*self.header, *(h.text() for h in self.hunks)])
+
+
+def header_order(line: str) -> int:
+    """
+    The position of a file header line in git's output, or -1 if it's not a
+    known header line. Since the "diff --git" lines are removed when the diff
+    is sanitized, this is how consecutive file headers are told apart.
+    """
+    for order, prefixes in enumerate(HEADER_ORDER):
+        if line.startswith(prefixes):
+            return order
+    return -1
+
+
+def strip_prefix(path: str) -> str:
+    return path[2:] if path.startswith(("a/", "b/")) else path
+
+
+def continues_header(file: FileDiff, line: str) -> bool:
+    """
+    Check if a "--- " line belongs to file, whose header so far only tells
+    of a rename, copy or new file. If it doesn't, file has no content changes
+    and line starts the next file.
+    """
+    if not line.startswith("--- "):
+        return True
+    old_path = strip_prefix(line[4:])
+    for prev in file.header:
+        if prev.startswith(("rename from ", "copy from ")):
+            return old_path == prev.split(" ", 2)[2]
+        if prev.startswith("new file mode "):
+            return old_path == "/dev/null"
+    return True
+
+
+def parse_diff(diff: str) -> list[FileDiff]:
+    """
+    Split a sanitized diff into files and hunks. Hunks are delimited using the
+    line counts in their "@@" headers, so removed lines that look like file
+    headers (e.g. "--- x") aren't mistaken for them.
+    """
+    files: list[FileDiff] = []
+    current: FileDiff | None = None
+    hunk: Hunk | None = None
+    last_order = -1
+    old_left = new_left = 0
+    for line in diff.splitlines():
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            hunk.lines.append(line)
+            tag = line[:1]
+            if tag == "-":
+                old_left -= 1
+            elif tag == "+":
+                new_left -= 1
+            elif tag != "\\":
+                old_left -= 1
+                new_left -= 1
+            continue
+
+        match = HUNK_HEADER.match(line)
+        if match and current is not None:
+            hunk = Hunk(line)
+            current.hunks.append(hunk)
+            old_count, new_count = match.groups()
+            old_left = 1 if old_count is None else int(old_count)
+            new_left = 1 if new_count is None else int(new_count)
+        elif hunk is not None and line.startswith("\\"):
+            # "\ No newline at end of file" after a hunk's last line
+            hunk.lines.append(line)
+        else:
+            order = header_order(line)
+            if (
+                current is None
+                or current.hunks
+                or (order != -1 and order <= last_order)
+                or not continues_header(current, line)
+            ):
+                current = FileDiff()
+                files.append(current)
+                last_order = -1
+            current.header.append(line)
+            last_order = max(last_order, order)
+            hunk = None
+    return files
+
+
+def omitted_note(n_hunks: int, added: int, removed: int) -> str:
+    return f"[{n_hunks} hunk(s) omitted: +{added} -{removed} lines]"
+
+
+def compact_diff(diff: str, max_tokens: int) -> tuple[str, int, int]:
+    """
+    Fit a sanitized diff into a token budget. Diffs that already fit are
+    returned unchanged. Otherwise, context lines are trimmed and hunks are
+    ranked, so that source changes are kept over generated or lock files, and
+    small hunks over bulk renames and deletions. The hunks that don't fit are
+    summarized by a note under their file's header.
+
+    Args:
+        diff: the sanitized diff
+        max_tokens: the budget, in estimated tokens
+
+    Returns:
+        a tuple of the compacted diff, the number of hunks kept, and the total
+        number of hunks.
+    """
+    files = parse_diff(diff)
+    total = sum(len(f.hunks) for f in files)
+    if estimate_tokens(diff) <= max_tokens:
+        return diff, total, total
+
+    for f in files:
+        for hunk in f.hunks:
+            hunk.trim_context(CONTEXT_LINES)
+
+    # A file is listed with its header and a possible note once one of its
+    # hunks is kept. Hunks are kept by rank until the budget runs out, and
+    # the files left out are then listed without hunks while there's room.
+    note_cost = estimate_tokens(omitted_note(total, total, total)) + 1
+    header_costs = [estimate_tokens(f.header_text()) + 1 for f in files]
+
+    # keep room for a note about the files that aren't listed
+    budget = max_tokens - note_cost
+    listed: set[int] = set()
+    kept: set[tuple[int, int]] = set()
+    ranked = sorted(
+        (f.tier, hunk.changed, i, j)
+        for i, f in enumerate(files)
+        for j, hunk in enumerate(f.hunks)
+    )
+    for _, _, i, j in ranked:
+        cost = estimate_tokens(files[i].hunks[j].text()) + 1
+        if i not in listed:
+            cost += header_costs[i]
+            if len(files[i].hunks) > 1:
+                cost += note_cost
+        if cost <= budget:
+            budget -= cost
+            kept.add((i, j))
+            listed.add(i)
+
+    if (
+        not kept
+        and ranked
+        and header_costs[ranked[0][2]] + 2 * note_cost < budget
+    ):
+        # A single huge hunk is better partially shown than not at all. The
+        # room for its part must be positive, or the slice below would keep
+        # almost all of it.
+        _, _, i, j = ranked[0]
+        budget -= header_costs[i]
+        hunk = files[i].hunks[j]
+        size = (budget - 2 * note_cost) * CHARS_PER_TOKEN
+        hunk.lines = hunk.text()[:size].splitlines()[1:-1]
+        if hunk.lines:
+            hunk.lines.append("[hunk truncated]")
+            kept.add((i, j))
+            listed.add(i)
+            budget -= estimate_tokens(hunk.text()) + 1
+        else:
+            budget += header_costs[i]
+
+    for _, i in sorted(
+        (f.tier, i) for i, f in enumerate(files) if i not in listed
+    ):
+        cost = header_costs[i] + (note_cost if files[i].hunks else 0)
+        if cost <= budget:
+            budget -= cost
+            listed.add(i)
+
+    parts: list[str] = []
+    for i, f in enumerate(files):
+        if i not in listed:
+            continue
+        parts.append(f.header_text())
+        omitted = [h for j, h in enumerate(f.hunks) if (i, j) not in kept]
+        parts += [h.text() for j, h in enumerate(f.hunks) if (i, j) in kept]
+        if omitted:
+            added = sum(
+                1 for h in omitted for line in h.lines if line[:1] == "+"
+            )
+            removed = sum(h.changed for h in omitted) - added
+            parts.append(omitted_note(len(omitted), added, removed))
+    if len(listed) < len(files):
+        parts.append(f"[{len(files) - len(listed)} more file(s) omitted]")
+    return "\n".join(parts), len(kept), total
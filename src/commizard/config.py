@@ -10,6 +10,87 @@ USE_COLOR: bool = True
 SHOW_BANNER: bool = True
 STREAM: bool = True
 
+# Reuse connections to the LLM server through a pooled session. HTTP_POOL_SIZE
+# is the number of connections kept alive for concurrent requests.
+HTTP_KEEP_ALIVE: bool = True
+HTTP_POOL_SIZE: int = 8
+
+# Warm up the selected model while the diff is being collected, and how long
+# it's kept loaded afterward (e.g. "10m"). None uses the server's default.
+PIPELINE: bool = True
+KEEP_ALIVE: str | None = None
+
+# Reading the diff stops after this many bytes (~4 bytes per token), so huge
+# diffs never fully load into memory. None disables the limit.
+MAX_DIFF_BYTES: int | None = 1_000_000
+
+# Larger prompts are compacted to fit this many (estimated) tokens, so they
+# stay within the model's context and prompt processing stays fast. None
+# disables compaction.
+MAX_PROMPT_TOKENS: int | None = 6_000
+
+# Summarize the parts of such diffs separately, then write the message from the
+# summaries, instead of compacting them. MAX_CONCURRENCY is the number of
+# summaries requested at once.
+MAP_REDUCE: bool = False
+MAX_CONCURRENCY: int = 2
+
+# Read the full changes of only the most significant files that fit the prompt,
+# chosen from "git diff --numstat", and list the others with their line counts.
+ADAPTIVE_DIFF: bool = False
+
+# Leave files whose changes tell the LLM little out of the diff, and only list
+# them with their number of changed lines: those matching EXCLUDE_PATTERNS
+# (globs matched against the file's name, the names of the directories it's in
+# if they end with their only "/", or its whole path if they hold another
+# "/"), those marked linguist-generated or -diff in .gitattributes, binary
+# files, and those with more than EXCLUDE_MAX_LINES changed lines or larger
+# than EXCLUDE_MAX_FILE_BYTES. Their patches are never read from git.
+# Compacted diffs also keep the files matching EXCLUDE_PATTERNS last, even
+# when EXCLUDE_FILES is off.
+EXCLUDE_FILES: bool = True
+EXCLUDE_PATTERNS: list[str] = [
+    "package-lock.json",
+    "npm-shrinkwrap.json",
+    "pnpm-lock.yaml",
+    "*.lock",
+    "go.sum",
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*.snap",
+    "*.pb.go",
+    "*_pb2.py",
+    "vendor/",
+    "node_modules/",
+    "dist/",
+    "__generated__/",
+]
+EXCLUDE_MAX_LINES: int | None = 10_000
+EXCLUDE_MAX_FILE_BYTES: int | None = 1_000_000
+
+# Reuse the responses to identical prompts from an on-disk cache, which keeps
+# the most recently used CACHE_MAX_BYTES bytes of them.
+USE_CACHE: bool = True
+CACHE_MAX_BYTES: int = 1_000_000
+
+# Keep track of the working tree's changed files with inotify (on Linux), so
+# diffs only make git look at them instead of scanning the whole tree. With
+# more than TRACK_MAX_PATHS changed paths, the whole tree is diffed. It's
+# opt-in for now.
+TRACK_CHANGES: bool = False
+TRACK_MAX_PATHS: int = 1000
+
+# With "watch on", check the working tree's changes every WATCH_INTERVAL
+# seconds, and once they've been still for WATCH_DEBOUNCE seconds, generate
+# their message into the cache in the background, before "gen" asks for it.
+WATCH_INTERVAL: float = 1.0
+WATCH_DEBOUNCE: float = 2.0
+
+# The library decoding the chunks of streamed responses: "msgspec", "orjson" or
+# "json". None uses the fastest one installed.
+JSON_BACKEND: str | None = None
+
 
 def set_url(url: str):
     """
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import fnmatch
+import functools
+import os
+import re
+from pathlib import Path
+
+from . import config, git_utils
+
+# the gitattributes marking files whose changes the LLM shouldn't see
+ATTRIBUTES: tuple[str, ...] = ("linguist-generated", "diff")
+
+
+def is_dir_pattern(pattern: str) -> bool:
+    return pattern.endswith("/") and "/" not in pattern[:-1]
+
+
+@functools.cache
+def compile_patterns(
+    patterns: tuple[str, ...],
+) -> tuple[re.Pattern | None, re.Pattern | None, re.Pattern | None]:
+    """
+    Compile glob patterns into a single regex matching the names of files
+    (the patterns without a "/"), another matching their whole paths, and
+    another matching the names of the directories holding them (the patterns
+    ending with their only "/"), so checking a file takes a few matches
+    however many patterns there are.
+    """
+    names = [fnmatch.translate(p) for p in patterns if "/" not in p]
+    dirs = [fnmatch.translate(p[:-1]) for p in patterns if is_dir_pattern(p)]
+    paths = [
+        fnmatch.translate(p.lstrip("/"))
+        for p in patterns
+        if "/" in p and not is_dir_pattern(p)
+    ]
+    return (
+        re.compile("|".join(names)) if names else None,
+        re.compile("|".join(paths)) if paths else None,
+        re.compile("|".join(dirs)) if dirs else None,
+    )
+
+
+def matches_patterns(path: str, patterns: tuple[str, ...]) -> bool:
+    """
+    Check if path matches any of the glob patterns. Patterns without a "/"
+    are matched against the file's name, those ending with their only "/"
+    against the names of the directories it's in (like in .gitignore), and
+    the others against its whole path, relative to the repository's root.
+    "*" matches "/" too.
+    """
+    names, paths, dirs = compile_patterns(patterns)
+    *parents, name = path.split("/")
+    return bool(
+        (names is not None and names.match(name))
+        or (paths is not None and paths.match(path))
+        or (dirs is not None and any(dirs.match(d) for d in parents))
+    )
+
+
+def global_attributes() -> Path:
+    """
+    The default place of the user's gitattributes file, when
+    core.attributesFile isn't set.
+    """
+    config_home = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(config_home) / "git" / "attributes"
+
+
+def has_attributes(paths: list[str], top: str) -> bool:
+    """
+    Check if a gitattributes file may apply to the files, so check-attr is
+    only run then: a .gitattributes in the directories holding them, the
+    repository's info/attributes, or the user's gitattributes file. Only
+    those in the working tree are looked for, and an attributes file that
+    core.attributesFile sets elsewhere than global_attributes isn't found.
+
+    Args:
+        paths: the files' paths, relative to the repository's root
+        top: the repository's root
+    """
+    root = Path(top)
+    git_dir = root / ".git"
+    if not git_dir.is_dir():
+        # a linked worktree or a submodule, whose git directory is elsewhere
+        return True
+    dirs = {""}
+    for path in paths:
+        parent = path.rpartition("/")[0]
+        while parent not in dirs:
+            dirs.add(parent)
+            parent = parent.rpartition("/")[0]
+    files = [git_dir / "info" / "attributes", global_attributes()]
+    files += [root / d / ".gitattributes" for d in dirs]
+    return any(f.is_file() for f in files)
+
+
+def read_attributes(
+    paths: list[str], staged: bool = False, top: str | None = None
+) -> set[str]:
+    """
+    Get the files marked as generated (linguist-generated) or as having no
+    diff (-diff, which the "binary" macro sets too) in .gitattributes.
+
+    Args:
+        paths: the files' paths, relative to the repository's root
+        staged: whether to read the attributes from the index instead of the
+            working tree
+        top: the repository's root, the current directory by default
+
+    Returns:
+        the marked files' paths. It's empty if an error occurred.
+    """
+    if not paths:
+        return set()
+    # the paths are read from the input, as there may be too many of them for
+    # the command line
+    args = ["check-attr", "--stdin", "-z", *ATTRIBUTES]
+    if staged:
+        args.insert(1, "--cached")
+    out = git_utils.run_git_command(args, top, "\0".join(paths) + "\0")
+    if out.returncode != 0:
+        return set()
+    marked = set()
+    # -z prints a path, an attribute and its value per entry
+    fields = out.stdout.split("\0")
+    for i in range(0, len(fields) - 2, 3):
+        path, attribute, value = fields[i : i + 3]
+        if (attribute == "linguist-generated" and value in ("set", "true")) or (
+            attribute == "diff" and value == "unset"
+        ):
+            marked.add(path)
+    return marked
+
+
+def is_large(
+    added: int | None, removed: int | None, path: str, top: str
+) -> bool:
+    """
+    Check if a file's change is too large to be worth showing: it has more
+    than config.EXCLUDE_MAX_LINES changed lines, or the file is larger than
+    config.EXCLUDE_MAX_FILE_BYTES, like a data file or a bundle.
+    """
+    max_lines = config.EXCLUDE_MAX_LINES
+    if max_lines is not None and (added or 0) + (removed or 0) > max_lines:
+        return True
+    if config.EXCLUDE_MAX_FILE_BYTES is None:
+        return False
+    try:
+        size = (Path(top) / path).stat().st_size
+    except OSError:
+        # deleted
+        return False
+    return size > config.EXCLUDE_MAX_FILE_BYTES
+
+
+def find_excluded(
+    stats: list[tuple[int | None, int | None, str]],
+    staged: bool = False,
+    cwd: str | None = None,
+) -> list[tuple[int | None, int | None, str]]:
+    """
+    Choose the changed files to leave out of the diff: those matching
+    config.EXCLUDE_PATTERNS, those marked in .gitattributes, the large ones
+    (see is_large), and binary files, whose diff says nothing anyway.
+
+    Args:
+        stats: the changed files, as returned by git_utils.diff_numstat
+        staged: whether the changes are the staged ones
+        cwd: the working tree, the current directory by default
+
+    Returns:
+        the excluded files' stats, in the order of stats.
+    """
+    if not stats:
+        return []
+    top = git_utils.get_toplevel(cwd)
+    if top is None:
+        return []
+    patterns = tuple(config.EXCLUDE_PATTERNS)
+    excluded = set()
+    for added, removed, path in stats:
+        if (
+            added is None
+            or removed is None
+            or matches_patterns(path, patterns)
+            or is_large(added, removed, path, top)
+        ):
+            excluded.add(path)
+    rest = [path for _, _, path in stats if path not in excluded]
+    if has_attributes(rest, top):
+        excluded |= read_attributes(rest, staged, top)
+    return [stat for stat in stats if stat[2] in excluded]
+
+
+def exclude_files(
+    scope: git_utils.DiffScope | None = None, cwd: str | None = None
+) -> tuple[
+    git_utils.DiffScope,
+    list[tuple[int | None, int | None, str]] | None,
+    list[tuple[int | None, int | None, str]],
+]:
+    """
+    Find the changed files to leave out of the diff (see find_excluded), from
+    "git diff --numstat", before any patch is read.
+
+    Returns:
+        a tuple of the scope without the excluded files, the stats of the
+        remaining files (None if git failed), and the excluded files' stats.
+    """
+    scope = scope or git_utils.DiffScope()
+    stats = git_utils.diff_numstat(scope, cwd)
+    if not stats:
+        return scope, stats, []
+    excluded = find_excluded(stats, scope.staged, cwd)
+    if not excluded:
+        return scope, stats, []
+    paths = {path for _, _, path in excluded}
+    kept = [stat for stat in stats if stat[2] not in paths]
+    narrowed = git_utils.DiffScope(scope.staged, scope.paths, sorted(paths))
+    return narrowed, kept, excluded
+
+
+def read_diff(
+    scope: git_utils.DiffScope | None = None,
+    max_bytes: int | None = None,
+    cwd: str | None = None,
+) -> tuple[str, bool, list[tuple[int | None, int | None, str]]]:
+    """
+    Read the sanitized diff of the changes in scope, without the files
+    find_excluded chooses. Their stats come from the same git process as the
+    diff (see git_utils.stream_stats_and_diff), and their patches are
+    dropped as it's read.
+
+    Returns:
+        a tuple of the diff, whether it was truncated to fit max_bytes, and
+        the excluded files' stats.
+    """
+    scope = scope or git_utils.DiffScope()
+    excluded: list[tuple[int | None, int | None, str]] = []
+
+    def choose(stats: list[tuple[int | None, int | None, str]]) -> list[str]:
+        excluded.extend(find_excluded(stats, scope.staged, cwd))
+        return [path for _, _, path in excluded]
+
+    _, diff, truncated = git_utils.stream_stats_and_diff(
+        choose, max_bytes, cwd, scope
+    )
+    return diff, truncated, excluded
+
+
+def summarize(excluded: list[tuple[int | None, int | None, str]]) -> str:
+    """
+    List the excluded files with their number of changed lines, to be added
+    after the diff.
+    """
+    return "\n".join(
+        [
+            f"[{len(excluded)} generated, binary or large file(s), not shown:]",
+            *(git_utils.format_stat(*stat) for stat in excluded),
+        ]
+    )
+
+
+def skipped_bytes(excluded: list[tuple[int | None, int | None, str]]) -> int:
+    """
+    Estimate the size of the excluded files' patches, which weren't read.
+    """
+    return sum(
+        git_utils.estimate_patch_bytes(*stat)
+        for stat in excluded
+        if stat[0] is not None
+    )
+
+
+def report(excluded: list[tuple[int | None, int | None, str]]) -> str:
+    """
+    Describe what was left out of the diff, for a warning.
+    """
+    from . import compaction
+
+    size = skipped_bytes(excluded)
+    return (
+        f"{len(excluded)} generated, binary or large file(s) were left out of "
+        f"the diff, about {size / 1000:.1f} kB "
+        f"(~{-(-size // compaction.CHARS_PER_TOKEN)} tokens)."
+    )
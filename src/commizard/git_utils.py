@@ -1,28 +1,224 @@
 from __future__ import annotations
 
 import subprocess
+from pathlib import Path
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from collections.abc import Callable, Collection, Iterable, Iterator
 
-def run_git_command(args: list[str]) -> subprocess.CompletedProcess:
+# lines starting with these carry no information useful to the LLM
+DIFF_NOISE_PREFIXES: tuple[str, ...] = ("diff --git", "index ", "warning:")
+
+# the estimated size of a changed line in a patch, with its share of the
+# context lines around it
+PATCH_BYTES_PER_LINE: int = 60
+
+# cancels the diff.orderFile setting, so the files are always diffed in the
+# order of their paths. The prompt's diff then only changes where the changes
+# do, and the server can reuse its cache of the prompt up to there.
+NO_ORDER_FILE: str = "-O/dev/null"
+
+# the most files a diff leaves out with pathspecs. More would risk going over
+# the command line's length limit (about 32k characters on Windows), so their
+# patches are dropped while the diff is read instead.
+MAX_EXCLUDE_PATHSPECS: int = 100
+
+
+def git_command(args: list[str], cwd: str | None = None) -> list[str]:
+    """
+    Build the command line running git with args, in the repository at cwd
+    (the current directory if it's None).
+    """
+    if cwd is None:
+        return ["git", *args]
+    return ["git", "-C", cwd, *args]
+
+
+def run_git_command(
+    args: list[str], cwd: str | None = None, stdin: str | None = None
+) -> subprocess.CompletedProcess:
     """
-    Run a git command with the given args.
+    Run a git command with the given args, in the repository at cwd (the
+    current directory if it's None), writing stdin to its input if given.
 
     Returns:
         a CompletedProcess object
     """
     # ignoring S603 because args is controlled internally so no injection risk
-    cmd = ["git", *args]
+    cmd = git_command(args, cwd)
     return subprocess.run(  # noqa: S603
-        cmd, capture_output=True, text=True, encoding="utf-8", errors="ignore"
+        cmd,
+        input=stdin,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="ignore",
     )
 
 
-def is_inside_working_tree() -> bool:
+def patch_header(path: str, old_path: str | None = None) -> bytes:
+    """
+    The first line of a file's patch in git's diff, e.g. to drop the patch.
+    Paths that git quotes don't have a matching header.
+
+    Args:
+        path: the file's path, relative to the repository's root
+        old_path: its path before it was renamed, if it was
+    """
+    return f"diff --git a/{old_path or path} b/{path}".encode()
+
+
+class GitStream:
+    """
+    Streams the output of a git command line by line, without buffering it
+    whole. This class is intended to be used as a context manager and an
+    iterator. Once max_bytes bytes have been read (if given), iteration stops
+    and the git process is terminated. The command runs in the repository at
+    cwd, if given.
+
+    The patches whose first line (see patch_header) is in skip are dropped
+    from a diff's output, without counting toward max_bytes. skip can be
+    changed while the output is read.
+
+    Example usage:
+        with GitStream(["diff"], max_bytes=4096) as stream:
+            for line in stream:
+                print(line)
+    """
+
+    def __init__(
+        self,
+        args: list[str],
+        max_bytes: int | None = None,
+        cwd: str | None = None,
+        skip: Collection[bytes] = (),
+    ):
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.truncated = False
+        self.returncode: int | None = None
+        self.skip = skip
+        self._pending: list[str] = []
+        self._eof = False
+        self._skipping = False
+        # output read ahead by read_until, not yet streamed
+        self._ahead = b""
+        # ignoring S603 because args is controlled internally so no injection
+        # risk
+        self.process = subprocess.Popen(  # noqa: S603
+            git_command(args, cwd),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+        # Don't catch any exceptions and let them propagate
+        if exc_type is not None:
+            return False
+        return None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        while not self._pending:
+            if self.returncode is not None or self.process.stdout is None:
+                raise StopIteration
+            limit = -1
+            if self.max_bytes is not None and not self._skipping:
+                # read one extra byte to know if we've gone over the budget
+                limit = self.max_bytes - self.bytes_read + 1
+            if self._ahead:
+                raw, self._ahead = self._ahead, b""
+            else:
+                raw = self.process.stdout.readline(limit)
+            if raw == b"":
+                self._eof = True
+                self.close()
+                raise StopIteration
+            if raw.startswith(b"diff --git "):
+                self._skipping = raw.rstrip(b"\r\n") in self.skip
+            if self._skipping:
+                continue
+            if (
+                self.max_bytes is not None
+                and self.bytes_read + len(raw) > self.max_bytes
+            ):
+                self.truncated = True
+                self.close()
+                raise StopIteration
+            self.bytes_read += len(raw)
+            # a single raw line can hold several lines (e.g. separated by \r)
+            self._pending = raw.decode("utf-8", errors="ignore").splitlines()
+            self._pending.reverse()
+        return self._pending.pop()
+
+    def read_until(self, end: bytes) -> bytes:
+        """
+        Read the output up to the first occurrence of end, without counting
+        it toward max_bytes, e.g. the stats git prints before a diff. The
+        output after end is streamed as usual.
+
+        Returns:
+            the output before end, all of it if end never occurs.
+        """
+        data = self._ahead
+        while end not in data and self.process.stdout is not None:
+            raw = self.process.stdout.readline()
+            if raw == b"":
+                break
+            data += raw
+        head, _, self._ahead = data.partition(end)
+        return head
+
+    def close(self) -> None:
+        """
+        Stop reading and wait for the git process, terminating it first if it
+        still has output left.
+        """
+        if self.returncode is not None:
+            return
+        self._pending = []
+        if not self._eof and self.process.poll() is None:
+            self.process.terminate()
+        if self.process.stdout is not None:
+            self.process.stdout.close()
+        self.returncode = self.process.wait()
+
+
+_toplevels: dict[str, str] = {}
+
+
+def get_toplevel(cwd: str | None = None) -> str | None:
+    """
+    Get the root of the repository at cwd (the current directory by
+    default). git is only asked once per directory in a session.
+
+    Returns:
+        the root's path, or None if cwd isn't in a working tree.
+    """
+    key = str(Path(cwd or ".").resolve())
+    top = _toplevels.get(key)
+    if top is None:
+        out = run_git_command(["rev-parse", "--show-toplevel"], cwd)
+        if out.returncode != 0:
+            return None
+        top = _toplevels[key] = out.stdout.strip()
+    return top
+
+
+def is_inside_working_tree(cwd: str | None = None) -> bool:
     """
     Check if we're inside a working directory (can execute commit and diff
-    commands)
+    commands). cwd is the directory to check, the current one by default.
     """
-    out = run_git_command(["rev-parse", "--is-inside-work-tree"])
+    out = run_git_command(["rev-parse", "--is-inside-work-tree"], cwd)
     return out.returncode == 0 and out.stdout.strip() == "true"
 
 
@@ -39,46 +235,371 @@ def get_diff() -> str | None:
     Get the diff from the current working directory.
 
     Returns:
-        the diff as a string (raw Git output), or None if an error occurred
+        the diff as a string (raw Git output), or None if an error occurred.
+        The diff is empty if there are no changes.
     """
-    if not is_changed():
-        return ""
-
-    out = run_git_command(["--no-pager", "diff", "--no-color"])
+    # An empty diff already tells us nothing changed, so there's no need for
+    # an is_changed() call that makes git scan the working tree twice.
+    out = run_git_command(["--no-pager", "diff", "--no-color", NO_ORDER_FILE])
 
     if out.returncode == 0:
         return out.stdout.strip()
     return None
 
 
-def commit(msg: str) -> tuple[int, str]:
+class DiffScope:
+    """
+    The part of the changes that a diff, and the commit made from its message,
+    cover: all the changes to tracked files (the default), only the staged
+    ones, or either of them restricted to some paths (pathspecs). The files
+    in exclude (relative to the repository's root) are left out of the diff,
+    but not of the commit. Past MAX_EXCLUDE_PATHSPECS of them, they're left
+    out while the diff is read, see skipped.
+    """
+
+    def __init__(
+        self,
+        staged: bool = False,
+        paths: list[str] | None = None,
+        exclude: list[str] | None = None,
+    ):
+        self.staged = staged
+        self.paths = paths or []
+        self.exclude = exclude or []
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, DiffScope):
+            return NotImplemented
+        return (self.staged, self.paths, self.exclude) == (
+            other.staged,
+            other.paths,
+            other.exclude,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"DiffScope(staged={self.staged}, paths={self.paths}, "
+            f"exclude={self.exclude})"
+        )
+
+    def diff_args(self, *options: str) -> list[str]:
+        """
+        The arguments of the git diff command showing the changes in scope,
+        with the extra options given.
+        """
+        args = ["--no-pager", "diff", "--no-color", NO_ORDER_FILE, *options]
+        if self.staged:
+            args.append("--cached")
+        exclude = [] if self.skipped() else self.exclude
+        if self.paths or exclude:
+            args += ["--", *self.paths]
+            # the excluded paths may hold glob characters
+            args += [f":(top,exclude,literal){path}" for path in exclude]
+        return args
+
+    def skipped(self) -> set[bytes]:
+        """
+        The first lines of the patches to drop from the diff's output (see
+        GitStream), if there are too many excluded files for pathspecs.
+        """
+        if len(self.exclude) <= MAX_EXCLUDE_PATHSPECS:
+            return set()
+        return {patch_header(path) for path in self.exclude}
+
+    def commit_args(self, msg: str) -> list[str]:
+        """
+        The arguments of the git commit command committing the changes in
+        scope, with msg as the commit text.
+        """
+        if self.staged:
+            # the index as is. Restricting it to paths would commit their
+            # working tree's content instead, so it's not supported.
+            return ["commit", "-m", msg]
+        if self.paths:
+            return ["commit", "-m", msg, "--", *self.paths]
+        return ["commit", "-a", "-m", msg]
+
+
+def commit(msg: str, scope: DiffScope | None = None) -> tuple[int, str]:
     """
     commit with msg as the commit text.
+    Args:
+        msg: the commit text
+        scope: the changes to commit. All the changes to tracked files are
+            committed by default.
     Returns:
         the return value from running the commit command, stdout, and stderr
     """
-    out = run_git_command(["commit", "-a", "-m", msg])
+    out = run_git_command((scope or DiffScope()).commit_args(msg))
     ret = out.stdout.strip() if out.stdout.strip() != "" else out.stderr.strip()
     return out.returncode, ret
 
 
+def iter_clean_diff(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Lazily remove unnecessary information from the diff, in a single pass.
+
+    Args:
+        lines: the lines of the diff, without their line breaks.
+
+    Returns:
+        an iterator of chunks which, joined together, form the sanitized diff.
+    """
+    sep = ""
+    for line in lines:
+        if line.startswith(DIFF_NOISE_PREFIXES):
+            continue
+        yield sep + line
+        sep = "\n"
+
+
 def clean_diff(diff: str | None) -> str:
     """
     Remove unnecessary information from the diff.
     """
     if diff is None:
         return ""
+    return "".join(iter_clean_diff(diff.splitlines()))
+
+
+def stream_clean_diff(
+    max_bytes: int | None = None,
+    cwd: str | None = None,
+    scope: DiffScope | None = None,
+) -> tuple[str, bool]:
+    """
+    Get the current git diff, sanitized for LLM consumption. Git's output is
+    read and cleaned lazily, so at most max_bytes bytes of it are ever read.
+
+    Args:
+        max_bytes: the byte budget of the raw diff. The whole diff is read if
+            it's None.
+        cwd: the working tree to diff, the current directory by default.
+        scope: the changes to diff, all the changes to tracked files by
+            default.
+
+    Returns:
+        a tuple of the sanitized diff and whether it was truncated to fit the
+        budget. The diff is empty if there are no changes or an error occurred.
+    """
+    # A single git process gives both the emptiness check and the content.
+    scope = scope or DiffScope()
+    with GitStream(
+        scope.diff_args(), max_bytes, cwd, scope.skipped()
+    ) as stream:
+        diff = "".join(iter_clean_diff(stream))
+
+    if stream.returncode != 0 and not stream.truncated:
+        return "", False
+    return diff.strip(), stream.truncated
+
+
+def diff_numstat(
+    scope: DiffScope | None = None, cwd: str | None = None
+) -> list[tuple[int | None, int | None, str]] | None:
+    """
+    Get the number of added and removed lines of each changed file, which git
+    counts without printing the diff itself. Renames are listed as a removed
+    and an added file.
+
+    Returns:
+        a list of tuples of each file's added and removed lines (None for
+        binary files) and its path, relative to the repository's root. None if
+        an error occurred.
+    """
+    args = (scope or DiffScope()).diff_args("--numstat", "-z", "--no-renames")
+    out = run_git_command(args, cwd)
+    if out.returncode != 0:
+        return None
+    return [stat for stat, _ in parse_numstat(out.stdout)]
+
+
+def parse_numstat(
+    out: str,
+) -> list[tuple[tuple[int | None, int | None, str], str | None]]:
+    """
+    Parse the output of "git diff --numstat -z".
+
+    Returns:
+        a list of tuples of each file's stats, like diff_numstat's, and its
+        path before it was renamed (None if it wasn't).
+    """
+    stats = []
+    entries = iter(out.split("\0"))
+    for entry in entries:
+        parts = entry.split("\t", 2)
+        if len(parts) != 3:
+            continue
+        added, removed, path = parts
+        old_path = None
+        if path == "":
+            # a rename, followed by its old and new paths
+            old_path, path = next(entries, ""), next(entries, "")
+        stats.append(
+            (
+                (
+                    int(added) if added.isdigit() else None,
+                    int(removed) if removed.isdigit() else None,
+                    path,
+                ),
+                old_path,
+            )
+        )
+    return stats
+
+
+def stream_stats_and_diff(
+    choose_skipped: Callable[
+        [list[tuple[int | None, int | None, str]]], Collection[str]
+    ],
+    max_bytes: int | None = None,
+    cwd: str | None = None,
+    scope: DiffScope | None = None,
+) -> tuple[list[tuple[int | None, int | None, str]] | None, str, bool]:
+    """
+    Get the changed files' stats (see diff_numstat) and the sanitized diff
+    from a single git process, which prints the stats first. The files to
+    leave out of the diff can be chosen from them, before their patches are
+    read. Renames are detected, like in stream_clean_diff.
+
+    Args:
+        choose_skipped: given the stats, returns the paths of the files whose
+            patches to drop. They don't count toward max_bytes.
+        max_bytes: the byte budget of the raw diff. The whole diff is read if
+            it's None.
+        cwd: the working tree to diff, the current directory by default.
+        scope: the changes to diff, all the changes to tracked files by
+            default.
 
-    lines = diff.splitlines()
-    for line in lines[:]:
-        if line.startswith(("diff --git", "index ", "warning:")):
-            lines.remove(line)
-    return "\n".join(lines)
+    Returns:
+        a tuple of the stats (None if git failed), the sanitized diff and
+        whether it was truncated to fit the budget.
+    """
+    scope = scope or DiffScope()
+    args = scope.diff_args("--numstat", "-z", "--patch")
+    with GitStream(args, max_bytes, cwd, scope.skipped()) as stream:
+        # the stats end with an empty entry
+        head = stream.read_until(b"\0\0").decode("utf-8", errors="ignore")
+        parsed = parse_numstat(head)
+        stats = [stat for stat, _ in parsed]
+        skipped = set(choose_skipped(stats))
+        if skipped:
+            stream.skip = set(stream.skip) | {
+                patch_header(stat[2], old_path)
+                for stat, old_path in parsed
+                if stat[2] in skipped
+            }
+        diff = "".join(iter_clean_diff(stream))
+
+    if stream.returncode != 0 and not stream.truncated:
+        return None, "", False
+    return stats, diff.strip(), stream.truncated
+
+
+def select_patches(
+    stats: list[tuple[int | None, int | None, str]], max_bytes: int
+) -> set[str]:
+    """
+    Choose the files whose full patches fit max_bytes, by the size estimated
+    from their number of changed lines. The files that aren't chosen are
+    listed with format_stat instead, which takes part of the budget too.
+    Source files are chosen over generated ones, and larger changes over
+    smaller ones, as they tell the most about the commit. Binary files are
+    never chosen.
+
+    Returns:
+        the chosen files' paths.
+    """
+    from . import compaction
+
+    ranked = sorted(
+        (stat for stat in stats if stat[0] is not None and stat[1] is not None),
+        key=lambda stat: (
+            compaction.is_generated(stat[2]),
+            -((stat[0] or 0) + (stat[1] or 0)),
+        ),
+    )
+    chosen = set()
+    # room for listing every file, until it's chosen
+    budget = max_bytes - sum(len(format_stat(*stat)) + 1 for stat in stats)
+    for added, removed, path in ranked:
+        cost = estimate_patch_bytes(added, removed, path)
+        cost -= len(format_stat(added, removed, path)) + 1
+        if cost <= budget:
+            budget -= cost
+            chosen.add(path)
+    return chosen
+
+
+def estimate_patch_bytes(
+    added: int | None, removed: int | None, path: str
+) -> int:
+    """
+    Estimate the size of a file's sanitized patch from its number of changed
+    lines: its header, and the changed lines with some context around them.
+    """
+    churn = (added or 0) + (removed or 0)
+    return 2 * len(path) + 40 + churn * PATCH_BYTES_PER_LINE
+
+
+def format_stat(added: int | None, removed: int | None, path: str) -> str:
+    if added is None or removed is None:
+        return f"{path} | binary"
+    return f"{path} | +{added} -{removed}"
+
+
+def adaptive_clean_diff(
+    max_bytes: int | None = None,
+    scope: DiffScope | None = None,
+    cwd: str | None = None,
+    stats: list[tuple[int | None, int | None, str]] | None = None,
+) -> tuple[str, bool]:
+    """
+    Get the current git diff, sanitized for LLM consumption, with full patches
+    only for the most significant files that fit max_bytes. The cheap
+    "git diff --numstat" is run first to choose them, then only their patches
+    are read from git. The other files are listed after the diff with their
+    number of changed lines.
+
+    Args:
+        max_bytes: the byte budget of the patches. All of them are read if
+            it's None.
+        scope: the changes to diff, all the changes to tracked files by
+            default.
+        cwd: the working tree to diff, the current directory by default.
+        stats: the changed files in scope, if diff_numstat was already run.
+
+    Returns:
+        a tuple of the sanitized diff and whether it was truncated to fit the
+        budget (the patches were larger than estimated). The diff is empty if
+        there are no changes or an error occurred.
+    """
+    scope = scope or DiffScope()
+    if stats is None:
+        stats = diff_numstat(scope, cwd)
+    if stats is None or max_bytes is None:
+        return stream_clean_diff(max_bytes, cwd, scope)
+    if not stats:
+        return "", False
+    chosen = select_patches(stats, max_bytes)
+    if len(chosen) == len(stats):
+        return stream_clean_diff(max_bytes, cwd, scope)
+
+    diff, truncated = "", False
+    if chosen:
+        # the paths are relative to the root and may hold glob characters
+        paths = [f":(top,literal){path}" for path in sorted(chosen)]
+        only_chosen = DiffScope(scope.staged, paths)
+        diff, truncated = stream_clean_diff(max_bytes, cwd, only_chosen)
+    others = [format_stat(*stat) for stat in stats if stat[2] not in chosen]
+    summary = "\n".join(
+        [f"[{len(others)} more changed file(s), not shown in full:]", *others]
+    )
+    return (f"{diff}\n\n{summary}" if diff else summary), truncated
 
 
-def get_clean_diff() -> str:
+def get_clean_diff(max_bytes: int | None = None) -> str:
     """
     Get the current git diff, sanitized for LLM consumption.
     """
-    diff = get_diff()
-    return clean_diff(diff)
+    return stream_clean_diff(max_bytes)[0]
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
+import functools
 import json
+import threading
+from typing import TYPE_CHECKING
 
-import requests
+from . import cache, config, output
 
-from . import config, output
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+    import requests
 
 available_models: list[str] | None = None
 selected_model: str | None = None
 gen_message: str | None = None
+# the chat the last message came from, continued by regenerate
+conversation: Conversation | None = None
 
 # Ironically enough, I've used Chat-GPT to write a prompt to prompt other
 # Models (or even itself in the future!)
-generation_prompt = """
+# It's sent as the system message of every generation, ahead of the diff, and
+# never changes, so servers caching their prompts' prefixes (llama.cpp,
+# Ollama) only process it once.
+system_prompt = """
 You are an assistant that generates good, professional Git commit messages.
 
 Guidelines:
@@ -25,10 +36,233 @@ parser bug").
 formatting).
 - Do not include Markdown formatting, code blocks, quotes, or symbols such as
 ``` or **.
+"""
 
+# the start of the user message, followed by the diff
+generation_prompt = """
 Here is the diff:
 """
 
+no_model_error = (
+    "No model selected. You must use the start command to specify which "
+    "model to use before generating.\n"
+    "Example: start model_name"
+)
+
+# the follow-ups asking for a new draft of the message, with and without the
+# user's feedback
+refine_prompt = (
+    "Rewrite the commit message following this feedback: {feedback}\n"
+    "Follow the same guidelines, and reply with the commit message only."
+)
+retry_prompt = (
+    "Write a different commit message for the same changes. Follow the same "
+    "guidelines, and reply with the commit message only."
+)
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Get the HTTP session shared by all requests, creating it on first use.
+    Reusing it keeps the connections to the server alive between requests.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            # Only retry idempotent requests that the server refused because
+            # it was busy. Connection errors aren't retried, so a server
+            # that's down is still reported quickly.
+            retry = Retry(
+                total=2,
+                connect=0,
+                read=0,
+                status=2,
+                backoff_factor=0.2,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=("GET",),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=config.HTTP_POOL_SIZE,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def close_session() -> None:
+    """
+    Close the shared HTTP session and its pooled connections, if it was
+    created.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def send_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send an HTTP request through the shared session, or through a new
+    connection if config.HTTP_KEEP_ALIVE is disabled.
+
+    Inside a Generation, the body is read after the headers arrive, so that
+    cancelling the generation can close the response.
+    """
+    generation: Generation | None = getattr(_worker, "generation", None)
+    if generation is not None:
+        kwargs.setdefault("stream", True)
+    if not config.HTTP_KEEP_ALIVE:
+        import requests
+
+        r = requests.request(method, url, **kwargs)  # noqa: S113
+    else:
+        r = get_session().request(method, url, **kwargs)
+    if generation is not None:
+        generation.track(r)
+    return r
+
+
+# the Generation run by the current thread, if it's a worker of one
+_worker = threading.local()
+
+
+class GenerationCancelledError(Exception):
+    """
+    Stops a generation's worker once the generation is cancelled.
+    """
+
+
+class Generation:
+    """
+    A request to the LLM server, run in a worker thread over the shared
+    session, so it can be cancelled while it's in flight and other work can
+    be done meanwhile.
+
+    Cancelling closes the responses being read, which drops their
+    connections instead of reading the rest of them. A response that hasn't
+    arrived yet is closed as soon as it does.
+
+    Example usage:
+        generation = Generation(request_chat).start(prompt)
+        ...  # anything else, while the model is generating
+        stat, res = generation.wait()
+    """
+
+    def __init__(self, func: Callable[..., tuple[int, str]]):
+        """
+        Args:
+            func: sends the request and returns the return code and the
+                response, like generate
+        """
+        self.func = func
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.result: tuple[int, str] = (1, "Generation cancelled.")
+        self.error: Exception | None = None
+        self.responses: list[requests.Response] = []
+        self.lock = threading.Lock()
+
+    def start(self, *args, **kwargs) -> Generation:
+        """
+        Start calling func with the given arguments in the worker thread.
+        """
+        threading.Thread(
+            target=self.run, args=args, kwargs=kwargs, daemon=True
+        ).start()
+        return self
+
+    def run(self, *args, **kwargs) -> None:
+        _worker.generation = self
+        try:
+            if not self.cancelled.is_set():
+                self.result = self.func(*args, **kwargs)
+        except Exception as e:  # noqa: BLE001
+            # a closed response fails in all sorts of ways
+            if not self.cancelled.is_set():
+                self.error = e
+        finally:
+            _worker.generation = None
+            self.finished.set()
+
+    def track(self, response: requests.Response) -> None:
+        """
+        Close response when the generation is cancelled, or right away if it
+        already is.
+        """
+        with self.lock:
+            if not self.cancelled.is_set():
+                self.responses.append(response)
+                return
+        response.close()
+
+    def guard(
+        self, print_chunk: Callable[[str], None]
+    ) -> Callable[[str], None]:
+        """
+        Wrap print_chunk so that nothing is printed once the generation is
+        cancelled. The chunk that follows raises GenerationCancelledError instead,
+        which ends the worker.
+        """
+
+        def guarded(delta: str) -> None:
+            with self.lock:
+                if self.cancelled.is_set():
+                    raise GenerationCancelledError
+                print_chunk(delta)
+
+        return guarded
+
+    def cancel(self) -> None:
+        """
+        Cancel the generation, closing its responses. The session and its
+        other connections go on.
+        """
+        with self.lock:
+            self.cancelled.set()
+            responses, self.responses = self.responses, []
+        for response in responses:
+            response.close()
+
+    def wait(self) -> tuple[int, str]:
+        """
+        Wait for the generation to finish or be cancelled. Ctrl-C cancels it.
+
+        Returns:
+            the return code and the response of func, or (1, "Generation
+            cancelled.") if it was cancelled.
+
+        Raises:
+            KeyboardInterrupt: once the generation is cancelled by Ctrl-C
+            Exception: whatever func raised
+        """
+        try:
+            # Waiting in short steps lets Ctrl-C through on Windows too.
+            while not self.finished.wait(0.1):
+                if self.cancelled.is_set():
+                    break
+        except KeyboardInterrupt:
+            self.cancel()
+            raise
+        if self.cancelled.is_set():
+            return 1, "Generation cancelled."
+        if self.error is not None:
+            raise self.error
+        return self.result
+
 
 # TODO: Currently, response attribute is of type [dict | str | None] which makes
 #       subscripting for values or using the get method error-prone, as shown by
@@ -36,11 +270,13 @@ Here is the diff:
 #       the users of this class.
 class HttpRequest:
     def __init__(self, method: str, url: str, **kwargs):
+        import requests
+
         resp = None
         method = method.upper()  # All methods are upper case
         try:
             if method in ("GET", "POST", "PUT", "PATCH", "DELETE"):
-                r = requests.request(method, url, **kwargs)  # noqa: S113
+                r = send_request(method, url, **kwargs)
             else:
                 raise ValueError(f"{method} is not a valid method.")
             try:
@@ -94,6 +330,8 @@ class StreamRequest:
     """
 
     def __init__(self, method: str, url: str, **kwargs):
+        import requests
+
         # set default values if the kwargs don't provide it
         if kwargs.get("stream") is None:
             kwargs["stream"] = True
@@ -102,7 +340,7 @@ class StreamRequest:
             kwargs["timeout"] = (0.5, 5)
         self.response = None
         try:
-            r = requests.request(method, url, **kwargs)  # noqa: S113
+            r = send_request(method, url, **kwargs)
             if r.encoding is None:
                 r.encoding = "utf-8"
 
@@ -147,6 +385,8 @@ class StreamRequest:
         return self
 
     def __next__(self):
+        import requests
+
         try:
             return next(self.stream)
         except requests.exceptions.ChunkedEncodingError:
@@ -155,6 +395,24 @@ class StreamRequest:
                 "the full response was received."
             ) from None
 
+    def iter_bytes(self) -> Iterator[bytes]:
+        """
+        Iterate over the raw chunks of the response body as they arrive,
+        without decoding them or splitting them into lines.
+        """
+        # throw an exception if there was an error in the initial request
+        if self.error[0] or self.response is None:
+            raise StreamError(self.error[1])
+        import requests
+
+        try:
+            yield from self.response.iter_content(chunk_size=None)
+        except requests.exceptions.ChunkedEncodingError:
+            raise StreamError(
+                "The server closed the connection before "
+                "the full response was received."
+            ) from None
+
 
 def list_locals() -> list[list[str]] | None:
     """
@@ -182,16 +440,22 @@ def init_model_list() -> None:
         available_models = [member[0] for member in models]
 
 
-def request_load_model(model_name: str) -> HttpRequest:
+def request_load_model(
+    model_name: str, keep_alive: str | None = None
+) -> HttpRequest:
     """
     Send a request to load the local model into RAM
     Args:
         model_name: name of the model to load
+        keep_alive (optional): how long the model stays loaded afterward (e.g.
+            "10m"). The server's default is used if it's None.
 
     Returns:
         a HttpRequest object
     """
-    payload = {"model": model_name}
+    payload: dict[str, str] = {"model": model_name}
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
     url = config.LLM_URL + "api/generate"
     return HttpRequest("POST", url, json=payload, timeout=(0.3, 600))
 
@@ -221,6 +485,20 @@ def select_model(select_str: str) -> tuple[int, str]:
         )
 
 
+def warm_up_model() -> HttpRequest | None:
+    """
+    Make sure the selected model is loaded and keep it alive, so generating
+    doesn't have to wait for it to load. Loading an already loaded model only
+    refreshes its keep-alive timer.
+
+    Returns:
+        the HttpRequest object, or None if no model is selected
+    """
+    if selected_model is None:
+        return None
+    return request_load_model(selected_model, config.KEEP_ALIVE)
+
+
 def unload_model() -> None:
     """
     Unload the local model from RAM
@@ -322,108 +600,434 @@ def get_error_message(status_code: int) -> str:
         )
 
 
-def stream_generate(prompt: str) -> tuple[int, str]:
+# headers for the OpenAI compatible chat completions API
+chat_headers: dict[str, str] = {
+    "Content-Type": "application/json",
+    "Authorization": "Bearer ollama",
+}
+
+
+def chat_payload(
+    prompt: str,
+    stream: bool,
+    history: list[dict] | None = None,
+    system: str | None = None,
+) -> dict:
     """
-    Generate LLM response by streaming the generated text.
-    Note: This function prints to stdout and also ignores reasoning output
+    Build the chat completion request body for prompting the selected_model,
+    after the earlier turns of the conversation in history, if any.
+
+    The messages start with the system message (system_prompt by default),
+    and only the last one holds the diff, so consecutive requests share the
+    longest possible prefix.
+    """
+    message = [
+        {
+            "role": "system",
+            "content": system_prompt if system is None else system,
+        },
+        *(history or []),
+        {"role": "user", "content": prompt},
+    ]
+    return {"model": selected_model, "messages": message, "stream": stream}
+
+
+class SSEDecoder:
+    """
+    Incrementally decodes a Server-Sent Events stream from raw byte chunks,
+    which may split lines, and even UTF-8 characters, anywhere. Only the data
+    of the events is kept: comments and other fields are skipped.
+
+    Example usage:
+        decoder = SSEDecoder()
+        for chunk in chunks:
+            for data in decoder.feed(chunk):
+                print(data)
+    """
+
+    def __init__(self) -> None:
+        self.buffer = b""
+        self.data: list[bytes] = []
+
+    def feed(self, chunk: bytes) -> list[str]:
+        """
+        Decode the next chunk of the stream.
+
+        Returns:
+            the data of the events the chunk completes.
+        """
+        buf = self.buffer + chunk if self.buffer else chunk
+        events = []
+        start = 0
+        while (end := buf.find(b"\n", start)) != -1:
+            line = buf[start:end]
+            start = end + 1
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if line.startswith(b"data:"):
+                value = line[5:]
+                self.data.append(value[1:] if value[:1] == b" " else value)
+            elif not line and self.data:
+                # a blank line ends the event
+                events.append(self._pop_event())
+        self.buffer = buf[start:]
+        return events
+
+    def flush(self) -> list[str]:
+        """
+        Decode what's left at the end of the stream, in case it didn't end
+        with a blank line.
+
+        Returns:
+            the data of the last event, if there's one.
+        """
+        if self.buffer:
+            self.feed(b"\n")
+        return [self._pop_event()] if self.data else []
+
+    def _pop_event(self) -> str:
+        data = b"\n".join(self.data).decode("utf-8", errors="replace")
+        self.data = []
+        return data
+
+
+def json_delta_decoder() -> Callable[[str], str]:
+    """
+    Decode the generated text of a chat completion chunk with the standard
+    library's json module.
+    """
+
+    def decode(data: str) -> str:
+        resp = json.loads(data)
+        delta = resp["choices"][0].get("delta")
+        if not delta:
+            return ""
+        return delta.get("content") or ""
+
+    return decode
+
+
+def orjson_delta_decoder() -> Callable[[str], str]:
+    """
+    Decode the generated text of a chat completion chunk with orjson, whose
+    errors are subclasses of json's.
+
+    Raises:
+        ImportError: if orjson isn't installed
+    """
+    import orjson
+
+    def decode(data: str) -> str:
+        resp = orjson.loads(data)
+        delta = resp["choices"][0].get("delta")
+        if not delta:
+            return ""
+        return delta.get("content") or ""
+
+    return decode
+
+
+def msgspec_delta_decoder() -> Callable[[str], str]:
+    """
+    Decode the generated text of a chat completion chunk with msgspec, into
+    structs holding only the fields that are needed. The rest of the chunk is
+    skipped without being decoded.
+
+    Raises:
+        ImportError: if msgspec isn't installed
+    """
+    from typing import Any, Optional
+
+    import msgspec
+
+    # built with defstruct, as the annotations of a class can't be resolved
+    # here on Python 3.9
+    delta_t: Any = msgspec.defstruct(
+        "Delta", [("content", Optional[str], None)]
+    )
+    choice_t: Any = msgspec.defstruct(
+        "Choice", [("delta", Optional[delta_t], None)]
+    )
+    chunk_t = msgspec.defstruct("Chunk", [("choices", list[choice_t])])
+    decoder = msgspec.json.Decoder(chunk_t)
+
+    def decode(data: str) -> str:
+        # raise the same errors as the other backends
+        try:
+            resp: Any = decoder.decode(data)
+        except msgspec.ValidationError as e:
+            # The chunk is validated as it's parsed, so an invalid JSON may
+            # fail validation first.
+            try:
+                msgspec.json.decode(data)
+            except msgspec.DecodeError:
+                raise json.decoder.JSONDecodeError(str(e), data, 0) from None
+            raise KeyError(str(e)) from None
+        except msgspec.DecodeError as e:
+            raise json.decoder.JSONDecodeError(str(e), data, 0) from None
+        delta = resp.choices[0].delta
+        if delta is None:
+            return ""
+        return delta.content or ""
+
+    return decode
+
+
+# The backends decoding chat completion chunks, fastest first. Each one
+# returns the function decoding a chunk, or raises ImportError if its library
+# isn't installed.
+json_backends: dict[str, Callable[[], Callable[[str], str]]] = {
+    "msgspec": msgspec_delta_decoder,
+    "orjson": orjson_delta_decoder,
+    "json": json_delta_decoder,
+}
+
+
+@functools.cache
+def delta_decoder(backend: str | None = None) -> Callable[[str], str]:
+    """
+    Get the function decoding the generated text of a chat completion chunk.
+
     Args:
-        prompt: The prompt to send to the LLM.
+        backend: the name of the backend in json_backends to use. None picks
+          the fastest installed one. The json module is used if the backend
+          isn't installed.
+    """
+    names = list(json_backends) if backend is None else [backend]
+    for name in names:
+        try:
+            return json_backends[name]()
+        except (ImportError, KeyError):
+            continue
+    return json_delta_decoder()
+
+
+def parse_sse_data(data: str) -> str | None:
+    """
+    Parse the data of an event of a streamed chat completion.
 
     Returns:
-        a tuple of the return code and the response. The return code is 0 if the
-        response is ok, 1 otherwise. The response is the error message if the
-        request fails and the return code is 1.
+        the generated text it holds ("" if there's none), or None if the stream
+        is done.
+
+    Raises:
+        json.decoder.JSONDecodeError: if the data isn't valid JSON
+        KeyError, IndexError: if the JSON doesn't hold a chat completion chunk
     """
-    from rich.live import Live
-    from rich.text import Text
+    if data == "[DONE]":
+        return None
+    return delta_decoder(config.JSON_BACKEND)(data)
 
-    stream_txt = Text(style="blue")
-    url = config.gen_request_url()
-    head = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer ollama",
-    }
-    prev_width = output.console.width  # save past width before changing it
-    message = [{"role": "user", "content": prompt}]
-    payload = {"model": selected_model, "messages": message, "stream": True}
-    try:
-        with (
-            StreamRequest("POST", url, json=payload, headers=head) as stream,
-            Live(
-                stream_txt,
-                console=output.console,
-                vertical_overflow="visible",
-                refresh_per_second=30,
-            ),
-        ):
-            output.console.width = 50
-            new_paragraph = False
-            prev_char = ""  # in case double newline was in two separate chunks
-            for raw in stream:
-                line = raw.strip()
-
-                # It's not data
-                if not line.startswith("data:"):
-                    continue
-
-                line = line[5:].strip()
-                if line == "[DONE]":
-                    break
 
-                resp = json.loads(line)
-                delta = resp["choices"][0].get("delta", {})
-                if not delta:
-                    continue
-                delta = delta.get("content", "")
+def parse_sse_line(raw: str) -> str | None:
+    """
+    Parse a line of a streamed chat completion (Server-Sent Events).
+
+    Returns:
+        the generated text it holds ("" if there's none), or None if the stream
+        is done.
+
+    Raises:
+        json.decoder.JSONDecodeError: if the data isn't valid JSON
+        KeyError, IndexError: if the JSON doesn't hold a chat completion chunk
+    """
+    line = raw.strip()
+
+    # It's not data
+    if not line.startswith("data:"):
+        return ""
+    return parse_sse_data(line[5:].strip())
+
 
-                if not new_paragraph:
-                    if "\n\n" in (prev_char + delta):
-                        output.console.width = 72
-                        new_paragraph = True
-                    prev_char = delta[-1:]  # only need last char
+def decode_deltas(
+    decoder: SSEDecoder, chunk: bytes | None
+) -> tuple[list[str], bool]:
+    """
+    Decode the generated text in the next raw chunk of a streamed chat
+    completion.
+
+    Args:
+        decoder: the decoder of the stream
+        chunk: the next chunk, or None at the end of the stream
 
-                stream_txt.append(delta)
+    Returns:
+        a tuple of the non-empty pieces of generated text, and whether the
+        stream is done.
+
+    Raises:
+        the exceptions of parse_sse_data
+    """
+    events = decoder.flush() if chunk is None else decoder.feed(chunk)
+    deltas: list[str] = []
+    for data in events:
+        delta = parse_sse_data(data)
+        if delta is None:
+            return deltas, True
+        if delta:
+            deltas.append(delta)
+    return deltas, chunk is None
+
+
+def iter_deltas(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Decode the generated text from the raw chunks of a streamed chat
+    completion, until the stream is done.
+
+    Returns:
+        an iterator of the non-empty pieces of generated text.
+
+    Raises:
+        the exceptions of parse_sse_data
+    """
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        deltas, done = decode_deltas(decoder, chunk)
+        yield from deltas
+        if done:
+            return
+    yield from decode_deltas(decoder, None)[0]
+
+
+def request_stream_chat(
+    prompt: str,
+    print_chunk: Callable[[str], None],
+    history: list[dict] | None = None,
+) -> tuple[int, str]:
+    """
+    Stream the selected model's response to prompt, without the cache, in
+    the calling thread. stream_chat runs it as a Generation.
+
+    Args:
+        prompt: The prompt to send to the LLM.
+        print_chunk: called with each piece of the response as it arrives
+        history: the earlier turns of the conversation, sent before prompt
+
+    Returns:
+        a tuple of the return code and the response, like stream_generate.
+    """
+    url = config.gen_request_url()
+    payload = chat_payload(prompt, stream=True, history=history)
+    parts = []
+    try:
+        with StreamRequest(
+            "POST", url, json=payload, headers=chat_headers
+        ) as stream:
+            for delta in iter_deltas(stream.iter_bytes()):
+                parts.append(delta)
+                print_chunk(delta)
 
     except (KeyError, IndexError):
-        output.console.width = prev_width
         return 1, "Couldn't find response from JSON: Invalid output"
 
     except json.decoder.JSONDecodeError:
-        output.console.width = prev_width
         return 1, "Couldn't decode JSON response"
 
     except StreamError as e:
-        output.console.width = prev_width
         return 1, str(e)
 
-    output.console.width = prev_width
-    return 0, stream_txt.plain
+    return 0, "".join(parts)
 
 
-def generate(prompt: str) -> tuple[int, str]:
+def stream_chat(
+    prompt: str,
+    print_chunk: Callable[[str], None],
+    history: list[dict] | None = None,
+) -> tuple[int, str]:
+    """
+    Stream the selected model's response to prompt, without the cache.
+    Ctrl-C cancels it, and nothing more is printed once it's cancelled.
+
+    Args:
+        prompt: The prompt to send to the LLM.
+        print_chunk: called with each piece of the response as it arrives
+        history: the earlier turns of the conversation, sent before prompt
+
+    Returns:
+        a tuple of the return code and the response, like stream_generate.
+
+    Raises:
+        KeyboardInterrupt: once the generation is cancelled by Ctrl-C
+    """
+    generation = Generation(request_stream_chat)
+    generation.start(prompt, generation.guard(print_chunk), history)
+    return generation.wait()
+
+
+def stream_generate(prompt: str) -> tuple[int, str]:
+    """
+    Generate LLM response by streaming the generated text.
+    Note: This function prints to stdout and also ignores reasoning output
+    Args:
+        prompt: The prompt to send to the LLM.
+
+    Returns:
+        a tuple of the return code and the response. The return code is 0 if the
+        response is ok, 1 otherwise. The response is the error message if the
+        request fails and the return code is 1.
+    """
+    cached = cache.lookup(selected_model, prompt, system_prompt)
+    with output.live_message() as print_chunk:
+        if cached is not None:
+            print_chunk(cached)
+            return 0, cached
+        stat, res = stream_chat(prompt, print_chunk)
+    if stat == 0:
+        cache.store(selected_model, prompt, res, system_prompt)
+    return stat, res
+
+
+def generate(
+    prompt: str,
+    use_cache: bool = True,
+    history: list[dict] | None = None,
+    system: str | None = None,
+) -> tuple[int, str]:
     """
     generates a response by prompting the selected_model.
     Args:
         prompt: the prompt to send to the LLM.
+        use_cache: whether to look the response up in the cache, and store it
+            there
+        history: the earlier turns of the conversation, sent before prompt.
+            The responses that follow them aren't cached.
+        system: the system message, system_prompt by default
     Returns:
         a tuple of the return code and the response. The return code is 0 if the
         response is ok, 1 otherwise. The response is the error message if the
         request fails and the return code is 1.
+
+    Raises:
+        KeyboardInterrupt: once the generation is cancelled by Ctrl-C
     """
-    url = config.gen_request_url()
     if selected_model is None:
-        return 1, (
-            "No model selected. You must use the start command to specify "
-            "which model to use before generating.\n"
-            "Example: start model_name"
-        )
-    head = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer ollama",
-    }
-    message = [{"role": "user", "content": prompt}]
-    payload = {"model": selected_model, "messages": message, "stream": False}
-    r = HttpRequest("POST", url, json=payload, headers=head)
+        return 1, no_model_error
+    use_cache = use_cache and not history
+    system = system_prompt if system is None else system
+    if use_cache:
+        cached = cache.lookup(selected_model, prompt, system)
+        if cached is not None:
+            return 0, cached
+    stat, res = Generation(request_chat).start(prompt, history, system).wait()
+    if stat == 0 and use_cache:
+        cache.store(selected_model, prompt, res, system)
+    return stat, res
+
+
+def request_chat(
+    prompt: str,
+    history: list[dict] | None = None,
+    system: str | None = None,
+) -> tuple[int, str]:
+    """
+    Prompt the selected model without streaming nor the cache, in the
+    calling thread. generate runs it as a Generation.
+
+    Returns:
+        a tuple of the return code and the response, like generate.
+    """
+    url = config.gen_request_url()
+    payload = chat_payload(prompt, stream=False, history=history, system=system)
+    r = HttpRequest("POST", url, json=payload, headers=chat_headers)
     if r.is_error():
         return 1, r.err_message()
     elif r.return_code == 200:
@@ -439,7 +1043,116 @@ def generate(prompt: str) -> tuple[int, str]:
         return r.return_code, error_msg
 
 
-def regenerate(prompt: str) -> None:
+def generate_candidates(
+    prompt: str, n: int, stream: bool = False
+) -> list[tuple[int, str]]:
+    """
+    Generate n responses to the same prompt at once, each over its own
+    pooled connection, so a server running requests in parallel takes about
+    as long as for one. The cache is bypassed, since it would give the same
+    response n times. If stream is set, the responses are printed side by
+    side as they're streamed.
+
+    The requests are sent separately rather than as one with the "n" field,
+    which Ollama ignores.
+
+    Returns:
+        the return code and the response of each candidate, as returned by
+        generate, in order.
+    """
+    if selected_model is None:
+        return [generate(prompt)] * n
+    if not stream:
+        return wait_all(
+            [Generation(request_chat).start(prompt) for _ in range(n)]
+        )
+    with output.live_candidates(n) as print_chunk:
+        generations = []
+        for i in range(n):
+            generation = Generation(request_stream_chat)
+            generation.start(
+                prompt, generation.guard(functools.partial(print_chunk, i))
+            )
+            generations.append(generation)
+        return wait_all(generations)
+
+
+def wait_all(generations: list[Generation]) -> list[tuple[int, str]]:
+    """
+    Wait for all the generations to finish. Ctrl-C cancels all of them.
+
+    Returns:
+        the return code and the response of each generation, in order.
+    """
+    try:
+        return [generation.wait() for generation in generations]
+    except KeyboardInterrupt:
+        for generation in generations:
+            generation.cancel()
+        raise
+
+
+class Conversation:
+    """
+    The chat a commit message came from: the generation prompt, the model's
+    drafts and the user's feedback on them.
+
+    Follow-ups are sent as new turns after the whole history, which is never
+    modified, and the drafts are kept as the model wrote them (not wrapped).
+    Every request then starts with the previous one, so a server that keeps
+    its last prompts' KV cache, like Ollama, only has to process the new turn
+    instead of the whole diff again.
+    """
+
+    def __init__(self, prompt: str, response: str):
+        """
+        Args:
+            prompt: the prompt the first message was generated from
+            response: the model's response to it
+        """
+        self.messages: list[dict] = []
+        self.add_turn(prompt, response)
+
+    def add_turn(self, prompt: str, response: str) -> None:
+        self.messages += [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": response},
+        ]
+
+    def follow_up(self, feedback: str) -> str:
+        """
+        Build the prompt asking for a new draft, following the feedback if
+        any is given.
+        """
+        if feedback == "":
+            return retry_prompt
+        return refine_prompt.format(feedback=feedback)
+
+
+def regenerate(feedback: str = "") -> tuple[int, str]:
     """
-    regenerate commit message based on prompt
+    Generate a new draft of the last message, continuing its conversation.
+    The new draft is streamed if config.STREAM is set.
+
+    Args:
+        feedback: what to change, e.g. "shorter". Without it, a different
+            message is asked for.
+
+    Returns:
+        a tuple of the return code and the new draft, like generate.
     """
+    if conversation is None:
+        return 1, "No message to regenerate. Use gen first."
+    if selected_model is None:
+        return 1, no_model_error
+    prompt = conversation.follow_up(feedback)
+    if config.STREAM:
+        with output.live_message() as print_chunk:
+            stat, res = stream_chat(
+                prompt, print_chunk, history=conversation.messages
+            )
+    else:
+        stat, res = generate(prompt, history=conversation.messages)
+    if stat == 0:
+        conversation.add_turn(prompt, res)
+    return stat, res
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import concurrent.futures
+
+from . import compaction, config, llm_providers
+
+# the system message of the map step's requests
+summary_system_prompt = """
+You are an assistant that summarizes part of a Git diff for someone who will
+write the commit message from several such summaries.
+
+Guidelines:
+- Describe what changed in each file, and why if it's apparent, in one to three
+short sentences per file.
+- Mention the names of the files, functions, and settings involved.
+- Do not include anything except the summary itself.
+"""
+
+summary_prompt = """
+Here is the part of the diff:
+"""
+
+# the reduce step is sent after llm_providers.system_prompt, like any other
+# generation
+reduce_prompt = """
+The diff was too large to read at once, so here are summaries of its parts
+instead. Write a single commit message covering all of them.
+
+Here are the summaries:
+"""
+
+
+def split_diff(diff: str, max_tokens: int) -> list[str]:
+    """
+    Split a sanitized diff into chunks of whole files that each fit
+    max_tokens. A file too large for a chunk is split between its hunks, and
+    a hunk too large for a chunk is compacted.
+
+    Returns:
+        the chunks, in the order of the diff.
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+
+    def add(text: str) -> None:
+        nonlocal size
+        tokens = compaction.estimate_tokens(text) + 1
+        if current and size + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current.clear()
+            size = 0
+        current.append(text)
+        size += tokens
+
+    for f in compaction.parse_diff(diff):
+        text = f.text()
+        if compaction.estimate_tokens(text) <= max_tokens:
+            add(text)
+            continue
+        # Every part of the file repeats its header, so each chunk tells
+        # which file it's about.
+        for hunk in f.hunks:
+            part = f"{f.header_text()}\n{hunk.text()}"
+            if compaction.estimate_tokens(part) > max_tokens:
+                part, _, _ = compaction.compact_diff(part, max_tokens - 1)
+            add(part)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def summarize(chunks: list[str]) -> tuple[int, list[str]]:
+    """
+    Summarize the chunks of a diff concurrently, with at most
+    config.MAX_CONCURRENCY requests in flight.
+
+    Returns:
+        a tuple of the return code and the summaries, in the order of the
+        chunks. If a request fails, the return code is non-zero and the list
+        holds its error message only.
+    """
+    workers = max(1, min(config.MAX_CONCURRENCY, len(chunks)))
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    futures = [
+        pool.submit(
+            llm_providers.generate,
+            summary_prompt + chunk,
+            system=summary_system_prompt,
+        )
+        for chunk in chunks
+    ]
+    summaries = []
+    try:
+        for future in futures:
+            stat, res = future.result()
+            if stat != 0:
+                return stat, [res]
+            summaries.append(res.strip())
+    finally:
+        # don't wait for the remaining requests after a failure or Ctrl-C
+        pool.shutdown(wait=False, cancel_futures=True)
+    return 0, summaries
+
+
+def build_prompt(diff: str, max_tokens: int) -> tuple[int, str]:
+    """
+    Run the map step over a diff too large for the prompt: split it into
+    chunks that fit max_tokens and summarize them concurrently.
+
+    Returns:
+        a tuple of the return code and the prompt of the reduce step, which
+        asks for a commit message covering all the summaries. The prompt is
+        the error message if a summary fails.
+    """
+    chunk_tokens = max_tokens - compaction.estimate_tokens(
+        summary_system_prompt + summary_prompt
+    )
+    chunks = split_diff(diff, chunk_tokens)
+    stat, summaries = summarize(chunks)
+    if stat != 0:
+        return stat, summaries[0]
+    return 0, reduce_prompt + "\n\n".join(
+        f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1)
+    )
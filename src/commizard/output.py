@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
 from rich.console import Console
 
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
 console: Console = Console()
 error_console: Console = Console(stderr=True)
 
@@ -49,6 +55,119 @@ def print_generated(message: str) -> None:
     console.print(f"[blue]{message}[/blue]")
 
 
+@contextmanager
+def live_message(
+    refresh_per_second: float = 30,
+) -> Iterator[Callable[[str], None]]:
+    """
+    Live-print a commit message as it's being streamed. The title is wrapped at
+    50 characters and the body at 72.
+
+    Each completed paragraph is printed once, above the live display, so that
+    redrawing only lays out the paragraph that's still being written. The
+    chunks that arrive between two frames are drawn together.
+
+    Yields:
+        a function that prints the next chunk of the message
+    """
+    import time
+
+    from rich.constrain import Constrain
+    from rich.live import Live
+    from rich.text import Text
+
+    tail = Text(style="blue")  # the paragraph being written
+    view = Constrain(tail, width=50)
+    pending: list[str] = []
+    interval = 1 / refresh_per_second
+    last_draw = 0.0
+
+    def draw(live: Live) -> None:
+        text = tail.plain + "".join(pending)
+        pending.clear()
+        *done, rest = text.split("\n\n")
+        # the live display is redrawn under each printed paragraph, so it
+        # must not show them anymore
+        tail.plain = rest
+        for paragraph in done:
+            width = view.width
+            view.width = 72
+            live.console.print(Text(paragraph, style="blue"), width=width)
+            live.console.print()
+        live.refresh()
+
+    with Live(
+        view,
+        console=console,
+        auto_refresh=False,
+        vertical_overflow="visible",
+    ) as live:
+
+        def print_chunk(delta: str) -> None:
+            nonlocal last_draw
+            pending.append(delta)
+            now = time.monotonic()
+            if now - last_draw >= interval:
+                last_draw = now
+                draw(live)
+
+        try:
+            yield print_chunk
+        finally:
+            draw(live)
+
+
+@contextmanager
+def live_candidates(
+    n: int, refresh_per_second: float = 30
+) -> Iterator[Callable[[int, str], None]]:
+    """
+    Live-print n commit messages side by side as they're being streamed, each
+    in its own column. The chunks can be printed from several threads at
+    once.
+
+    Yields:
+        a function that prints the next chunk of the candidate at an index
+    """
+    import threading
+    import time
+
+    from rich.live import Live
+    from rich.table import Table
+    from rich.text import Text
+
+    texts = [Text(style="blue") for _ in range(n)]
+    table = Table(expand=True, show_lines=False)
+    for i in range(n):
+        table.add_column(f"Candidate {i + 1}", ratio=1, overflow="fold")
+    table.add_row(*texts)
+    lock = threading.Lock()
+    interval = 1 / refresh_per_second
+    last_draw = 0.0
+
+    with Live(
+        table,
+        console=console,
+        auto_refresh=False,
+        vertical_overflow="visible",
+    ) as live:
+
+        def print_chunk(index: int, delta: str) -> None:
+            nonlocal last_draw
+            with lock:
+                texts[index].append(delta)
+                now = time.monotonic()
+                if now - last_draw >= interval:
+                    last_draw = now
+                    live.refresh()
+
+        try:
+            yield print_chunk
+        finally:
+            with lock:
+                live.refresh()
+
+
 def print_table(
     cols: list[str], rows: list[list[str]], title: str | None = None
 ) -> None:
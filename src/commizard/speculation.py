@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import cache, config, git_utils, llm_providers
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+def fingerprint(top: str) -> tuple | None:
+    """
+    Identify the state of the working tree's changes without reading them:
+    the changed files' line counts from "git diff --numstat", along with
+    their sizes and modification times, which tell edits that keep the line
+    counts apart.
+
+    Args:
+        top: the repository's root
+
+    Returns:
+        a tuple that's equal for the same changes, empty if there are none.
+        None if git failed.
+    """
+    scope: git_utils.DiffScope | None = git_utils.DiffScope()
+    if config.TRACK_CHANGES:
+        from . import tracker
+
+        scope = tracker.narrow_scope(git_utils.DiffScope())
+        if scope is None:
+            return ()
+    stats = git_utils.diff_numstat(scope, cwd=top)
+    if stats is None:
+        return None
+    files: list[tuple] = []
+    for added, removed, path in stats:
+        try:
+            st = (Path(top) / path).stat()
+            files.append((added, removed, path, st.st_size, st.st_mtime_ns))
+        except OSError:
+            # deleted
+            files.append((added, removed, path, None, None))
+    return tuple(files)
+
+
+class Speculation:
+    """
+    Generate the response to a prompt into the cache, in a background
+    thread.
+
+    The request is a streamed Generation, so cancelling it closes its
+    response, even before the first chunk arrives.
+    """
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.model = llm_providers.selected_model
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.generation = llm_providers.Generation(
+            llm_providers.request_stream_chat
+        )
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        self.generation.cancel()
+
+    def run(self) -> None:
+        try:
+            if cache.contains(
+                self.model, self.prompt, llm_providers.system_prompt
+            ):
+                return
+            stat, res = self.generation.start(
+                self.prompt, lambda delta: None
+            ).wait()
+            if stat == 0 and not self.cancelled.is_set():
+                cache.store(
+                    self.model, self.prompt, res, llm_providers.system_prompt
+                )
+        finally:
+            self.finished.set()
+
+
+class Watcher:
+    """
+    Watch the working tree's changes by polling their fingerprint, and once
+    they've been still for config.WATCH_DEBOUNCE seconds, speculatively
+    generate their message, so "gen" finds it in the cache. A speculation is
+    cancelled as soon as the changes it describes are edited again.
+    """
+
+    def __init__(
+        self,
+        build_prompt: Callable[[], str | None],
+        top: str,
+        interval: float | None = None,
+        debounce: float | None = None,
+    ):
+        """
+        Args:
+            build_prompt: builds the prompt "gen" would send for the current
+                changes, or returns None if they shouldn't be speculated on
+            top: the repository's root
+            interval: the seconds between two polls, config.WATCH_INTERVAL by
+                default
+            debounce: the seconds the changes must be still for,
+                config.WATCH_DEBOUNCE by default
+        """
+        self.build_prompt = build_prompt
+        self.top = top
+        self.interval = config.WATCH_INTERVAL if interval is None else interval
+        self.debounce = config.WATCH_DEBOUNCE if debounce is None else debounce
+        self.last: tuple | None = None
+        self.changed_at = 0.0
+        self.speculated: tuple | None = None
+        self.job: Speculation | None = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.cancel()
+
+    def cancel(self) -> None:
+        with self.lock:
+            if self.job is not None:
+                self.job.cancel()
+                self.job = None
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.poll(time.monotonic())
+            self.stopped.wait(self.interval)
+
+    def poll(self, now: float) -> None:
+        """
+        Check the changes once, cancelling the current speculation if they
+        were edited, or starting one if they've been still long enough.
+        """
+        current = fingerprint(self.top)
+        if current != self.last:
+            self.last = current
+            self.changed_at = now
+            self.speculated = None
+            self.cancel()
+        elif (
+            current
+            and current != self.speculated
+            and now - self.changed_at >= self.debounce
+        ):
+            self.speculated = current
+            prompt = self.build_prompt()
+            if prompt is None:
+                return
+            job = Speculation(prompt)
+            with self.lock:
+                if self.stopped.is_set():
+                    return
+                self.job = job
+            job.start()
+
+    def wait_for(self, prompt: str) -> None:
+        """
+        Wait for the speculation on prompt to finish, if one is running, so
+        its response is read from the cache instead of being requested
+        twice.
+        """
+        with self.lock:
+            job = self.job
+        if job is not None and job.prompt == prompt:
+            job.finished.wait()
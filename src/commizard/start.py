@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import functools
+import threading
+from typing import TYPE_CHECKING, Any
+
 from rich.color import Color
 from rich.console import Console
 
 from . import git_utils, llm_providers
 
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
 text_banner = r"""
  ██████╗ ██████╗ ███╗   ███╗███╗   ███╗██╗███████╗ █████╗ ██████╗ ██████╗
 ██╔════╝██╔═══██╗████╗ ████║████╗ ████║██║╚══███╔╝██╔══██╗██╔══██╗██╔══██╗
@@ -16,6 +23,21 @@ text_banner = r"""
 """
 
 
+def gradient_rgb(
+    start_color: Color, end_color: Color, i: int, total: int
+) -> tuple[int, int, int]:
+    """
+    The color of the i-th of total columns of a horizontal gradient.
+    """
+    start_rgb = start_color.get_truecolor()
+    end_rgb = end_color.get_truecolor()
+    r, g, b = (
+        int(start_rgb[k] + (end_rgb[k] - start_rgb[k]) * (i / total))
+        for k in range(3)
+    )
+    return r, g, b
+
+
 def gradient_text(text: str, start_color: Color, end_color: Color) -> str:
     """
     Apply a horizontal gradient across the given ASCII art text.
@@ -36,22 +58,7 @@ def gradient_text(text: str, start_color: Color, end_color: Color) -> str:
         return text  # Return original text if colors are not valid
 
     for i in range(total_chars):
-        # Calculate RGB gradient values
-        r = int(
-            start_color.triplet[0]
-            + (end_color.triplet[0] - start_color.triplet[0])
-            * (i / total_chars)
-        )
-        g = int(
-            start_color.triplet[1]
-            + (end_color.triplet[1] - start_color.triplet[1])
-            * (i / total_chars)
-        )
-        b = int(
-            start_color.triplet[2]
-            + (end_color.triplet[2] - start_color.triplet[2])
-            * (i / total_chars)
-        )
+        r, g, b = gradient_rgb(start_color, end_color, i, total_chars)
         color_str = f"[#{r:02x}{g:02x}{b:02x}]"
         for j in range(len(lines)):
             # Don't index into shorter lines
@@ -65,6 +72,54 @@ def gradient_text(text: str, start_color: Color, end_color: Color) -> str:
     return "\n".join(result_lines)
 
 
+@functools.cache
+def gradient_banner(start: str, end: str, color_system: str) -> str:
+    """
+    Render the banner with a horizontal gradient straight into ANSI escape
+    codes. Unlike printing gradient_text's markup, which Rich has to parse tag
+    by tag, this takes well under a millisecond, and it's cached for each
+    theme and color system.
+
+    Args:
+        start: the gradient's starting color, e.g. "#FF5E00"
+        end: the gradient's ending color
+        color_system: the console's color system, "truecolor" or "256"
+
+    Returns:
+        the banner, ready to be written to the terminal.
+    """
+    from rich.color import ColorSystem
+    from rich.style import Style
+
+    system = {
+        "truecolor": ColorSystem.TRUECOLOR,
+        "256": ColorSystem.EIGHT_BIT,
+    }[color_system]
+    start_color = Color.parse(start)
+    end_color = Color.parse(end)
+    lines = text_banner.splitlines()
+    total_chars = max(len(line) for line in lines)
+    styles = [
+        Style(
+            color=Color.from_rgb(
+                *gradient_rgb(start_color, end_color, i, total_chars)
+            )
+        )
+        for i in range(total_chars)
+    ]
+    rendered = []
+    for line in lines:
+        rendered.append(
+            "".join(
+                char
+                if char.isspace()  # don't color whitespace
+                else styles[i].render(char, color_system=system)
+                for i, char in enumerate(line)
+            )
+        )
+    return "\n".join(rendered) + "\n"
+
+
 def print_welcome(color: bool) -> None:
     """
     Print the welcome screen. Right now it's the ASCII art of the project's
@@ -82,9 +137,8 @@ def print_welcome(color: bool) -> None:
         ]
         theme = rand.choice(colors)
         s, e = rand.sample(theme, 2)
-        start_color = Color.parse(s)
-        end_color = Color.parse(e)
-        console.print(gradient_text(text_banner, start_color, end_color))
+        console.file.write(gradient_banner(s, e, console.color_system))
+        console.file.flush()
 
     # don't use the gradient function for terminals that don't support it:
     else:
@@ -121,3 +175,57 @@ def is_inside_working_tree() -> bool:
     commands)
     """
     return git_utils.is_inside_working_tree()
+
+
+def check_git() -> str | None:
+    """
+    Check if git is installed, and if we're inside a working tree.
+
+    Returns:
+        the error message if either isn't the case, None otherwise.
+    """
+    if not check_git_installed():
+        return "git not installed"
+    if not is_inside_working_tree():
+        return "not inside work tree"
+    return None
+
+
+class BackgroundCheck:
+    """
+    Runs a startup check on a daemon thread, so neither the prompt nor exiting
+    the program waits for it, unless its result is asked for.
+
+    Example usage:
+        check = BackgroundCheck(local_ai_available)
+        ...
+        if check.done() and not check.result():
+            print("local AI not available")
+    """
+
+    def __init__(self, check: Callable[[], Any]):
+        self._result: Any = None
+        self._done = threading.Event()
+        threading.Thread(target=self._run, args=(check,), daemon=True).start()
+
+    def _run(self, check: Callable[[], Any]) -> None:
+        try:
+            self._result = check()
+        except Exception:  # noqa: BLE001
+            # a traceback would be printed over the prompt otherwise
+            self._result = None
+        finally:
+            self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def result(self) -> Any:
+        """
+        Wait for the check to finish.
+
+        Returns:
+            the check's result, or None if it raised an exception.
+        """
+        self._done.wait()
+        return self._result
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+
+from . import config, git_utils
+
+# inotify's event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# what changes a file's diff: its content, its mode, or its presence
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+)
+# git replaces the index by renaming index.lock over it
+GIT_DIR_MASK = IN_MOVED_TO | IN_CLOSE_WRITE | IN_ONLYDIR
+
+# struct inotify_event, followed by its name
+EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    A minimal binding of Linux's inotify, through ctypes. Events are read
+    without blocking, whenever they're needed.
+
+    Raises:
+        OSError: if inotify isn't available
+    """
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        import ctypes
+        import ctypes.util
+
+        self.ctypes = ctypes
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._init = libc.inotify_init1
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        )
+        # IN_NONBLOCK and IN_CLOEXEC are O_NONBLOCK and O_CLOEXEC on Linux
+        self.fd = self._init(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            self.raise_errno("inotify_init1")
+
+    def raise_errno(self, what: str) -> None:
+        err = self.ctypes.get_errno()
+        raise OSError(err, f"{what}: {os.strerror(err)}")
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """
+        Watch a directory.
+
+        Returns:
+            the watch descriptor, which the directory's events carry.
+
+        Raises:
+            OSError: if it can't be watched, e.g. because it was deleted or
+                there are too many watches (fs.inotify.max_user_watches)
+        """
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            self.raise_errno(f"inotify_add_watch {path}")
+        return wd
+
+    def read(self) -> list[tuple[int, int, str]]:
+        """
+        Get the events that happened since the last read.
+
+        Returns:
+            a list of tuples of each event's watch descriptor, mask and name.
+        """
+        events: list[tuple[int, int, str]] = []
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ChangeTracker:
+    """
+    Keep the set of the working tree's paths that may have changed, from
+    inotify events on the tracked files' directories, so that diffs only make
+    git look at those files instead of rescanning the whole tree.
+
+    The set is seeded by a full scan ("git diff --name-only"), and reseeded by
+    one whenever the events can't be trusted: the event queue overflowed, a
+    directory was moved, the index was written (e.g. by "git add" or "git
+    reset"), or more than config.TRACK_MAX_PATHS paths piled up. It may hold
+    paths that are unchanged again, which git then simply skips. Moves and
+    index writes also rebuild the watches, as they change which directories
+    hold tracked files.
+    """
+
+    def __init__(self, top: str, git_dir: str):
+        """
+        Args:
+            top: the repository's root
+            git_dir: the repository's git directory, whose index is watched
+        """
+        self.top = top
+        self.git_dir = git_dir
+        self.inotify: Inotify | None = None
+        self.git_wd = -1
+        # the watched directories by their descriptors, relative to top
+        self.dirs: dict[int, str] = {}
+        # None when a full scan is needed
+        self.dirty: set[str] | None = None
+        # whether the directories' paths may be outdated, after a move
+        self.stale = True
+        self.lock = threading.Lock()
+
+    def watch_tree(self) -> None:
+        """
+        Watch the directories of all the tracked files, and the git directory,
+        from scratch.
+
+        Raises:
+            OSError: if they can't be watched, or git failed
+        """
+        if self.inotify is not None:
+            self.inotify.close()
+        self.inotify = Inotify()
+        self.dirs = {}
+        self.git_wd = self.inotify.add_watch(self.git_dir, GIT_DIR_MASK)
+        out = git_utils.run_git_command(["ls-files", "-z"], self.top)
+        if out.returncode != 0:
+            raise OSError("git ls-files failed")
+        dirs = {""}
+        for path in out.stdout.split("\0"):
+            parent = path.rpartition("/")[0]
+            while parent not in dirs:
+                dirs.add(parent)
+                parent = parent.rpartition("/")[0]
+        for d in dirs:
+            # a deleted directory's nearest parent left sees it come back
+            with contextlib.suppress(FileNotFoundError, NotADirectoryError):
+                self.watch(d)
+        self.stale = False
+
+    def watch(self, d: str) -> None:
+        if self.inotify is not None:
+            wd = self.inotify.add_watch(str(Path(self.top) / d), WATCH_MASK)
+            self.dirs[wd] = d
+
+    def watch_new(self, d: str) -> None:
+        """
+        Watch a new directory and the directories already created in it,
+        e.g. by a checkout, which don't get events of their own.
+        """
+        for root, _, _ in os.walk(Path(self.top) / d):
+            with contextlib.suppress(OSError):
+                self.watch(Path(root).relative_to(self.top).as_posix())
+
+    def handle(self, wd: int, mask: int, name: str) -> None:
+        """
+        Record an event's path as changed, or note that a full scan is needed.
+        """
+        if mask & IN_Q_OVERFLOW:
+            self.dirty = None
+            return
+        if wd == self.git_wd and name == "index":
+            # newly tracked files may be in directories that aren't watched
+            self.stale = True
+            self.dirty = None
+            return
+        d = self.dirs.get(wd)
+        if d is None or wd == self.git_wd:
+            return
+        if mask & IN_IGNORED:
+            # the directory was deleted
+            del self.dirs[wd]
+            return
+        if not name or (d == "" and name == ".git"):
+            return
+        path = f"{d}/{name}" if d else name
+        if mask & IN_ISDIR and mask & (IN_MOVED_FROM | IN_MOVED_TO):
+            self.stale = True
+            self.dirty = None
+            return
+        if mask & IN_ISDIR and mask & IN_CREATE:
+            # the files created in it before it's watched are covered by
+            # the directory's own path
+            self.watch_new(path)
+        if self.dirty is not None:
+            self.dirty.add(path)
+
+    def scan(self) -> set[str] | None:
+        """
+        Get the changed files by scanning the whole working tree.
+        """
+        out = git_utils.run_git_command(
+            ["--no-pager", "diff", "--name-only", "-z"], self.top
+        )
+        if out.returncode != 0:
+            return None
+        return {path for path in out.stdout.split("\0") if path}
+
+    def changed_paths(self) -> set[str] | None:
+        """
+        Get the paths that may have changed compared to the index, relative
+        to the repository's root. Directories stand for everything in them.
+
+        Returns:
+            the paths, or None if they're unknown and the whole tree must be
+            diffed.
+
+        Raises:
+            OSError: if the tree can't be watched anymore
+        """
+        with self.lock:
+            if self.inotify is not None and not self.stale:
+                for event in self.inotify.read():
+                    self.handle(*event)
+            if self.stale:
+                self.watch_tree()
+                self.dirty = None
+            if (
+                self.dirty is not None
+                and len(self.dirty) > config.TRACK_MAX_PATHS
+            ):
+                # reseed it without the paths that are unchanged again
+                self.dirty = None
+            if self.dirty is None:
+                # collect the events during the scan too
+                self.dirty = set()
+                scanned = self.scan()
+                if scanned is None:
+                    self.dirty = None
+                    return None
+                self.dirty |= scanned
+            if len(self.dirty) > config.TRACK_MAX_PATHS:
+                return None
+            return set(self.dirty)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
+
+
+_tracker: ChangeTracker | None = None
+# set once tracking failed, so it isn't tried again
+_failed = False
+_tracker_lock = threading.Lock()
+
+
+def get_tracker() -> ChangeTracker | None:
+    """
+    Get the change tracker of the current directory's repository, creating it
+    on the first call.
+
+    Returns:
+        the tracker, or None if tracking is disabled or isn't possible here.
+    """
+    global _tracker, _failed
+    with _tracker_lock:
+        if _tracker is not None or _failed or not config.TRACK_CHANGES:
+            return _tracker
+        out = git_utils.run_git_command(
+            ["rev-parse", "--show-toplevel", "--absolute-git-dir"]
+        )
+        lines = out.stdout.splitlines()
+        if out.returncode != 0 or len(lines) != 2:
+            _failed = True
+            return None
+        tracker = ChangeTracker(lines[0], lines[1])
+        try:
+            tracker.changed_paths()
+        except OSError:
+            tracker.close()
+            _failed = True
+            return None
+        _tracker = tracker
+        return _tracker
+
+
+def stop() -> None:
+    """
+    Stop tracking the changes, and fall back to full scans.
+    """
+    global _tracker, _failed
+    with _tracker_lock:
+        if _tracker is not None:
+            _tracker.close()
+        _tracker = None
+        _failed = True
+
+
+def narrow_scope(scope: git_utils.DiffScope) -> git_utils.DiffScope | None:
+    """
+    Restrict the unstaged changes of the whole tree to the paths the tracker
+    saw change, so git doesn't scan the rest of the tree. Other scopes, and
+    any scope when there's no tracker, are returned as is.
+
+    Returns:
+        the narrowed scope, or None if nothing changed.
+    """
+    if scope.staged or scope.paths:
+        return scope
+    tracker = get_tracker()
+    if tracker is None:
+        return scope
+    try:
+        paths = tracker.changed_paths()
+    except OSError:
+        stop()
+        return scope
+    if paths is None:
+        return scope
+    if not paths:
+        return None
+    return git_utils.DiffScope(
+        paths=[f":(top,literal){path}" for path in sorted(paths)],
+        exclude=scope.exclude,
+    )
@@ -0,0 +1,84 @@
+"""
+Guard the startup latency: trivial invocations must not import the heavy
+dependencies, and the session must get to its prompt without requests.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+# the budgets of the imports of "commizard --version" (or --help), and of
+# everything the interactive session needs before its prompt, in milliseconds
+VERSION_BUDGET_MS = 25
+PROMPT_BUDGET_MS = 100
+
+HEAVY_MODULES = ("rich", "requests", "urllib3", "pyperclip")
+# only needed once a command talks to the server or copies a message
+SESSION_LAZY_MODULES = ("requests", "urllib3", "pyperclip")
+
+# what "commizard ARG" runs
+RUN_CLI = """
+import sys
+sys.argv = ["commizard", "{arg}"]
+from commizard import cli
+cli.main()
+"""
+
+# what cli.main imports before its first prompt
+IMPORT_SESSION = """
+import concurrent.futures
+from commizard import cli
+from commizard import git_utils, llm_providers, output, start
+from commizard import commands
+"""
+
+
+def import_times(code: str) -> dict[str, int]:
+    """
+    Run code with -X importtime.
+
+    Returns:
+        the cumulative import time of each top-level import, in microseconds,
+        along with every module imported (as 0).
+    """
+    out = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert out.returncode == 0, out.stderr
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # nested imports are indented
+        top_level = not name.startswith("  ")
+        times[name.strip()] = int(cumulative) if top_level else 0
+    return times
+
+
+def best_time_ms(code: str, modules: tuple[str, ...], runs: int = 5) -> float:
+    return min(
+        sum(import_times(code).get(m, 0) for m in modules) / 1000
+        for _ in range(runs)
+    )
+
+
+@pytest.mark.parametrize("arg", ["--version", "--help"])
+def test_trivial_invocation_imports(arg):
+    code = RUN_CLI.format(arg=arg)
+    times = import_times(code)
+    heavy = [m for m in times if m.split(".")[0] in HEAVY_MODULES]
+    assert heavy == []
+    assert best_time_ms(code, ("commizard.cli",)) < VERSION_BUDGET_MS
+
+
+def test_prompt_imports():
+    times = import_times(IMPORT_SESSION)
+    heavy = [m for m in times if m.split(".")[0] in SESSION_LAZY_MODULES]
+    assert heavy == []
+    modules = tuple(m for m in times if m.startswith("commizard"))
+    assert best_time_ms(IMPORT_SESSION, modules) < PROMPT_BUDGET_MS
@@ -0,0 +1,39 @@
+import pytest
+
+from commizard import config, git_utils
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """
+    Keep the response cache of every test in its own directory, so tests
+    never read or fill the user's cache, nor each other's.
+    """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture(autouse=True)
+def no_file_exclusion(monkeypatch):
+    """
+    The tests mock git's diff, so don't run the real git to find the files to
+    leave out of it. The tests of the exclusion turn it back on.
+    """
+    monkeypatch.setattr(config, "EXCLUDE_FILES", False)
+
+
+@pytest.fixture(autouse=True)
+def no_change_tracking(monkeypatch):
+    """
+    Don't watch the working tree with inotify, which the tests of the
+    tracker turn back on.
+    """
+    monkeypatch.setattr(config, "TRACK_CHANGES", False)
+
+
+@pytest.fixture(autouse=True)
+def fresh_toplevels(monkeypatch):
+    """
+    Forget the repositories' roots found by other tests, which may have
+    mocked git.
+    """
+    monkeypatch.setattr(git_utils, "_toplevels", {})
@@ -0,0 +1,153 @@
+import io
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from commizard import backfill, config
+
+LOG = b"""\x01aaa
+diff --git a/x b/x
+index 1..2 100644
+--- a/x
++++ b/x
+@@ -1 +1 @@
+-a
++b
+\x01bbb
+\x01ccc
+diff --git a/y b/y
+--- a/y
++++ b/y
+@@ -0,0 +1,3 @@
++1
++22
++333
+"""
+
+
+def fake_popen(stdout: bytes, returncode: int = 0):
+    proc = MagicMock()
+    proc.stdout = io.BytesIO(stdout)
+    proc.poll.return_value = None
+    proc.wait.return_value = returncode
+    return proc
+
+
+@patch("commizard.git_utils.subprocess.Popen")
+def test_iter_commits(mock_popen):
+    mock_popen.return_value = fake_popen(LOG)
+
+    commits = list(backfill.iter_commits("main~3..main"))
+
+    assert commits == [
+        ("aaa", "--- a/x\n+++ b/x\n@@ -1 +1 @@\n-a\n+b", False),
+        ("bbb", "", False),
+        ("ccc", "--- a/y\n+++ b/y\n@@ -0,0 +1,3 @@\n+1\n+22\n+333", False),
+    ]
+    # a single git process for the whole range
+    mock_popen.assert_called_once()
+    args = mock_popen.call_args.args[0]
+    assert args[:3] == ["git", "--no-pager", "log"]
+    assert args[-2:] == ["main~3..main", "--"]
+
+
+@patch("commizard.git_utils.subprocess.Popen")
+def test_iter_commits_truncates(mock_popen):
+    mock_popen.return_value = fake_popen(LOG)
+
+    commits = list(backfill.iter_commits("main~3..main", max_bytes=30))
+
+    assert commits[0] == ("aaa", "--- a/x\n+++ b/x\n@@ -1 +1 @@", True)
+    assert commits[1] == ("bbb", "", False)
+    assert commits[2][2] is True
+
+
+@patch("commizard.git_utils.subprocess.Popen")
+def test_iter_commits_git_error(mock_popen):
+    mock_popen.return_value = fake_popen(b"", returncode=128)
+
+    with pytest.raises(RuntimeError, match=r"git log nope\.\.main failed"):
+        list(backfill.iter_commits("nope..main"))
+
+
+def test_read_checkpoint(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    records = [
+        {"sha": "aaa", "status": "ok", "message": "Fix x"},
+        {"sha": "bbb", "status": "empty"},
+        {"sha": "ccc", "status": "error", "error": "timed out"},
+        ["not", "a", "record"],
+    ]
+    lines = [json.dumps(r) for r in records]
+    # cut short by an interruption
+    lines.append('{"sha": "ddd", "sta')
+    path.write_text("\n".join(lines))
+
+    assert backfill.read_checkpoint(str(path)) == {"aaa", "bbb"}
+    assert backfill.read_checkpoint(str(tmp_path / "missing")) == set()
+
+
+@patch("commizard.backfill.batch.describe")
+def test_describe_commit(mock_describe, monkeypatch):
+    monkeypatch.setattr(config, "MAX_DIFF_BYTES", 100)
+    mock_describe.return_value = {"status": "ok", "message": "Fix x"}
+
+    assert backfill.describe_commit("aaa", "", False) == {
+        "sha": "aaa",
+        "status": "empty",
+    }
+    mock_describe.assert_not_called()
+    assert backfill.describe_commit("aaa", "+b", True) == {
+        "sha": "aaa",
+        "status": "ok",
+        "message": "Fix x",
+    }
+    mock_describe.assert_called_once_with(
+        "+b", ["The diff was truncated to 100 bytes."]
+    )
+
+
+@patch("commizard.backfill.batch.prepare")
+@patch("commizard.backfill.batch.describe")
+@patch("commizard.git_utils.subprocess.Popen")
+def test_main_resumes(mock_popen, mock_describe, mock_prepare, tmp_path):
+    mock_popen.return_value = fake_popen(LOG)
+    mock_prepare.return_value = True
+    mock_describe.return_value = {"status": "ok", "message": "msg"}
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    checkpoint.write_text('{"sha": "aaa", "status": "ok", "message": "old"}\n')
+
+    argv = ["-m", "llama3", "--checkpoint", str(checkpoint), "main~3..main"]
+    assert backfill.main(argv) == 0
+
+    # aaa was done already, and bbb has no diff
+    mock_describe.assert_called_once()
+    records = [json.loads(line) for line in checkpoint.read_text().splitlines()]
+    assert sorted(r["sha"] for r in records) == ["aaa", "bbb", "ccc"]
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["-m", "llama3"],
+        ["-m", "llama3", "a..b", "c..d"],
+        ["-m", "llama3", "-"],
+        ["main~3..main"],
+    ],
+)
+@patch("commizard.backfill.batch.prepare")
+def test_main_invalid_args(mock_prepare, argv, capsys):
+    assert backfill.main(argv) == 2
+    mock_prepare.assert_not_called()
+    assert "commizard backfill -h" in capsys.readouterr().err
+
+
+@patch("commizard.backfill.batch.prepare")
+@patch("commizard.git_utils.subprocess.Popen")
+def test_main_git_error(mock_popen, mock_prepare, capsys):
+    mock_popen.return_value = fake_popen(b"", returncode=128)
+    mock_prepare.return_value = True
+
+    assert backfill.main(["-m", "llama3", "nope..main"]) == 1
+    assert capsys.readouterr().err == "Error: git log nope..main failed\n"
@@ -0,0 +1,239 @@
+import io
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from commizard import batch, config, git_utils, llm_providers
+
+
+def test_read_repos(tmp_path):
+    path = tmp_path / "repos.txt"
+    path.write_text("# services\n/srv/a\n\n  /srv/b  \n  # old\n/srv/c\n")
+
+    assert batch.read_repos(str(path)) == ["/srv/a", "/srv/b", "/srv/c"]
+
+
+def test_read_repos_stdin(monkeypatch):
+    monkeypatch.setattr(batch.sys, "stdin", io.StringIO("/srv/a\n/srv/b"))
+
+    assert batch.read_repos("-") == ["/srv/a", "/srv/b"]
+
+
+@pytest.mark.parametrize(
+    "argv, expected_opts, expected_args",
+    [
+        (
+            ["-m", "llama3", "a", "b"],
+            {"model": "llama3", "jobs": 2, "repos_from": None},
+            ["a", "b"],
+        ),
+        (
+            ["--jobs", "8", "--repos-from", "-", "--model", "llama3"],
+            {"model": "llama3", "jobs": 8, "repos_from": "-"},
+            [],
+        ),
+    ],
+)
+def test_parse_args(argv, expected_opts, expected_args, monkeypatch):
+    monkeypatch.setattr(config, "MAX_CONCURRENCY", 2)
+    extra = {"--repos-from": "repos_from"}
+
+    assert batch.parse_args(argv, extra) == (expected_opts, expected_args)
+
+
+def test_parse_args_no_extra():
+    assert batch.parse_args(["-m", "llama3", "a"]) == (
+        {"model": "llama3", "jobs": config.MAX_CONCURRENCY},
+        ["a"],
+    )
+    with pytest.raises(ValueError, match="Unknown option: --repos-from"):
+        batch.parse_args(["-m", "llama3", "--repos-from", "-"])
+
+
+@pytest.mark.parametrize(
+    "argv, error",
+    [
+        (["a"], "No model given"),
+        (["-m", "llama3", "--fast"], "Unknown option: --fast"),
+        (["-m"], "-m requires a value"),
+        (["-m", "llama3", "-j", "many"], "Invalid number of jobs: many"),
+        (["-m", "llama3", "-j", "0"], "must be at least 1"),
+    ],
+)
+def test_parse_args_invalid(argv, error):
+    with pytest.raises(ValueError, match=error):
+        batch.parse_args(argv)
+
+
+@patch("commizard.batch.llm_providers.generate")
+@patch("commizard.batch.git_utils.stream_clean_diff")
+@patch("commizard.batch.git_utils.is_inside_working_tree")
+def test_describe_repo(mock_inside, mock_diff, mock_gen, monkeypatch):
+    monkeypatch.setattr(config, "MAX_DIFF_BYTES", 100)
+    mock_inside.return_value = True
+    mock_diff.return_value = ("+a", False)
+    mock_gen.return_value = (0, "Add a\n")
+
+    assert batch.describe_repo("/srv/a") == {
+        "repo": "/srv/a",
+        "status": "ok",
+        "message": "Add a",
+    }
+    mock_inside.assert_called_once_with("/srv/a")
+    mock_diff.assert_called_once_with(100, "/srv/a", git_utils.DiffScope())
+    mock_gen.assert_called_once_with(llm_providers.generation_prompt + "+a")
+
+
+@patch("commizard.batch.llm_providers.generate")
+@patch("commizard.batch.git_utils.stream_clean_diff")
+@patch("commizard.batch.git_utils.is_inside_working_tree")
+def test_describe_repo_truncated(mock_inside, mock_diff, mock_gen, monkeypatch):
+    monkeypatch.setattr(config, "MAX_DIFF_BYTES", 100)
+    monkeypatch.setattr(config, "MAX_PROMPT_TOKENS", None)
+    mock_inside.return_value = True
+    mock_diff.return_value = ("+a", True)
+    mock_gen.return_value = (0, "Add a")
+
+    record = batch.describe_repo("/srv/a")
+
+    assert record["warnings"] == ["The diff was truncated to 100 bytes."]
+
+
+@patch("commizard.batch.llm_providers.generate")
+@patch("commizard.batch.exclusion.read_diff")
+@patch("commizard.batch.git_utils.is_inside_working_tree")
+def test_describe_repo_excluded(mock_inside, mock_diff, mock_gen, monkeypatch):
+    monkeypatch.setattr(config, "EXCLUDE_FILES", True)
+    monkeypatch.setattr(config, "MAX_DIFF_BYTES", 100)
+    monkeypatch.setattr(config, "MAX_PROMPT_TOKENS", None)
+    monkeypatch.setattr(git_utils, "PATCH_BYTES_PER_LINE", 10)
+    mock_inside.return_value = True
+    mock_diff.return_value = ("", False, [(10, 0, "yarn.lock")])
+    mock_gen.return_value = (0, "Update the dependencies")
+
+    record = batch.describe_repo("/srv/a")
+
+    assert record == {
+        "repo": "/srv/a",
+        "status": "ok",
+        "message": "Update the dependencies",
+        "warnings": [
+            "1 generated, binary or large file(s) were left out of the diff, "
+            "about 0.2 kB (~40 tokens)."
+        ],
+    }
+    mock_diff.assert_called_once_with(None, 100, "/srv/a")
+    mock_gen.assert_called_once_with(
+        llm_providers.generation_prompt
+        + "[1 generated, binary or large file(s), not shown:]\n"
+        "yarn.lock | +10 -0"
+    )
+
+
+@pytest.mark.parametrize(
+    "inside, diff, gen_result, expected",
+    [
+        (False, None, None, {"status": "error", "error": "not a work tree"}),
+        (True, "", None, {"status": "clean"}),
+        (
+            True,
+            "+a",
+            (1, "Cannot connect to the server"),
+            {"status": "error", "error": "Cannot connect to the server"},
+        ),
+    ],
+)
+@patch("commizard.batch.llm_providers.generate")
+@patch("commizard.batch.git_utils.stream_clean_diff")
+@patch("commizard.batch.git_utils.is_inside_working_tree")
+def test_describe_repo_failures(
+    mock_inside, mock_diff, mock_gen, inside, diff, gen_result, expected
+):
+    mock_inside.return_value = inside
+    mock_diff.return_value = (diff, False)
+    mock_gen.return_value = gen_result
+
+    assert batch.describe_repo("/srv/a") == {"repo": "/srv/a", **expected}
+
+
+def test_build_prompt_compacts(monkeypatch):
+    monkeypatch.setattr(config, "MAX_PROMPT_TOKENS", 200)
+    diff = "--- a/x\n+++ b/x\n@@ -0,0 +1,500 @@"
+    diff += "".join(f"\n+line {i}" for i in range(500))
+
+    prompt, warnings = batch.build_prompt(diff)
+
+    assert prompt.startswith(llm_providers.generation_prompt)
+    assert "[hunk truncated]" in prompt
+    assert warnings == []
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_run(jobs):
+    lock = threading.Lock()
+    running = peak = submitted = 0
+
+    def task(i):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+        return {"id": i, "status": "error" if i % 4 == 0 else "ok"}
+
+    def tasks():
+        nonlocal submitted
+        for i in range(12):
+            # tasks are taken lazily, a couple per worker at most
+            assert submitted - len(records) <= 2 * jobs
+            submitted += 1
+            yield lambda i=i: task(i)
+
+    records = []
+    errors = batch.run(tasks(), jobs, records.append)
+
+    assert errors == 3
+    assert sorted(r["id"] for r in records) == list(range(12))
+    assert peak == jobs
+
+
+@pytest.mark.parametrize(
+    "argv, records, expected",
+    [
+        (["-m", "llama3", "/srv/a"], [{"status": "ok"}], 0),
+        (["-m", "llama3", "/srv/a"], [{"status": "error"}], 1),
+        (["-m", "llama3"], [], 2),
+        (["/srv/a"], [], 2),
+        (["-m", "llama3", "--repos-from", "/nonexistent"], [], 2),
+    ],
+)
+@patch("commizard.batch.prepare")
+@patch("commizard.batch.describe_repo")
+def test_main(mock_describe, mock_prepare, argv, records, expected, capsys):
+    mock_prepare.return_value = True
+    mock_describe.side_effect = records
+
+    assert batch.main(argv) == expected
+    out = capsys.readouterr().out
+    assert out.count("\n") == len(records)
+    if records:
+        mock_describe.assert_called_once_with("/srv/a")
+
+
+@patch("commizard.batch.llm_providers.select_model")
+def test_main_model_not_loaded(mock_select, capsys, monkeypatch):
+    monkeypatch.setattr(config, "HTTP_POOL_SIZE", 8)
+    mock_select.return_value = (1, "failed to load llama3")
+
+    assert batch.main(["-m", "llama3", "-j", "16", "/srv/a"]) == 1
+    assert capsys.readouterr().err == "Error: failed to load llama3\n"
+    assert config.HTTP_POOL_SIZE == 16
+
+
+def test_main_help(capsys):
+    assert batch.main(["-m", "llama3", "-h"]) == 0
+    assert capsys.readouterr().out == batch.help_msg.strip() + "\n"
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from commizard import cache
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    monkeypatch.setattr(cache, "hits", 0)
+    monkeypatch.setattr(cache, "misses", 0)
+
+
+def test_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert cache.cache_dir() == tmp_path / "commizard" / "responses"
+
+    monkeypatch.delenv("XDG_CACHE_HOME")
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    assert cache.cache_dir().parts[-3:] == (".cache", "commizard", "responses")
+
+
+def test_make_key():
+    key = cache.make_key("gpt", "prompt")
+    assert key == cache.make_key("gpt", "prompt")
+    assert len(key) == 64
+    assert key != cache.make_key("gpt2", "prompt")
+    assert key != cache.make_key("gpt", "prompt2")
+    assert key != cache.make_key("gpt", "prompt", "system")
+    # the parts are delimited
+    assert cache.make_key("ab", "c") != cache.make_key("a", "bc")
+    assert cache.make_key("a", "b", "c") != cache.make_key("a", "cb")
+
+
+def test_store_lookup(counters):
+    assert cache.lookup("gpt", "prompt") is None
+    cache.store("gpt", "prompt", "Fix the parser")
+
+    assert cache.lookup("gpt", "prompt") == "Fix the parser"
+    assert cache.lookup("other", "prompt") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+@pytest.mark.parametrize(
+    "use_cache, model, response",
+    [
+        (False, "gpt", "Fix the parser"),
+        (True, None, "Fix the parser"),
+        (True, "gpt", ""),
+    ],
+)
+def test_store_skipped(use_cache, model, response, monkeypatch):
+    monkeypatch.setattr(cache.config, "USE_CACHE", use_cache)
+    cache.store(model, "prompt", response)
+
+    monkeypatch.setattr(cache.config, "USE_CACHE", True)
+    assert cache.lookup("gpt", "prompt") is None
+    assert cache.stats() == (0, 0)
+
+
+def test_lookup_disabled(counters, monkeypatch):
+    cache.store("gpt", "prompt", "Fix the parser")
+    monkeypatch.setattr(cache.config, "USE_CACHE", False)
+
+    assert cache.lookup("gpt", "prompt") is None
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_contains(counters, monkeypatch):
+    assert not cache.contains("gpt", "prompt")
+    cache.store("gpt", "prompt", "Fix the parser")
+
+    assert cache.contains("gpt", "prompt")
+    assert not cache.contains("other", "prompt")
+    assert not cache.contains(None, "prompt")
+    assert (cache.hits, cache.misses) == (0, 0)
+    monkeypatch.setattr(cache.config, "USE_CACHE", False)
+    assert not cache.contains("gpt", "prompt")
+
+
+def test_store_error(tmp_path, monkeypatch):
+    # the cache directory can't be created under a file
+    (tmp_path / "file").write_text("")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "file"))
+
+    cache.store("gpt", "prompt", "Fix the parser")
+    assert cache.lookup("gpt", "prompt") is None
+
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(cache.config, "CACHE_MAX_BYTES", 30)
+    for i in range(3):
+        cache.store("gpt", f"prompt {i}", "0123456789")
+        key = cache.make_key("gpt", f"prompt {i}")
+        os.utime(cache.cache_dir() / f"{key}.txt", (i, i))
+
+    # using the oldest one makes it the most recently used
+    assert cache.lookup("gpt", "prompt 0") == "0123456789"
+    cache.store("gpt", "prompt 3", "0123456789")
+
+    assert cache.stats() == (3, 30)
+    assert cache.lookup("gpt", "prompt 1") is None
+    for i in (0, 2, 3):
+        assert cache.lookup("gpt", f"prompt {i}") == "0123456789"
+
+
+def test_stats_clear():
+    assert cache.stats() == (0, 0)
+    assert cache.clear() == 0
+
+    cache.store("gpt", "prompt 1", "abc")
+    cache.store("gpt", "prompt 2", "de")
+    assert cache.stats() == (2, 5)
+
+    assert cache.clear() == 2
+    assert cache.stats() == (0, 0)
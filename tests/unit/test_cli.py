@@ -1,8 +1,9 @@
+import threading
 from unittest.mock import DEFAULT, patch
 
 import pytest
 
-from commizard import cli, config
+from commizard import cli, config, start
 
 
 @pytest.mark.parametrize(
@@ -55,6 +56,36 @@ def test_handle_args_no_color(monkeypatch):
     assert not config.USE_COLOR
 
 
+def test_handle_args_no_keep_alive(monkeypatch):
+    monkeypatch.setattr(cli.sys, "argv", ["prog", "--no-keep-alive"])
+    monkeypatch.setattr(config, "HTTP_KEEP_ALIVE", True)
+
+    cli.handle_args()
+    assert not config.HTTP_KEEP_ALIVE
+
+
+def test_handle_args_no_cache(monkeypatch):
+    monkeypatch.setattr(cli.sys, "argv", ["prog", "--no-cache"])
+    monkeypatch.setattr(config, "USE_CACHE", True)
+
+    cli.handle_args()
+    assert not config.USE_CACHE
+
+
+class InlineThread:
+    """
+    Runs its target as soon as it's started, so the startup checks' results
+    are known before the first prompt.
+    """
+
+    def __init__(self, target, args=(), daemon=None):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
+
+
 @pytest.mark.parametrize(
     "git_installed, local_ai_avail, inside_work_tree, user_inputs, num_parse",
     [
@@ -78,14 +109,15 @@ def test_handle_args_no_color(monkeypatch):
         "very_long_session",
     ],
 )
-@patch("commizard.cli.start.check_git_installed")
-@patch("commizard.cli.start.local_ai_available")
-@patch("commizard.cli.start.is_inside_working_tree")
-@patch("commizard.cli.start.print_welcome")
+@patch("commizard.start.threading.Thread", InlineThread)
+@patch("commizard.start.check_git_installed")
+@patch("commizard.start.local_ai_available")
+@patch("commizard.start.is_inside_working_tree")
+@patch("commizard.start.print_welcome")
 @patch("commizard.commands.parser")
 @patch("commizard.cli.input")
-@patch("commizard.cli.output.print_error")
-@patch("commizard.cli.output.print_warning")
+@patch("commizard.output.print_error")
+@patch("commizard.output.print_warning")
 @patch("commizard.cli.print")
 @patch("commizard.cli.handle_args")
 def test_main(
@@ -141,6 +173,53 @@ def test_main(
     mock_print.assert_called_once_with("Goodbye!")
 
 
+@patch("commizard.start.check_git", return_value=None)
+@patch("commizard.start.local_ai_available")
+@patch("commizard.start.print_welcome")
+@patch("commizard.commands.parser")
+@patch("commizard.cli.input")
+@patch("commizard.output.print_warning")
+@patch("commizard.cli.handle_args")
+def test_main_ai_check_in_background(
+    mock_args,
+    mock_warning,
+    mock_input,
+    mock_parser,
+    mock_welcome,
+    mock_local_ai,
+    mock_check_git,
+    monkeypatch,
+):
+    answered = threading.Event()
+    checks = []
+    init = start.BackgroundCheck.__init__
+
+    def record_check(self, check):
+        init(self, check)
+        checks.append(self)
+
+    monkeypatch.setattr(start.BackgroundCheck, "__init__", record_check)
+    mock_local_ai.side_effect = lambda: answered.wait() and False
+    warnings_at_prompt = []
+
+    def user_input(prompt):
+        warnings_at_prompt.append(mock_warning.call_count)
+        if len(warnings_at_prompt) == 2:
+            # the server answers while the user is typing
+            answered.set()
+            checks[1].result()
+        return ["cmd1", "cmd2", "exit"][len(warnings_at_prompt) - 1]
+
+    mock_input.side_effect = user_input
+
+    assert cli.main() == 0
+    # the prompts didn't wait for the check, and its warning was shown before
+    # the prompt following its answer
+    assert warnings_at_prompt == [0, 0, 1]
+    mock_warning.assert_called_once_with("local AI not available")
+    assert mock_parser.call_count == 2
+
+
 @pytest.mark.parametrize(
     "expected_exception",
     [
@@ -148,17 +227,18 @@ def test_main(
         KeyboardInterrupt,
     ],
 )
+@patch("commizard.start.threading.Thread", InlineThread)
 def test_main_exception_handling(expected_exception):
     with (
         patch.multiple(
-            "commizard.cli.start",
+            "commizard.start",
             check_git_installed=DEFAULT,
             local_ai_available=DEFAULT,
             is_inside_working_tree=DEFAULT,
             print_welcome=DEFAULT,
         ),
         patch.multiple(
-            "commizard.cli.output",
+            "commizard.output",
             print_warning=DEFAULT,
             print_error=DEFAULT,
         ),
@@ -176,3 +256,17 @@ def test_main_exception_handling(expected_exception):
 
         assert out == 0
         print_mocks["print"].assert_called_once_with("\nGoodbye!")
+
+
+@pytest.mark.parametrize("subcommand", ["batch", "backfill"])
+@patch("commizard.cli.handle_args")
+def test_main_subcommands(mock_args, subcommand, monkeypatch):
+    monkeypatch.setattr(
+        cli.sys, "argv", ["prog", subcommand, "-m", "llama3", "arg"]
+    )
+    with patch(f"commizard.{subcommand}.main") as mock_main:
+        mock_main.return_value = 1
+
+        assert cli.main() == 1
+        mock_main.assert_called_once_with(["-m", "llama3", "arg"])
+    mock_args.assert_not_called()
@@ -1,8 +1,14 @@
-from unittest.mock import call, patch
+import threading
+from unittest.mock import MagicMock, call, patch
 
 import pytest
 
-from commizard import commands, llm_providers
+from commizard import commands, git_utils, llm_providers
+
+
+@pytest.fixture(autouse=True)
+def no_conversation(monkeypatch):
+    monkeypatch.setattr(llm_providers, "conversation", None)
 
 
 @pytest.mark.parametrize(
@@ -61,8 +67,11 @@ def test_handle_commit_req(
                 "  start             Select a model to generate for you.\n"
                 "  list              List all available models.\n"
                 "  gen               Generate a new commit message.\n"
+                "  regen             Rewrite the last message, e.g. regen shorter.\n"
                 "  cp                Copy the last generated message to the clipboard.\n"
                 "  commit            Commit the last generated message.\n"
+                "  cache             Show stats about or clear the message cache.\n"
+                "  watch             Generate messages ahead, as the changes are made.\n"
                 "  cls  | clear      Clear the terminal screen.\n"
                 "  exit | quit       Exit the program.\n"
                 "\nTo view help for a command, type help, followed by a space, and the\n"
@@ -227,9 +236,9 @@ def test_print_available_models_error_behavior(
 
 
 @patch("commizard.commands.output.print_warning")
-@patch("commizard.commands.git_utils.get_clean_diff")
+@patch("commizard.commands.git_utils.stream_clean_diff")
 def test_generate_message_no_diff(mock_diff, mock_output, monkeypatch):
-    mock_diff.return_value = ""
+    mock_diff.return_value = ("", False)
     monkeypatch.setattr(commands.llm_providers, "gen_message", None)
 
     commands.generate_message(["--dummy"])
@@ -239,10 +248,10 @@ def test_generate_message_no_diff(mock_diff, mock_output, monkeypatch):
 
 
 @patch("commizard.commands.output.print_error")
-@patch("commizard.commands.git_utils.get_clean_diff")
+@patch("commizard.commands.git_utils.stream_clean_diff")
 @patch("commizard.commands.llm_providers.stream_generate")
 def test_generate_message_err(mock_gen, mock_diff, mock_output, monkeypatch):
-    mock_diff.return_value = "some diff"
+    mock_diff.return_value = ("some diff", False)
     mock_gen.return_value = (1, "Error happened")
     monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
     monkeypatch.setattr(commands.llm_providers, "gen_message", None)
@@ -257,7 +266,7 @@ def test_generate_message_err(mock_gen, mock_diff, mock_output, monkeypatch):
 @pytest.mark.parametrize("should_stream", [True, False])
 @patch("commizard.commands.output.wrap_text")
 @patch("commizard.commands.output.print_generated")
-@patch("commizard.commands.git_utils.get_clean_diff")
+@patch("commizard.commands.git_utils.stream_clean_diff")
 @patch("commizard.commands.llm_providers.stream_generate")
 @patch("commizard.commands.llm_providers.generate")
 def test_generate_message_success(
@@ -269,7 +278,7 @@ def test_generate_message_success(
     should_stream,
     monkeypatch,
 ):
-    mock_diff.return_value = "some diff"
+    mock_diff.return_value = ("some diff", False)
     if should_stream:
         mock_stream_gen.return_value = (
             0,
@@ -302,6 +311,797 @@ def test_generate_message_success(
         llm_providers.gen_message
         == "WRAPPED(The generated commit's title)\n\nWRAPPED(The body)"
     )
+    # regen continues from the draft as the model wrote it
+    assert llm_providers.conversation.messages == [
+        {"role": "user", "content": "PROMPT:some diff"},
+        {
+            "role": "assistant",
+            "content": "The generated commit's title\n\nThe body",
+        },
+    ]
+
+
+@pytest.mark.parametrize("should_stream", [True, False])
+@patch("commizard.commands.output.print_generated")
+@patch("commizard.commands.llm_providers.regenerate")
+def test_regenerate_message(
+    mock_regen, mock_output, should_stream, monkeypatch
+):
+    mock_regen.return_value = (0, "Fix the parser")
+    monkeypatch.setattr(commands.config, "STREAM", should_stream)
+    monkeypatch.setattr(commands.llm_providers, "gen_message", "old")
+
+    commands.regenerate_message(["much", "shorter"])
+
+    mock_regen.assert_called_once_with("much shorter")
+    assert llm_providers.gen_message == "Fix the parser"
+    if should_stream:
+        mock_output.assert_not_called()
+    else:
+        mock_output.assert_called_once_with("Fix the parser")
+
+
+@pytest.mark.parametrize(
+    "side_effect, error",
+    [
+        ([(1, "No message to regenerate. Use gen first.")], None),
+        (KeyboardInterrupt, "Generation cancelled."),
+    ],
+)
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.llm_providers.regenerate")
+def test_regenerate_message_error(
+    mock_regen, mock_error, side_effect, error, monkeypatch
+):
+    mock_regen.side_effect = side_effect
+    monkeypatch.setattr(commands.llm_providers, "gen_message", "old")
+
+    commands.regenerate_message([])
+
+    mock_regen.assert_called_once_with("")
+    mock_error.assert_called_once_with(
+        error or "No message to regenerate. Use gen first."
+    )
+    assert llm_providers.gen_message == "old"
+
+
+@pytest.mark.parametrize(
+    "opts, expected",
+    [
+        ([], 1),
+        (["--staged"], 1),
+        (["-n", "3"], 3),
+        (["--staged", "-n", "1"], 1),
+        (["-n"], "-n requires a number of candidates"),
+        (["-n", "two"], "Invalid number of candidates: two"),
+        (["-n", "0"], "The number of candidates must be between 1 and 8"),
+        (["-n", "9"], "The number of candidates must be between 1 and 8"),
+    ],
+)
+def test_parse_count(opts, expected, monkeypatch):
+    monkeypatch.setattr(commands.config, "HTTP_POOL_SIZE", 8)
+    if isinstance(expected, int):
+        assert commands.parse_count(opts) == expected
+    else:
+        with pytest.raises(ValueError, match=expected):
+            commands.parse_count(opts)
+
+
+@pytest.mark.parametrize(
+    "answers, expected",
+    [
+        (["2"], 2),
+        (["3"], 3),
+        ([""], None),
+        (["x", "1", "3"], 3),
+        (EOFError, None),
+        (KeyboardInterrupt, None),
+    ],
+)
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.output.print_generated")
+def test_pick_candidate(
+    mock_generated, mock_warning, answers, expected, monkeypatch
+):
+    answer_iter = iter(answers) if isinstance(answers, list) else None
+
+    def fake_input(prompt):
+        assert prompt == "Pick a message (2, 3): "
+        if answer_iter is None:
+            raise answers
+        return next(answer_iter)
+
+    monkeypatch.setattr("builtins.input", fake_input)
+
+    res = commands.pick_candidate({2: "second", 3: "third"}, printed=False)
+
+    assert res == expected
+    mock_generated.assert_has_calls([call("second"), call("third")])
+    if answers == ["x", "1", "3"]:
+        assert mock_warning.call_count == 2
+
+
+@patch("commizard.commands.output.print_generated")
+def test_pick_candidate_streamed(mock_generated, monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda prompt: "1")
+
+    assert commands.pick_candidate({1: "a", 2: "b"}, printed=True) == 1
+    mock_generated.assert_not_called()
+
+
+@pytest.mark.parametrize("should_stream", [True, False])
+@patch("commizard.commands.pick_candidate")
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+@patch("commizard.commands.llm_providers.generate_candidates")
+def test_generate_message_candidates(
+    mock_candidates,
+    mock_diff,
+    mock_warning,
+    mock_pick,
+    should_stream,
+    monkeypatch,
+):
+    mock_diff.return_value = ("some diff", False)
+    mock_candidates.return_value = [(0, "first"), (1, "Timeout"), (0, "third")]
+    mock_pick.return_value = 3
+    monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
+    monkeypatch.setattr(commands.llm_providers, "gen_message", None)
+    monkeypatch.setattr(commands.config, "STREAM", should_stream)
+    monkeypatch.setattr(commands, "gen_scope", None)
+
+    commands.generate_message(["-n", "3", "--", "src"])
+
+    mock_candidates.assert_called_once_with(
+        "PROMPT:some diff", 3, should_stream
+    )
+    mock_warning.assert_called_once_with(
+        "1 of the 3 candidates failed: Timeout"
+    )
+    mock_pick.assert_called_once_with({1: "first", 3: "third"}, should_stream)
+    assert llm_providers.gen_message == "third"
+    assert commands.gen_scope == git_utils.DiffScope(paths=["src"])
+    assert llm_providers.conversation.messages == [
+        {"role": "user", "content": "PROMPT:some diff"},
+        {"role": "assistant", "content": "third"},
+    ]
+
+
+@patch("commizard.commands.pick_candidate")
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+@patch("commizard.commands.llm_providers.generate_candidates")
+def test_generate_message_candidates_none_picked(
+    mock_candidates, mock_diff, mock_warning, mock_pick, monkeypatch
+):
+    mock_diff.return_value = ("some diff", False)
+    mock_candidates.return_value = [(0, "first"), (0, "second")]
+    mock_pick.return_value = None
+    monkeypatch.setattr(commands.llm_providers, "gen_message", None)
+
+    commands.generate_message(["-n", "2"])
+
+    mock_warning.assert_called_once_with("No message was picked.")
+    assert llm_providers.gen_message is None
+
+
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+@patch("commizard.commands.llm_providers.generate_candidates")
+def test_generate_message_candidates_all_failed(
+    mock_candidates, mock_diff, mock_error, monkeypatch
+):
+    mock_diff.return_value = ("some diff", False)
+    mock_candidates.return_value = [(1, "Timeout"), (1, "Other")]
+    monkeypatch.setattr(commands.llm_providers, "gen_message", None)
+
+    commands.generate_message(["-n", "2"])
+
+    mock_error.assert_called_once_with("Timeout")
+    assert llm_providers.gen_message is None
+
+
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_bad_count(mock_diff, mock_error):
+    commands.generate_message(["-n", "many"])
+
+    mock_error.assert_called_once_with("Invalid number of candidates: many")
+    mock_diff.assert_not_called()
+
+
+@patch("commizard.commands.llm_providers.stream_generate")
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_truncated(
+    mock_diff, mock_warning, mock_gen, monkeypatch
+):
+    mock_diff.return_value = ("some diff", True)
+    mock_gen.return_value = (0, "title")
+    monkeypatch.setattr(commands.config, "STREAM", True)
+    monkeypatch.setattr(commands.config, "MAX_DIFF_BYTES", 1234)
+    monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
+
+    commands.generate_message([])
+
+    mock_diff.assert_called_once_with(1234, scope=git_utils.DiffScope())
+    mock_warning.assert_called_once_with(
+        "The diff is larger than 1234 bytes. Only the first part of it will be "
+        "used."
+    )
+    mock_gen.assert_called_once_with("PROMPT:some diff")
+
+
+@pytest.mark.parametrize(
+    "max_tokens, compacted, warning, expected_prompt",
+    [
+        (None, None, None, "PROMPT:some diff"),
+        (100, ("some diff", 2, 2), None, "PROMPT:some diff"),
+        (
+            100,
+            ("small", 1, 3),
+            (
+                "The diff was compacted to fit 100 tokens. 1 of its 3 hunks "
+                "will be used."
+            ),
+            "PROMPT:small",
+        ),
+    ],
+)
+@patch("commizard.compaction.compact_diff")
+@patch("commizard.commands.llm_providers.stream_generate")
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_compacted(
+    mock_diff,
+    mock_warning,
+    mock_gen,
+    mock_compact,
+    max_tokens,
+    compacted,
+    warning,
+    expected_prompt,
+    monkeypatch,
+):
+    mock_diff.return_value = ("some diff", False)
+    mock_gen.return_value = (0, "title")
+    mock_compact.return_value = compacted
+    monkeypatch.setattr(commands.config, "STREAM", True)
+    monkeypatch.setattr(commands.config, "MAX_PROMPT_TOKENS", max_tokens)
+    monkeypatch.setattr(commands.llm_providers, "system_prompt", "")
+    monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
+
+    commands.generate_message([])
+
+    if max_tokens is None:
+        mock_compact.assert_not_called()
+    else:
+        # the prompt's own tokens are taken out of the budget
+        mock_compact.assert_called_once_with("some diff", 98)
+    if warning is None:
+        mock_warning.assert_not_called()
+    else:
+        mock_warning.assert_called_once_with(warning)
+    mock_gen.assert_called_once_with(expected_prompt)
+
+
+@pytest.mark.parametrize(
+    "opts, map_reduce_config, max_tokens, should_map_reduce",
+    [
+        (["--map-reduce"], False, 100, True),
+        ([], True, 100, True),
+        ([], False, 100, False),
+        # the diff already fits
+        (["--map-reduce"], False, 10_000, False),
+    ],
+)
+@patch("commizard.map_reduce.build_prompt")
+@patch("commizard.compaction.compact_diff")
+@patch("commizard.commands.llm_providers.stream_generate")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_map_reduce(
+    mock_diff,
+    mock_gen,
+    mock_compact,
+    mock_map_reduce,
+    opts,
+    map_reduce_config,
+    max_tokens,
+    should_map_reduce,
+    monkeypatch,
+):
+    diff = "x" * 1000
+    mock_diff.return_value = (diff, False)
+    mock_gen.return_value = (0, "title")
+    mock_compact.return_value = (diff, 1, 1)
+    mock_map_reduce.return_value = (0, "REDUCE:summaries")
+    monkeypatch.setattr(commands.config, "STREAM", True)
+    monkeypatch.setattr(commands.config, "MAP_REDUCE", map_reduce_config)
+    monkeypatch.setattr(commands.config, "MAX_PROMPT_TOKENS", max_tokens)
+    monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
+
+    commands.generate_message(opts)
+
+    if should_map_reduce:
+        mock_map_reduce.assert_called_once_with(diff, max_tokens)
+        mock_compact.assert_not_called()
+        mock_gen.assert_called_once_with("REDUCE:summaries")
+    else:
+        mock_map_reduce.assert_not_called()
+        mock_gen.assert_called_once_with("PROMPT:" + diff)
+
+
+@patch("commizard.map_reduce.build_prompt")
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.llm_providers.stream_generate")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_map_reduce_err(
+    mock_diff, mock_gen, mock_error, mock_map_reduce, monkeypatch
+):
+    mock_diff.return_value = ("x" * 1000, False)
+    mock_map_reduce.return_value = (1, "request timed out")
+    monkeypatch.setattr(commands.config, "MAX_PROMPT_TOKENS", 100)
+    monkeypatch.setattr(commands.llm_providers, "gen_message", None)
+
+    commands.generate_message(["--map-reduce"])
+
+    mock_error.assert_called_once_with("request timed out")
+    mock_gen.assert_not_called()
+    assert llm_providers.gen_message is None
+
+
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.llm_providers.stream_generate")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_interrupted(
+    mock_diff, mock_gen, mock_error, monkeypatch
+):
+    mock_diff.return_value = ("some diff", False)
+    mock_gen.side_effect = KeyboardInterrupt
+    monkeypatch.setattr(commands.config, "STREAM", True)
+    monkeypatch.setattr(commands.llm_providers, "gen_message", None)
+
+    commands.generate_message([])
+
+    mock_error.assert_called_once_with("Generation cancelled.")
+    assert llm_providers.gen_message is None
+
+
+@pytest.mark.parametrize(
+    "opts, expected_opts, staged, paths",
+    [
+        ([], [], False, []),
+        (["--staged"], ["--staged"], True, []),
+        (["--", "src", "--staged"], [], False, ["src", "--staged"]),
+        (
+            ["--map-reduce", "--", "a.py", "b.py"],
+            ["--map-reduce"],
+            False,
+            ["a.py", "b.py"],
+        ),
+        (["--staged", "--"], ["--staged"], True, []),
+    ],
+)
+def test_parse_scope(opts, expected_opts, staged, paths):
+    assert commands.parse_scope(opts) == (
+        expected_opts,
+        git_utils.DiffScope(staged, paths),
+    )
+
+
+@pytest.mark.parametrize(
+    "opts, warning",
+    [
+        (["--staged"], "No staged changes."),
+        (["--", "src"], "No changes to the given paths."),
+    ],
+)
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_scoped_no_diff(
+    mock_diff, mock_warning, opts, warning
+):
+    mock_diff.return_value = ("", False)
+
+    commands.generate_message(opts)
+
+    mock_warning.assert_called_once_with(warning)
+
+
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_staged_paths(mock_diff, mock_error):
+    commands.generate_message(["--staged", "--", "src"])
+
+    mock_error.assert_called_once_with("--staged can't be combined with paths.")
+    mock_diff.assert_not_called()
+
+
+@patch("commizard.commands.git_utils.commit")
+@patch("commizard.commands.llm_providers.generate")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_then_commit_scope(
+    mock_diff, mock_gen, mock_commit, monkeypatch
+):
+    monkeypatch.setattr(commands.config, "STREAM", False)
+    monkeypatch.setattr(commands.config, "PIPELINE", False)
+    monkeypatch.setattr(commands, "gen_scope", None)
+    monkeypatch.setattr(llm_providers, "gen_message", None)
+    mock_diff.return_value = ("some diff", False)
+    mock_gen.return_value = (0, "Fix the parser")
+    mock_commit.return_value = (0, "committed")
+
+    commands.generate_message(["--", "src/parser.py"])
+    commands.handle_commit_req([])
+
+    scope = git_utils.DiffScope(paths=["src/parser.py"])
+    mock_diff.assert_called_once_with(
+        commands.config.MAX_DIFF_BYTES, scope=scope
+    )
+    mock_commit.assert_called_once_with("Fix the parser", scope)
+
+
+@pytest.mark.parametrize(
+    "pipeline, model, diff, should_warm_up",
+    [
+        (True, "gpt", ("some diff", False), True),
+        (True, "gpt", ("", False), True),
+        (True, None, ("some diff", False), False),
+        (False, "gpt", ("some diff", False), False),
+    ],
+)
+@patch("commizard.commands.llm_providers.warm_up_model")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_collect_diff(
+    mock_diff,
+    mock_warm_up,
+    pipeline,
+    model,
+    diff,
+    should_warm_up,
+    monkeypatch,
+):
+    mock_diff.return_value = diff
+    monkeypatch.setattr(commands.config, "PIPELINE", pipeline)
+    monkeypatch.setattr(commands.config, "MAX_DIFF_BYTES", 100)
+    monkeypatch.setattr(commands.llm_providers, "selected_model", model)
+
+    monkeypatch.setattr(commands, "warm_up", None)
+
+    assert commands.collect_diff() == diff
+
+    mock_diff.assert_called_once_with(100, scope=None)
+    if should_warm_up:
+        mock_warm_up.assert_called_once_with()
+    else:
+        mock_warm_up.assert_not_called()
+    # only kept to be waited for if there's something to generate
+    assert (commands.warm_up is not None) == (should_warm_up and diff[0] != "")
+    commands.finish_warm_up()
+    assert commands.warm_up is None
+
+
+@pytest.mark.parametrize("cached", [True, False])
+@patch("commizard.commands.llm_providers.stream_generate")
+@patch("commizard.commands.llm_providers.warm_up_model")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_generate_message_waits_for_warm_up(
+    mock_diff, mock_warm_up, mock_gen, cached, monkeypatch
+):
+    mock_diff.return_value = ("some diff", False)
+    loaded = threading.Event()
+    mock_warm_up.side_effect = lambda: loaded.wait(5)
+    mock_gen.side_effect = lambda prompt: (0, f"loaded: {loaded.is_set()}")
+    monkeypatch.setattr(commands.config, "PIPELINE", True)
+    monkeypatch.setattr(commands.config, "STREAM", True)
+    monkeypatch.setattr(commands.llm_providers, "selected_model", "gpt")
+    monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
+    monkeypatch.setattr(commands, "warm_up", None)
+    if cached:
+        commands.cache.store(
+            "gpt",
+            "PROMPT:some diff",
+            "cached",
+            commands.llm_providers.system_prompt,
+        )
+    else:
+        # the generation only starts once the model is loaded
+        threading.Timer(0.05, loaded.set).start()
+
+    commands.generate_message([])
+
+    assert llm_providers.gen_message == "loaded: " + str(not cached)
+    loaded.set()
+
+
+@pytest.mark.parametrize(
+    "max_tokens, max_bytes, expected",
+    [
+        (None, 1000, 1000),
+        (None, None, None),
+        (110, None, 400),
+        (110, 100, 100),
+        (5, None, 0),
+    ],
+)
+def test_adaptive_budget(max_tokens, max_bytes, expected, monkeypatch):
+    monkeypatch.setattr(commands.config, "MAX_PROMPT_TOKENS", max_tokens)
+    monkeypatch.setattr(commands.config, "MAX_DIFF_BYTES", max_bytes)
+    monkeypatch.setattr(llm_providers, "system_prompt", "x" * 30)
+    monkeypatch.setattr(llm_providers, "generation_prompt", "x" * 10)
+
+    assert commands.adaptive_budget() == expected
+
+
+@pytest.mark.parametrize(
+    "opts, config_on", [(["--adaptive"], False), ([], True)]
+)
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.llm_providers.generate")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+@patch("commizard.commands.git_utils.adaptive_clean_diff")
+def test_generate_message_adaptive(
+    mock_adaptive,
+    mock_diff,
+    mock_gen,
+    mock_warning,
+    opts,
+    config_on,
+    monkeypatch,
+):
+    monkeypatch.setattr(commands.config, "ADAPTIVE_DIFF", config_on)
+    monkeypatch.setattr(commands.config, "STREAM", False)
+    monkeypatch.setattr(commands.config, "PIPELINE", False)
+    monkeypatch.setattr(commands.config, "MAX_PROMPT_TOKENS", None)
+    monkeypatch.setattr(commands.config, "MAX_DIFF_BYTES", 1000)
+    monkeypatch.setattr(llm_providers, "generation_prompt", "PROMPT:")
+    mock_adaptive.return_value = ("some diff", True)
+    mock_gen.return_value = (0, "title")
+
+    commands.generate_message(opts)
+
+    mock_adaptive.assert_called_once_with(
+        1000, git_utils.DiffScope(), stats=None
+    )
+    mock_diff.assert_not_called()
+    mock_gen.assert_called_once_with("PROMPT:some diff")
+    mock_warning.assert_called_once_with(
+        "The changes of the chosen files are larger than estimated. Only the "
+        "first part of them will be used."
+    )
+
+
+@pytest.mark.parametrize(
+    "adaptive, diff, expected",
+    [
+        (False, "+a", "+a\n\n[summary]"),
+        (True, "+a", "+a\n\n[summary]"),
+        (False, "", "[summary]"),
+    ],
+)
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.exclusion.report")
+@patch("commizard.exclusion.summarize")
+@patch("commizard.exclusion.exclude_files")
+@patch("commizard.exclusion.read_diff")
+@patch("commizard.commands.git_utils.adaptive_clean_diff")
+def test_read_diff_excluded(
+    mock_adaptive,
+    mock_diff,
+    mock_exclude,
+    mock_summarize,
+    mock_report,
+    mock_warning,
+    adaptive,
+    diff,
+    expected,
+    monkeypatch,
+):
+    monkeypatch.setattr(commands.config, "EXCLUDE_FILES", True)
+    monkeypatch.setattr(commands.config, "MAX_PROMPT_TOKENS", None)
+    monkeypatch.setattr(commands.config, "MAX_DIFF_BYTES", 1000)
+    narrowed = git_utils.DiffScope(exclude=["yarn.lock"])
+    stats = [(1, 1, "a.py")]
+    excluded = [(900, 10, "yarn.lock")]
+    mock_exclude.return_value = (narrowed, stats, excluded)
+    mock_summarize.return_value = "[summary]"
+    mock_report.return_value = "1 file was left out."
+    mock_adaptive.return_value = (diff, False)
+    mock_diff.return_value = (diff, False, excluded)
+
+    assert commands.read_diff(None, adaptive) == (expected, False)
+    mock_warning.assert_called_once_with("1 file was left out.")
+    if adaptive:
+        mock_exclude.assert_called_once_with(None)
+        # the listing takes part of the budget
+        mock_adaptive.assert_called_once_with(991, narrowed, stats=stats)
+        mock_diff.assert_not_called()
+    else:
+        # the stats come with the diff
+        mock_diff.assert_called_once_with(None, 1000)
+        mock_exclude.assert_not_called()
+
+
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.collect_diff")
+def test_generate_message_git_error(mock_collect, mock_warning):
+    mock_collect.side_effect = OSError(7, "Argument list too long")
+
+    commands.generate_message([])
+
+    mock_warning.assert_called_once_with(
+        "Couldn't read the diff: [Errno 7] Argument list too long"
+    )
+
+
+@pytest.mark.parametrize(
+    "narrowed, expected",
+    [
+        (None, ("", False)),
+        (git_utils.DiffScope(paths=[":(top,literal)a.py"]), ("diff", False)),
+    ],
+)
+@patch("commizard.tracker.narrow_scope")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_read_diff_tracked(
+    mock_diff, mock_narrow, narrowed, expected, monkeypatch
+):
+    monkeypatch.setattr(commands.config, "TRACK_CHANGES", True)
+    monkeypatch.setattr(commands.config, "MAX_DIFF_BYTES", 1000)
+    mock_narrow.return_value = narrowed
+    mock_diff.return_value = ("diff", False)
+
+    assert commands.read_diff(None, adaptive=False) == expected
+
+    mock_narrow.assert_called_once_with(git_utils.DiffScope())
+    if narrowed is None:
+        mock_diff.assert_not_called()
+    else:
+        mock_diff.assert_called_once_with(1000, scope=narrowed)
+
+
+@patch("commizard.commands.read_diff")
+def test_speculative_prompt_git_error(mock_diff, monkeypatch):
+    monkeypatch.setattr(commands.llm_providers, "selected_model", "mymodel")
+    mock_diff.side_effect = OSError(7, "Argument list too long")
+
+    assert commands.speculative_prompt() is None
+
+
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.git_utils.stream_clean_diff")
+def test_speculative_prompt(mock_diff, mock_warning, monkeypatch):
+    monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
+    monkeypatch.setattr(commands.config, "MAX_PROMPT_TOKENS", 10)
+    monkeypatch.setattr(commands.config, "MAP_REDUCE", False)
+
+    monkeypatch.setattr(commands.llm_providers, "selected_model", None)
+    assert commands.speculative_prompt() is None
+    mock_diff.assert_not_called()
+
+    monkeypatch.setattr(commands.llm_providers, "selected_model", "mymodel")
+    mock_diff.return_value = ("", False)
+    assert commands.speculative_prompt() is None
+
+    # compacted, but quietly
+    diff = "@@ -1 +1 @@\n-a\n+b\n" * 20
+    mock_diff.return_value = (diff, False)
+    prompt = commands.speculative_prompt()
+    assert prompt.startswith("PROMPT:")
+    assert len(prompt) < len("PROMPT:" + diff)
+    mock_warning.assert_not_called()
+
+    # map-reduce takes several requests, so isn't speculated on
+    monkeypatch.setattr(commands.config, "MAP_REDUCE", True)
+    assert commands.speculative_prompt() is None
+
+
+@patch("commizard.speculation.Watcher")
+@patch("commizard.commands.git_utils.get_toplevel")
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.output.print_warning")
+@patch("commizard.commands.output.print_success")
+def test_watch_command(
+    mock_success, mock_warning, mock_error, mock_git, mock_watcher, monkeypatch
+):
+    monkeypatch.setattr(commands, "watcher", None)
+    mock_git.return_value = "/repo"
+
+    commands.watch_command(["off"])
+    mock_warning.assert_called_once_with("Not watching the changes.")
+
+    commands.watch_command(["on"])
+    mock_watcher.assert_called_once_with(commands.speculative_prompt, "/repo")
+    mock_watcher.return_value.start.assert_called_once()
+    assert commands.watcher is mock_watcher.return_value
+    mock_success.assert_called_once()
+
+    commands.watch_command(["on"])
+    mock_warning.assert_called_with("Already watching the changes.")
+    mock_watcher.assert_called_once()
+
+    commands.watch_command(["off"])
+    mock_watcher.return_value.stop.assert_called_once()
+    assert commands.watcher is None
+
+    for opts in ([], ["maybe"], ["on", "off"]):
+        commands.watch_command(opts)
+    assert mock_error.call_count == 3
+    mock_error.assert_called_with("Usage: watch on | watch off")
+
+
+@pytest.mark.parametrize(
+    "use_cache, top, error",
+    [
+        (False, "/repo", "Watching needs the response cache."),
+        (True, None, "Couldn't find the repository's root."),
+    ],
+)
+@patch("commizard.speculation.Watcher")
+@patch("commizard.commands.git_utils.get_toplevel")
+@patch("commizard.commands.output.print_error")
+def test_watch_command_error(
+    mock_error,
+    mock_git,
+    mock_watcher,
+    use_cache,
+    top,
+    error,
+    monkeypatch,
+):
+    monkeypatch.setattr(commands, "watcher", None)
+    monkeypatch.setattr(commands.config, "USE_CACHE", use_cache)
+    mock_git.return_value = top
+
+    commands.watch_command(["on"])
+
+    mock_error.assert_called_once_with(error)
+    mock_watcher.assert_not_called()
+    assert commands.watcher is None
+
+
+@patch("commizard.commands.git_utils.stream_clean_diff")
+@patch("commizard.commands.llm_providers.generate")
+def test_generate_message_waits_for_watcher(mock_gen, mock_diff, monkeypatch):
+    mock_diff.return_value = ("some diff", False)
+    mock_gen.return_value = (0, "title")
+    monkeypatch.setattr(commands.llm_providers, "generation_prompt", "PROMPT:")
+    monkeypatch.setattr(commands.config, "STREAM", False)
+    watcher = MagicMock()
+    watcher.wait_for.side_effect = lambda prompt: mock_gen.assert_not_called()
+    monkeypatch.setattr(commands, "watcher", watcher)
+
+    commands.generate_message([])
+
+    watcher.wait_for.assert_called_once_with("PROMPT:some diff")
+    mock_gen.assert_called_once_with("PROMPT:some diff")
+
+
+@patch("commizard.commands.output.print_error")
+@patch("commizard.commands.output.print_success")
+@patch("commizard.commands.output.print_table")
+def test_cache_command(mock_table, mock_success, mock_error, monkeypatch):
+    from commizard import cache
+
+    monkeypatch.setattr(cache, "hits", 3)
+    monkeypatch.setattr(cache, "misses", 1)
+    cache.store("gpt", "prompt", "x" * 1500)
+
+    commands.cache_command(["stats"])
+    mock_table.assert_called_once_with(
+        ["Messages", "Size", "Hits", "Misses"],
+        [["1", "1.5 kB", "3", "1"]],
+        title=str(cache.cache_dir()),
+    )
+
+    commands.cache_command(["clear"])
+    mock_success.assert_called_once_with("Removed 1 cached messages.")
+    assert cache.stats() == (0, 0)
+
+    for opts in ([], ["purge"], ["stats", "clear"]):
+        commands.cache_command(opts)
+    assert mock_error.call_count == 3
+    mock_error.assert_called_with("Usage: cache stats | cache clear")
 
 
 @pytest.mark.parametrize(
@@ -0,0 +1,235 @@
+import pytest
+
+from commizard import compaction
+
+SOURCE = """--- a/src/app.py
++++ b/src/app.py
+@@ -1,7 +1,7 @@ def main():
+ a = 1
+ b = 2
+ c = 3
+-d = 4
++d = 5
+ e = 6
+ f = 7
+ g = 8
+@@ -20,2 +20,3 @@
+ x = 1
++y = 2
+ z = 3"""
+
+LOCK = """--- a/package-lock.json
++++ b/package-lock.json
+@@ -1,2 +1,2 @@
+-    "dep": "^1.0.0",
++    "dep": "^2.0.0",
+ }"""
+
+RENAME = """similarity index 100%
+rename from old.py
+rename to new.py"""
+
+DELETED = """deleted file mode 100644
+--- a/legacy.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+--- not a header
+-pass"""
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", 0),
+        ("abc", 1),
+        ("abcd", 1),
+        ("abcde", 2),
+    ],
+)
+def test_estimate_tokens(text, expected):
+    assert compaction.estimate_tokens(text) == expected
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("src/app.py", False),
+        ("package-lock.json", True),
+        ("web/yarn.lock", True),
+        ("Cargo.lock", True),
+        ("dist/app.js", True),
+        ("static/app.min.js", True),
+        ("vendor/lib/x.go", True),
+        ("pkg/vendor/lib/x.go", True),
+        ("src/vendored.py", False),
+        ("proto/api_pb2.py", True),
+    ],
+)
+def test_is_generated(path, expected):
+    assert compaction.is_generated(path) is expected
+
+
+def test_parse_diff():
+    diff = f"{SOURCE}\n{RENAME}\n{DELETED}\n{LOCK}"
+    files = compaction.parse_diff(diff)
+
+    assert [f.path for f in files] == [
+        "src/app.py",
+        "new.py",
+        "legacy.py",
+        "package-lock.json",
+    ]
+    assert [len(f.hunks) for f in files] == [2, 0, 1, 1]
+    assert [f.tier for f in files] == [
+        compaction.TIER_SOURCE,
+        compaction.TIER_BULK,
+        compaction.TIER_BULK,
+        compaction.TIER_GENERATED,
+    ]
+    # the removed line looking like a header stays in its hunk
+    assert files[2].hunks[0].lines == ["--- not a header", "-pass"]
+    assert files[0].hunks[0].changed == 2
+    assert files[0].hunks[1].changed == 1
+
+
+def test_parse_diff_rename_with_changes():
+    diff = """similarity index 90%
+rename from old.py
+rename to new.py
+--- a/old.py
++++ b/new.py
+@@ -1 +1 @@
+-a
++b"""
+    files = compaction.parse_diff(diff)
+    assert len(files) == 1
+    assert files[0].path == "new.py"
+    assert len(files[0].hunks) == 1
+
+
+def test_parse_diff_no_newline_marker():
+    diff = """--- a/x
++++ b/x
+@@ -1 +1 @@
+-a
+\\ No newline at end of file
++b
+\\ No newline at end of file
+--- a/y
++++ b/y"""
+    files = compaction.parse_diff(diff)
+    assert [f.path for f in files] == ["x", "y"]
+    assert files[0].hunks[0].lines[-1] == "\\ No newline at end of file"
+
+
+def test_trim_context():
+    hunk = compaction.parse_diff(SOURCE)[0].hunks[0]
+    hunk.trim_context(1)
+    assert hunk.lines == [" c = 3", "-d = 4", "+d = 5", " e = 6"]
+
+
+def test_compact_diff_fits():
+    diff = f"{SOURCE}\n{LOCK}"
+    assert compaction.compact_diff(diff, 10_000) == (diff, 3, 3)
+
+
+def test_compact_diff_prefers_source():
+    diff = f"{LOCK}\n{SOURCE}"
+    budget = compaction.estimate_tokens(diff) - 5
+
+    res, kept, total = compaction.compact_diff(diff, budget)
+
+    assert (kept, total) == (2, 3)
+    assert compaction.estimate_tokens(res) <= budget
+    assert "+d = 5" in res
+    assert "+y = 2" in res
+    # context far from the change is trimmed
+    assert " a = 1" not in res
+    assert '+    "dep": "^2.0.0",' not in res
+    assert res.endswith("[1 more file(s) omitted]")
+
+
+def test_compact_diff_keeps_order():
+    before = [f" before {i}" for i in range(10)]
+    after = [f" after {i}" for i in range(10)]
+    big = "\n".join(
+        [
+            "--- a/src/a.py",
+            "+++ b/src/a.py",
+            "@@ -1,21 +1,21 @@",
+            *before,
+            "-old",
+            "+new",
+            *after,
+        ]
+    )
+    small = "--- a/src/b.py\n+++ b/src/b.py\n@@ -1 +1 @@\n-old\n+new"
+    diff = f"{big}\n{small}"
+
+    res, kept, total = compaction.compact_diff(
+        diff, compaction.estimate_tokens(diff) - 1
+    )
+
+    assert (kept, total) == (2, 2)
+    assert res.index("src/a.py") < res.index("src/b.py")
+    assert " before 8" not in res
+    assert " before 9" in res
+    assert " after 0" in res
+    assert " after 1" not in res
+
+
+def test_compact_diff_prefers_small_hunks():
+    diff = "\n".join(
+        [
+            "--- a/src/app.py",
+            "+++ b/src/app.py",
+            "@@ -1,10 +1,10 @@ def main():",
+            *(f"-v{i} = {i}\n+v{i} = {i + 1}" for i in range(10)),
+            "@@ -20,2 +20,3 @@",
+            " x = 1",
+            "+y = 2",
+            " z = 3",
+        ]
+    )
+    budget = compaction.estimate_tokens(diff) - 3
+
+    res, kept, total = compaction.compact_diff(diff, budget)
+
+    assert (kept, total) == (1, 2)
+    assert compaction.estimate_tokens(res) <= budget
+    assert "+y = 2" in res
+    assert "+v0 = 1" not in res
+    assert "[1 hunk(s) omitted: +10 -10 lines]" in res
+
+
+def test_compact_diff_omits_files():
+    diff = f"{SOURCE}\n{RENAME}\n{LOCK}"
+
+    res, kept, _ = compaction.compact_diff(diff, 10)
+
+    assert kept == 0
+    assert compaction.estimate_tokens(res) <= 10
+    assert res.endswith("more file(s) omitted]")
+
+
+def test_compact_diff_huge_hunk():
+    lines = [f"+line {i}" for i in range(1000)]
+    diff = "\n".join(["--- a/x", "+++ b/x", "@@ -0,0 +1,1000 @@", *lines])
+
+    res, kept, total = compaction.compact_diff(diff, 100)
+
+    assert (kept, total) == (1, 1)
+    assert compaction.estimate_tokens(res) <= 100
+    assert res.startswith("--- a/x\n+++ b/x\n@@ -0,0 +1,1000 @@\n+line 0\n")
+    assert res.endswith("[hunk truncated]")
+
+
+# below ~10 tokens, not even the note about the omitted files fits
+@pytest.mark.parametrize("max_tokens", range(10, 60))
+def test_compact_diff_huge_hunk_fits(max_tokens):
+    lines = [f"+line {i}" for i in range(2000)]
+    diff = "\n".join(["--- a/x", "+++ b/x", "@@ -0,0 +1,2000 @@", *lines])
+
+    res, _, _ = compaction.compact_diff(diff, max_tokens)
+
+    assert compaction.estimate_tokens(res) <= max_tokens
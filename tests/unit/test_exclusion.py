@@ -0,0 +1,317 @@
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from commizard import config, exclusion, git_utils
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("package-lock.json", True),
+        ("web/package-lock.json", True),
+        ("poetry.lock", True),
+        ("static/app.min.js", True),
+        ("tests/__snapshots__/view.test.js.snap", True),
+        ("docs/generated/api.md", True),
+        ("generated/api.md", True),
+        ("vendor/lib/x.go", True),
+        ("pkg/vendor/lib/x.go", True),
+        ("src/vendored.py", False),
+        ("vendor", False),
+        ("src/app.py", False),
+        ("src/lock.py", False),
+        ("docs/index.md", False),
+    ],
+)
+def test_matches_patterns(path, expected):
+    patterns = (
+        "package-lock.json",
+        "*.lock",
+        "*.min.js",
+        "*.snap",
+        "*generated/*",
+        "vendor/",
+    )
+    assert exclusion.matches_patterns(path, patterns) is expected
+
+
+def test_matches_patterns_none():
+    assert not exclusion.matches_patterns("yarn.lock", ())
+
+
+@patch("commizard.exclusion.git_utils.run_git_command")
+def test_read_attributes(mock_run):
+    mock_run.return_value.returncode = 0
+    mock_run.return_value.stdout = (
+        "gen.js\0linguist-generated\0set\0gen.js\0diff\0unspecified\0"
+        "data.bin\0linguist-generated\0unspecified\0data.bin\0diff\0unset\0"
+        "old.js\0linguist-generated\0false\0old.js\0diff\0unspecified\0"
+        "api.py\0linguist-generated\0true\0api.py\0diff\0unspecified\0"
+    )
+
+    marked = exclusion.read_attributes(
+        ["gen.js", "data.bin", "old.js", "api.py"], staged=True, top="/repo"
+    )
+
+    assert marked == {"gen.js", "data.bin", "api.py"}
+    # the paths are given on the input, not on the command line
+    mock_run.assert_called_once_with(
+        [
+            "check-attr",
+            "--cached",
+            "--stdin",
+            "-z",
+            "linguist-generated",
+            "diff",
+        ],
+        "/repo",
+        "gen.js\0data.bin\0old.js\0api.py\0",
+    )
+
+
+@pytest.mark.parametrize("paths, returncode", [([], 0), (["a.py"], 128)])
+@patch("commizard.exclusion.git_utils.run_git_command")
+def test_read_attributes_nothing(mock_run, paths, returncode):
+    mock_run.return_value.returncode = returncode
+    mock_run.return_value.stdout = ""
+
+    assert exclusion.read_attributes(paths) == set()
+
+
+@pytest.mark.parametrize(
+    "added, removed, path, max_lines, max_bytes, expected",
+    [
+        (10, 5, "small.txt", 100, 1000, False),
+        (60, 50, "small.txt", 100, 1000, True),
+        (60, 50, "small.txt", None, 1000, False),
+        (1, 0, "big.json", 100, 1000, True),
+        (1, 0, "big.json", 100, None, False),
+        (0, 3, "deleted.txt", 100, 1000, False),
+    ],
+)
+def test_is_large(
+    added, removed, path, max_lines, max_bytes, expected, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(config, "EXCLUDE_MAX_LINES", max_lines)
+    monkeypatch.setattr(config, "EXCLUDE_MAX_FILE_BYTES", max_bytes)
+    (tmp_path / "small.txt").write_text("x\n" * 10)
+    (tmp_path / "big.json").write_text("x" * 2000)
+
+    assert exclusion.is_large(added, removed, path, str(tmp_path)) is expected
+
+
+@patch("commizard.exclusion.read_attributes")
+@patch("commizard.exclusion.git_utils.run_git_command")
+def test_find_excluded(mock_run, mock_attributes, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EXCLUDE_PATTERNS", ["*.lock"])
+    monkeypatch.setattr(config, "EXCLUDE_MAX_LINES", 1000)
+    monkeypatch.setattr(config, "EXCLUDE_MAX_FILE_BYTES", None)
+    mock_run.return_value.returncode = 0
+    mock_run.return_value.stdout = f"{tmp_path}\n"
+    mock_attributes.return_value = {"gen.js"}
+    stats = [
+        (3, 1, "src/app.py"),
+        (900, 800, "data.csv"),
+        (None, None, "logo.png"),
+        (40, 2, "poetry.lock"),
+        (10, 0, "gen.js"),
+    ]
+
+    excluded = exclusion.find_excluded(stats, staged=True, cwd="/repo/src")
+
+    assert excluded == [
+        (900, 800, "data.csv"),
+        (None, None, "logo.png"),
+        (40, 2, "poetry.lock"),
+        (10, 0, "gen.js"),
+    ]
+    mock_run.assert_called_once_with(
+        ["rev-parse", "--show-toplevel"], "/repo/src"
+    )
+    # only the files that aren't excluded yet are checked
+    mock_attributes.assert_called_once_with(
+        ["src/app.py", "gen.js"], True, str(tmp_path)
+    )
+
+
+@patch("commizard.exclusion.read_attributes")
+@patch("commizard.exclusion.git_utils.run_git_command")
+def test_find_excluded_without_attributes(
+    mock_run, mock_attributes, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    (tmp_path / ".git").mkdir()
+    mock_run.return_value.returncode = 0
+    mock_run.return_value.stdout = f"{tmp_path}\n"
+
+    assert exclusion.find_excluded([(1, 1, "src/app.py")]) == []
+    # no gitattributes file, so check-attr isn't run
+    mock_attributes.assert_not_called()
+
+
+def test_has_attributes(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    top = tmp_path / "repo"
+    (top / ".git" / "info").mkdir(parents=True)
+    (top / "src" / "pkg").mkdir(parents=True)
+    (top / "docs").mkdir()
+    paths = ["src/pkg/app.py", "README.md"]
+    assert not exclusion.has_attributes(paths, str(top))
+
+    for attributes in (
+        top / ".gitattributes",
+        top / "src" / ".gitattributes",
+        top / "src" / "pkg" / ".gitattributes",
+        top / ".git" / "info" / "attributes",
+        tmp_path / "config" / "git" / "attributes",
+    ):
+        attributes.parent.mkdir(parents=True, exist_ok=True)
+        attributes.write_text("* -diff\n")
+        assert exclusion.has_attributes(paths, str(top))
+        attributes.unlink()
+
+    # those of other directories don't apply
+    (top / "docs" / ".gitattributes").write_text("* -diff\n")
+    assert not exclusion.has_attributes(paths, str(top))
+
+
+def test_has_attributes_linked_worktree(tmp_path):
+    # the git directory is elsewhere
+    (tmp_path / ".git").write_text("gitdir: /elsewhere\n")
+    assert exclusion.has_attributes(["a.py"], str(tmp_path))
+
+
+@patch("commizard.exclusion.git_utils.run_git_command")
+def test_find_excluded_not_a_repo(mock_run):
+    mock_run.return_value.returncode = 128
+
+    assert exclusion.find_excluded([(None, None, "logo.png")]) == []
+
+
+def test_find_excluded_nothing_changed():
+    assert exclusion.find_excluded([]) == []
+
+
+@patch("commizard.exclusion.find_excluded")
+@patch("commizard.exclusion.git_utils.diff_numstat")
+def test_exclude_files(mock_numstat, mock_find):
+    mock_numstat.return_value = [
+        (3, 1, "src/app.py"),
+        (40, 2, "src/poetry.lock"),
+        (1, 1, "src/a.min.js"),
+    ]
+    mock_find.return_value = [
+        (40, 2, "src/poetry.lock"),
+        (1, 1, "src/a.min.js"),
+    ]
+    scope = git_utils.DiffScope(paths=["src"])
+
+    res = exclusion.exclude_files(scope, "/repo")
+
+    assert res == (
+        git_utils.DiffScope(
+            paths=["src"], exclude=["src/a.min.js", "src/poetry.lock"]
+        ),
+        [(3, 1, "src/app.py")],
+        [(40, 2, "src/poetry.lock"), (1, 1, "src/a.min.js")],
+    )
+    mock_numstat.assert_called_once_with(scope, "/repo")
+    mock_find.assert_called_once_with(mock_numstat.return_value, False, "/repo")
+
+
+@pytest.mark.parametrize(
+    "numstat, found",
+    [(None, []), ([], []), ([(3, 1, "src/app.py")], [])],
+)
+@patch("commizard.exclusion.find_excluded")
+@patch("commizard.exclusion.git_utils.diff_numstat")
+def test_exclude_files_none(mock_numstat, mock_find, numstat, found):
+    mock_numstat.return_value = numstat
+    mock_find.return_value = found
+    scope = git_utils.DiffScope(staged=True)
+
+    assert exclusion.exclude_files(scope) == (scope, numstat, [])
+
+
+def test_summarize_and_report(monkeypatch):
+    monkeypatch.setattr(git_utils, "PATCH_BYTES_PER_LINE", 10)
+    excluded = [(100, 50, "yarn.lock"), (None, None, "logo.png")]
+
+    assert exclusion.summarize(excluded) == (
+        "[2 generated, binary or large file(s), not shown:]\n"
+        "yarn.lock | +100 -50\n"
+        "logo.png | binary"
+    )
+    # the binary file's patch is a single line, which isn't counted
+    assert exclusion.skipped_bytes(excluded) == 18 + 40 + 1500
+    assert exclusion.report(excluded) == (
+        "2 generated, binary or large file(s) were left out of the diff, "
+        "about 1.6 kB (~390 tokens)."
+    )
+
+
+@pytest.mark.parametrize("max_pathspecs", [100, 1])
+def test_exclude_files_real_repo(tmp_path, monkeypatch, max_pathspecs):
+    run = MagicMock(side_effect=git_utils.run_git_command)
+    monkeypatch.setattr(git_utils, "run_git_command", run)
+    monkeypatch.setattr(git_utils, "MAX_EXCLUDE_PATHSPECS", max_pathspecs)
+    monkeypatch.setattr(config, "EXCLUDE_PATTERNS", ["*.lock"])
+    monkeypatch.setattr(config, "EXCLUDE_MAX_LINES", None)
+    monkeypatch.setattr(config, "EXCLUDE_MAX_FILE_BYTES", None)
+    repo = str(tmp_path)
+    for args in (
+        ["init", "-q"],
+        ["config", "user.email", "test@example.com"],
+        ["config", "user.name", "test"],
+    ):
+        git_utils.run_git_command(args, repo)
+    (tmp_path / ".gitattributes").write_text("dist/* linguist-generated\n")
+    (tmp_path / "dist").mkdir()
+    for name in ("app.py", "uv.lock", "dist/bundle.js"):
+        (tmp_path / name).write_text("a\n")
+    git_utils.run_git_command(["add", "-A"], repo)
+    git_utils.run_git_command(["commit", "-q", "-m", "initial"], repo)
+    for name in ("app.py", "uv.lock", "dist/bundle.js"):
+        (tmp_path / name).write_text("b\n")
+
+    scope, stats, excluded = exclusion.exclude_files(cwd=repo)
+    diff, _ = git_utils.stream_clean_diff(cwd=repo, scope=scope)
+
+    assert [path for _, _, path in excluded] == ["dist/bundle.js", "uv.lock"]
+    assert stats == [(1, 1, "app.py")]
+    assert diff == "--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-a\n+b"
+
+
+def test_read_diff_real_repo(tmp_path, monkeypatch):
+    popen = MagicMock(side_effect=subprocess.Popen)
+    monkeypatch.setattr(subprocess, "Popen", popen)
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    monkeypatch.setattr(config, "EXCLUDE_PATTERNS", ["*.lock"])
+    monkeypatch.setattr(config, "EXCLUDE_MAX_LINES", None)
+    monkeypatch.setattr(config, "EXCLUDE_MAX_FILE_BYTES", None)
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for args in (
+        ["init", "-q"],
+        ["config", "user.email", "test@example.com"],
+        ["config", "user.name", "test"],
+    ):
+        git_utils.run_git_command(args, str(repo))
+    names = ["app.py", *(f"{i}.lock" for i in range(300))]
+    for name in names:
+        (repo / name).write_text("a\n")
+    git_utils.run_git_command(["add", "-A"], str(repo))
+    git_utils.run_git_command(["commit", "-q", "-m", "initial"], str(repo))
+    for name in names:
+        (repo / name).write_text("b\n")
+    popen.reset_mock()
+
+    diff, truncated, excluded = exclusion.read_diff(None, 200, str(repo))
+
+    assert diff == "--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-a\n+b"
+    assert not truncated
+    assert len(excluded) == 300
+    # the diff, and the root the first time. There's no gitattributes file.
+    assert popen.call_count == 2
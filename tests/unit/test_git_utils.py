@@ -1,3 +1,4 @@
+import io
 import subprocess
 from unittest.mock import MagicMock, patch
 
@@ -61,6 +62,7 @@ def test_run_git_command(mock_run, args, mock_result, raised_exception):
             git_utils.run_git_command(args)
         mock_run.assert_called_once_with(
             ["git", *args],
+            input=None,
             capture_output=True,
             text=True,
             encoding="utf-8",
@@ -73,6 +75,7 @@ def test_run_git_command(mock_run, args, mock_result, raised_exception):
     result = git_utils.run_git_command(args)
     mock_run.assert_called_once_with(
         ["git", *args],
+        input=None,
         capture_output=True,
         text=True,
         encoding="utf-8",
@@ -117,7 +120,9 @@ def test_run_git_command(mock_run, args, mock_result, raised_exception):
 def test_is_inside_working_tree(mock_run, mock_val, expected_result):
     mock_run.return_value = mock_val
     res = git_utils.is_inside_working_tree()
-    mock_run.assert_called_once_with(["rev-parse", "--is-inside-work-tree"])
+    mock_run.assert_called_once_with(
+        ["rev-parse", "--is-inside-work-tree"], None
+    )
     assert res == expected_result
 
 
@@ -164,36 +169,29 @@ def test_is_changed(mock_run, mock_val, expected):
 
 
 @pytest.mark.parametrize(
-    "is_changed_return, run_git_returncode, run_git_stdout, expected_output",
+    "run_git_returncode, run_git_stdout, expected_output",
     [
         # No changes detected
-        (False, 0, "some diff", ""),
+        (0, "", ""),
         # Changes detected, git diff succeeds
         (
-            True,
             0,
             "diff --git a/file.py b/file.py\n+new line\n-old line\n\n",
             "diff --git a/file.py b/file.py\n+new line\n-old line",
         ),
-        # Changes detected, git diff fails (non-zero return code)
-        (True, 1, "error output", None),
-        # Changes detected, git diff succeeds but stdout is empty
-        (True, 0, "", ""),
-        # Changes detected, git diff succeeds with whitespace-only output
-        (True, 0, "   \n\t  ", ""),
+        # git diff fails (non-zero return code)
+        (1, "error output", None),
+        # git diff succeeds with whitespace-only output
+        (0, "   \n\t  ", ""),
     ],
 )
 @patch("commizard.git_utils.run_git_command")
-@patch("commizard.git_utils.is_changed")
 def test_get_diff(
-    mock_is_changed,
     mock_run_git_command,
-    is_changed_return,
     run_git_returncode,
     run_git_stdout,
     expected_output,
 ):
-    mock_is_changed.return_value = is_changed_return
     mock_result = MagicMock()
     mock_result.returncode = run_git_returncode
     mock_result.stdout = run_git_stdout
@@ -201,16 +199,35 @@ def test_get_diff(
 
     result = git_utils.get_diff()
 
-    if is_changed_return:
-        mock_run_git_command.assert_called_once_with(
-            ["--no-pager", "diff", "--no-color"]
-        )
-    else:
-        mock_run_git_command.assert_not_called()
-
+    # a single git invocation is enough to know if anything changed
+    mock_run_git_command.assert_called_once_with(
+        ["--no-pager", "diff", "--no-color", "-O/dev/null"]
+    )
     assert result == expected_output
 
 
+@patch("commizard.git_utils.run_git_command")
+def test_get_toplevel(mock_run):
+    mock_run.return_value.returncode = 0
+    mock_run.return_value.stdout = "/repo\n"
+
+    assert git_utils.get_toplevel("/repo/src") == "/repo"
+    assert git_utils.get_toplevel("/repo/src/") == "/repo"
+    mock_run.assert_called_once_with(
+        ["rev-parse", "--show-toplevel"], "/repo/src"
+    )
+
+
+@patch("commizard.git_utils.run_git_command")
+def test_get_toplevel_not_a_repo(mock_run):
+    mock_run.return_value.returncode = 128
+
+    assert git_utils.get_toplevel("/somewhere") is None
+    # a failure isn't remembered, the directory may become a repository
+    assert git_utils.get_toplevel("/somewhere") is None
+    assert mock_run.call_count == 2
+
+
 @pytest.mark.parametrize(
     "stdout, stderr, expected_ret",
     [
@@ -235,6 +252,97 @@ def test_commit(mock_run_git_command, stdout, stderr, expected_ret):
     assert output == expected_ret
 
 
+@pytest.mark.parametrize(
+    "scope, diff_args, commit_args",
+    [
+        (
+            git_utils.DiffScope(),
+            ["--no-pager", "diff", "--no-color", "-O/dev/null"],
+            ["commit", "-a", "-m", "msg"],
+        ),
+        (
+            git_utils.DiffScope(staged=True),
+            ["--no-pager", "diff", "--no-color", "-O/dev/null", "--cached"],
+            ["commit", "-m", "msg"],
+        ),
+        (
+            git_utils.DiffScope(paths=["src", "-weird"]),
+            [
+                "--no-pager",
+                "diff",
+                "--no-color",
+                "-O/dev/null",
+                "--",
+                "src",
+                "-weird",
+            ],
+            ["commit", "-m", "msg", "--", "src", "-weird"],
+        ),
+        (
+            git_utils.DiffScope(exclude=["yarn.lock", "a*.snap"]),
+            [
+                "--no-pager",
+                "diff",
+                "--no-color",
+                "-O/dev/null",
+                "--",
+                ":(top,exclude,literal)yarn.lock",
+                ":(top,exclude,literal)a*.snap",
+            ],
+            ["commit", "-a", "-m", "msg"],
+        ),
+        (
+            git_utils.DiffScope(paths=["src"], exclude=["src/x.lock"]),
+            [
+                "--no-pager",
+                "diff",
+                "--no-color",
+                "-O/dev/null",
+                "--",
+                "src",
+                ":(top,exclude,literal)src/x.lock",
+            ],
+            ["commit", "-m", "msg", "--", "src"],
+        ),
+    ],
+)
+def test_diff_scope(scope, diff_args, commit_args):
+    assert scope.diff_args() == diff_args
+    assert scope.commit_args("msg") == commit_args
+    assert scope.skipped() == set()
+
+
+def test_diff_scope_too_many_excluded(monkeypatch):
+    monkeypatch.setattr(git_utils, "MAX_EXCLUDE_PATHSPECS", 1)
+    scope = git_utils.DiffScope(paths=["src"], exclude=["src/a", "src/b"])
+
+    # they're left out while the diff is read
+    assert scope.diff_args()[-2:] == ["--", "src"]
+    assert scope.skipped() == {
+        b"diff --git a/src/a b/src/a",
+        b"diff --git a/src/b b/src/b",
+    }
+
+
+@patch("commizard.git_utils.run_git_command")
+def test_commit_scope(mock_run_git_command):
+    mock_run_git_command.return_value.stdout = "ok"
+    mock_run_git_command.return_value.returncode = 0
+
+    git_utils.commit("msg", git_utils.DiffScope(staged=True))
+
+    mock_run_git_command.assert_called_once_with(["commit", "-m", "msg"])
+
+
+@patch("commizard.git_utils.subprocess.Popen")
+def test_stream_clean_diff_scope(mock_popen):
+    mock_popen.return_value = fake_popen(b"+a\n")
+    scope = git_utils.DiffScope(staged=True)
+
+    assert git_utils.stream_clean_diff(scope=scope) == ("+a", False)
+    assert mock_popen.call_args.args[0] == ["git", *scope.diff_args()]
+
+
 @pytest.mark.parametrize(
     "input_diff, expected_output",
     [
@@ -258,8 +366,355 @@ def test_clean_diff(input_diff, expected_output):
     assert result == expected_output
 
 
-@patch("commizard.git_utils.clean_diff")
-@patch("commizard.git_utils.get_diff")
-def test_get_clean_diff(mock_diff, mock_clean_diff):
-    git_utils.get_clean_diff()
-    mock_clean_diff.assert_called_once_with(mock_diff.return_value)
+@patch("commizard.git_utils.stream_clean_diff")
+def test_get_clean_diff(mock_stream):
+    mock_stream.return_value = ("the diff", True)
+    assert git_utils.get_clean_diff(100) == "the diff"
+    mock_stream.assert_called_once_with(100)
+
+
+def fake_popen(stdout: bytes, returncode: int = 0):
+    proc = MagicMock()
+    proc.stdout = io.BytesIO(stdout)
+    proc.poll.return_value = None
+    proc.wait.return_value = returncode
+    return proc
+
+
+@pytest.mark.parametrize(
+    "stdout, max_bytes, expected_lines, truncated",
+    [
+        (b"a\nb\r\nc", None, ["a", "b", "c"], False),
+        (b"one\rtwo\n\nthree\n", None, ["one", "two", "", "three"], False),
+        (b"", None, [], False),
+        (b"12345\n6789\n", 6, ["12345"], True),
+        (b"12345\n6789\n", 11, ["12345", "6789"], False),
+        (b"12345\n6789\n", 10, ["12345"], True),
+        (b"a very long line without a line break", 4, [], True),
+        (b"\xc3\xa9t\xc3\xa9\n\xff\n", None, ["\xe9t\xe9", ""], False),
+    ],
+)
+@patch("commizard.git_utils.subprocess.Popen")
+def test_git_stream(mock_popen, stdout, max_bytes, expected_lines, truncated):
+    proc = fake_popen(stdout)
+    mock_popen.return_value = proc
+
+    with git_utils.GitStream(["diff"], max_bytes) as stream:
+        lines = list(stream)
+
+    mock_popen.assert_called_once_with(
+        ["git", "diff"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    assert lines == expected_lines
+    assert stream.truncated == truncated
+    assert proc.terminate.called == truncated
+    assert stream.returncode == 0
+    assert proc.stdout.closed
+    proc.wait.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "max_bytes, expected_lines, truncated",
+    [
+        (None, ["diff --git a/a b/a", "+a", "diff --git a/c b/c", "+c"], False),
+        # the skipped patch doesn't count
+        (44, ["diff --git a/a b/a", "+a", "diff --git a/c b/c", "+c"], False),
+        (40, ["diff --git a/a b/a", "+a"], True),
+    ],
+)
+@patch("commizard.git_utils.subprocess.Popen")
+def test_git_stream_skip(mock_popen, max_bytes, expected_lines, truncated):
+    mock_popen.return_value = fake_popen(
+        b"diff --git a/a b/a\n+a\n"
+        + b"diff --git a/b b/b\n"
+        + b"+b\n" * 100
+        + b"diff --git a/c b/c\n+c\n"
+    )
+
+    skip = {b"diff --git a/b b/b"}
+    with git_utils.GitStream(["diff"], max_bytes, skip=skip) as stream:
+        lines = list(stream)
+
+    assert lines == expected_lines
+    assert stream.truncated == truncated
+
+
+@pytest.mark.parametrize(
+    "stdout, head, lines",
+    [
+        (b"1\t1\ta\0\0+a\n+b\n", b"1\t1\ta", ["+a", "+b"]),
+        (b"1\t1\ta\nb\0\0+a\n", b"1\t1\ta\nb", ["+a"]),
+        (b"1\t1\ta\0", b"1\t1\ta\0", []),
+        (b"", b"", []),
+    ],
+)
+@patch("commizard.git_utils.subprocess.Popen")
+def test_git_stream_read_until(mock_popen, stdout, head, lines):
+    mock_popen.return_value = fake_popen(stdout)
+
+    # what's read until the end doesn't count toward the budget
+    with git_utils.GitStream(["diff"], 6) as stream:
+        assert stream.read_until(b"\0\0") == head
+        assert list(stream) == lines
+
+    assert not stream.truncated
+
+
+@patch("commizard.git_utils.subprocess.Popen")
+def test_git_stream_early_exit_terminates(mock_popen):
+    proc = fake_popen(b"1\n2\n3\n", returncode=-15)
+    mock_popen.return_value = proc
+
+    with git_utils.GitStream(["log"]) as stream:
+        assert next(stream) == "1"
+
+    proc.terminate.assert_called_once()
+    assert stream.returncode == -15
+    # iterating a closed stream doesn't read anything else
+    assert list(stream) == []
+
+
+@pytest.mark.parametrize(
+    "stdout, returncode, max_bytes, expected",
+    [
+        (b"", 0, None, ("", False)),
+        (
+            b"diff --git a/f b/f\nindex 1..2\n+new\n-old\n\n",
+            0,
+            None,
+            ("+new\n-old", False),
+        ),
+        (b"error output", 1, None, ("", False)),
+        (b"   \n\t  ", 0, None, ("", False)),
+        (
+            b"diff --git a/f b/f\n+new\n-old\n",
+            0,
+            24,
+            ("+new", True),
+        ),
+    ],
+)
+@patch("commizard.git_utils.run_git_command")
+@patch("commizard.git_utils.subprocess.Popen")
+def test_stream_clean_diff(
+    mock_popen, mock_run, stdout, returncode, max_bytes, expected
+):
+    mock_popen.return_value = fake_popen(stdout, returncode)
+
+    assert git_utils.stream_clean_diff(max_bytes) == expected
+    # a single git process spawn per diff
+    mock_run.assert_not_called()
+    mock_popen.assert_called_once()
+    assert mock_popen.call_args.args[0] == [
+        "git",
+        "--no-pager",
+        "diff",
+        "--no-color",
+        "-O/dev/null",
+    ]
+
+
+@patch("commizard.git_utils.run_git_command")
+def test_diff_numstat(mock_run):
+    mock_run.return_value.returncode = 0
+    mock_run.return_value.stdout = (
+        "3\t1\tsrc/app.py\x00-\t-\tlogo.png\x000\t5\tdir with space/a\tb.py\x00"
+    )
+    scope = git_utils.DiffScope(staged=True)
+
+    assert git_utils.diff_numstat(scope) == [
+        (3, 1, "src/app.py"),
+        (None, None, "logo.png"),
+        (0, 5, "dir with space/a\tb.py"),
+    ]
+    mock_run.assert_called_once_with(
+        [
+            "--no-pager",
+            "diff",
+            "--no-color",
+            "-O/dev/null",
+            "--numstat",
+            "-z",
+            "--no-renames",
+            "--cached",
+        ],
+        None,
+    )
+
+
+@patch("commizard.git_utils.run_git_command")
+def test_diff_numstat_error(mock_run):
+    mock_run.return_value.returncode = 128
+    assert git_utils.diff_numstat() is None
+
+
+def test_parse_numstat():
+    assert git_utils.parse_numstat(
+        "3\t1\tsrc/app.py\x001\t0\t\x00old name.py\x00new.py\x00"
+        "-\t-\tlogo.png\x00"
+    ) == [
+        ((3, 1, "src/app.py"), None),
+        ((1, 0, "new.py"), "old name.py"),
+        ((None, None, "logo.png"), None),
+    ]
+
+
+def init_repo(path, files: dict[str, str]) -> None:
+    for args in (
+        ["init", "-q"],
+        ["config", "user.email", "test@example.com"],
+        ["config", "user.name", "test"],
+    ):
+        git_utils.run_git_command(args, str(path))
+    for name, text in files.items():
+        (path / name).write_text(text)
+    git_utils.run_git_command(["add", "-A"], str(path))
+    git_utils.run_git_command(["commit", "-q", "-m", "initial"], str(path))
+
+
+def test_stream_stats_and_diff(tmp_path):
+    init_repo(tmp_path, {"a.py": "a\n", "b.lock": "a\n", "old.py": "x\n" * 9})
+    (tmp_path / "a.py").write_text("b\n")
+    (tmp_path / "b.lock").write_text("b\n" * 1000)
+    git_utils.run_git_command(["mv", "old.py", "new.py"], str(tmp_path))
+    git_utils.run_git_command(["add", "-A"], str(tmp_path))
+    seen = []
+
+    def choose(stats):
+        seen.extend(stats)
+        return ["b.lock", "new.py"]
+
+    stats, diff, truncated = git_utils.stream_stats_and_diff(
+        choose, 200, str(tmp_path), git_utils.DiffScope(staged=True)
+    )
+
+    assert (
+        stats == seen == [(1, 1, "a.py"), (1000, 1, "b.lock"), (0, 0, "new.py")]
+    )
+    # the renamed file's patch is dropped too, and the budget is the rest's
+    assert diff == "--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-a\n+b"
+    assert not truncated
+
+
+def test_stream_stats_and_diff_error(tmp_path):
+    choose = MagicMock(return_value=[])
+
+    assert git_utils.stream_stats_and_diff(choose, cwd=str(tmp_path)) == (
+        None,
+        "",
+        False,
+    )
+
+
+def test_select_patches(monkeypatch):
+    monkeypatch.setattr(git_utils, "PATCH_BYTES_PER_LINE", 10)
+    stats = [
+        (1, 1, "small.py"),
+        (30, 0, "big.py"),
+        (50, 50, "package-lock.json"),
+        (None, None, "logo.png"),
+        (10, 10, "medium.py"),
+        (500, 0, "huge.py"),
+    ]
+    listing = sum(len(git_utils.format_stat(*s)) + 1 for s in stats)
+
+    # the largest changes to source files first, skipping those too large
+    assert git_utils.select_patches(stats, listing + 700) == {
+        "big.py",
+        "medium.py",
+        "small.py",
+    }
+    assert git_utils.select_patches(stats, listing + 400) == {
+        "big.py",
+        "small.py",
+    }
+    assert git_utils.select_patches(stats, 0) == set()
+
+
+@pytest.mark.parametrize(
+    "added, removed, expected",
+    [(3, 1, "a.py | +3 -1"), (None, None, "a.py | binary")],
+)
+def test_format_stat(added, removed, expected):
+    assert git_utils.format_stat(added, removed, "a.py") == expected
+
+
+@patch("commizard.git_utils.stream_clean_diff")
+@patch("commizard.git_utils.select_patches")
+@patch("commizard.git_utils.diff_numstat")
+def test_adaptive_clean_diff(mock_numstat, mock_select, mock_diff):
+    mock_numstat.return_value = [
+        (3, 1, "src/*.py"),
+        (None, None, "logo.png"),
+        (200, 0, "generated.py"),
+    ]
+    mock_select.return_value = {"src/*.py"}
+    mock_diff.return_value = ("the diff", False)
+    scope = git_utils.DiffScope(staged=True, paths=["src", "logo.png"])
+
+    res = git_utils.adaptive_clean_diff(1000, scope)
+
+    assert res == (
+        (
+            "the diff\n\n"
+            "[2 more changed file(s), not shown in full:]\n"
+            "logo.png | binary\n"
+            "generated.py | +200 -0"
+        ),
+        False,
+    )
+    mock_numstat.assert_called_once_with(scope, None)
+    mock_select.assert_called_once_with(mock_numstat.return_value, 1000)
+    # only the chosen files' patches are read
+    mock_diff.assert_called_once_with(
+        1000,
+        None,
+        git_utils.DiffScope(staged=True, paths=[":(top,literal)src/*.py"]),
+    )
+
+
+@pytest.mark.parametrize(
+    "numstat, chosen, max_bytes, expected, reads_full_diff",
+    [
+        # everything fits, so the usual diff is read
+        ([(1, 1, "a.py")], {"a.py"}, 1000, ("full", False), True),
+        # git failed, or there's no budget
+        (None, set(), 1000, ("full", False), True),
+        ([(1, 1, "a.py")], set(), None, ("full", False), True),
+        ([], set(), 1000, ("", False), False),
+        (
+            [(1, 1, "a.py")],
+            set(),
+            1000,
+            (
+                "[1 more changed file(s), not shown in full:]\na.py | +1 -1",
+                False,
+            ),
+            False,
+        ),
+    ],
+)
+@patch("commizard.git_utils.stream_clean_diff")
+@patch("commizard.git_utils.select_patches")
+@patch("commizard.git_utils.diff_numstat")
+def test_adaptive_clean_diff_fallbacks(
+    mock_numstat,
+    mock_select,
+    mock_diff,
+    numstat,
+    chosen,
+    max_bytes,
+    expected,
+    reads_full_diff,
+):
+    mock_numstat.return_value = numstat
+    mock_select.return_value = chosen
+    mock_diff.return_value = ("full", False)
+
+    assert git_utils.adaptive_clean_diff(max_bytes) == expected
+    if reads_full_diff:
+        mock_diff.assert_called_once_with(
+            max_bytes, None, git_utils.DiffScope()
+        )
+    else:
+        mock_diff.assert_not_called()
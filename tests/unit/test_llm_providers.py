@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from unittest.mock import MagicMock, Mock, patch
+import json
+from unittest.mock import MagicMock, Mock, call, patch
 
 import pytest
 import requests
@@ -8,6 +9,148 @@ import requests
 from commizard import llm_providers as llm
 
 
+@pytest.fixture
+def fresh_session(monkeypatch):
+    monkeypatch.setattr(llm, "_session", None)
+    yield
+    llm.close_session()
+
+
+def test_get_session_is_shared_and_tuned(fresh_session, monkeypatch):
+    monkeypatch.setattr(llm.config, "HTTP_POOL_SIZE", 3)
+    session = llm.get_session()
+    assert llm.get_session() is session
+
+    adapter = session.get_adapter("http://127.0.0.1:11434/")
+    assert adapter._pool_maxsize == 3  # noqa: SLF001
+    assert adapter.max_retries.connect == 0
+    assert "POST" not in adapter.max_retries.allowed_methods
+    assert session.get_adapter("https://example.com") is adapter
+
+
+def test_close_session(fresh_session):
+    session = llm.get_session()
+    with patch.object(session, "close") as mock_close:
+        llm.close_session()
+        mock_close.assert_called_once()
+    assert llm.get_session() is not session
+
+    # closing twice, or before the session exists is harmless
+    llm.close_session()
+    llm.close_session()
+
+
+@pytest.mark.parametrize("keep_alive", [True, False])
+@patch("commizard.llm_providers.get_session")
+@patch("requests.request")
+def test_send_request(mock_request, mock_session, keep_alive, monkeypatch):
+    monkeypatch.setattr(llm.config, "HTTP_KEEP_ALIVE", keep_alive)
+
+    res = llm.send_request("GET", "http://test", timeout=1)
+
+    if keep_alive:
+        mock_session.return_value.request.assert_called_once_with(
+            "GET", "http://test", timeout=1
+        )
+        mock_request.assert_not_called()
+        assert res is mock_session.return_value.request.return_value
+    else:
+        mock_request.assert_called_once_with("GET", "http://test", timeout=1)
+        mock_session.assert_not_called()
+        assert res is mock_request.return_value
+
+
+@patch("commizard.llm_providers.get_session")
+def test_send_request_in_generation(mock_session):
+    request = mock_session.return_value.request
+    generation = llm.Generation(
+        lambda: (0, llm.send_request("GET", "http://test", timeout=1))
+    )
+    generation.start().wait()
+
+    # the body is left to read, so cancelling can close the response
+    request.assert_called_once_with(
+        "GET", "http://test", timeout=1, stream=True
+    )
+    assert generation.responses == [request.return_value]
+
+
+def test_generation():
+    generation = llm.Generation(lambda prompt, suffix="": (0, prompt + suffix))
+    assert generation.start("Fix", suffix=" it").wait() == (0, "Fix it")
+    assert generation.finished.is_set()
+
+
+def test_generation_error():
+    def fail():
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError, match="bad"):
+        llm.Generation(fail).start().wait()
+
+
+def test_generation_cancel():
+    import threading
+
+    sent = threading.Event()
+    closed = threading.Event()
+    response = MagicMock()
+    response.close.side_effect = closed.set
+    printed = []
+
+    def request(print_chunk):
+        generation.track(response)
+        print_chunk("Fix")
+        sent.set()
+        closed.wait(5)
+        print_chunk(" it")
+        return 0, "Fix it"
+
+    generation = llm.Generation(request)
+    generation.start(generation.guard(printed.append))
+    assert sent.wait(5)
+    generation.cancel()
+
+    assert generation.wait() == (1, "Generation cancelled.")
+    response.close.assert_called_once()
+    assert generation.finished.wait(5)
+    # nothing was printed after cancelling
+    assert printed == ["Fix"]
+
+    # a response arriving after that is closed right away
+    late = MagicMock()
+    generation.track(late)
+    late.close.assert_called_once()
+
+
+def test_generation_cancelled_before_start():
+    func = MagicMock()
+    generation = llm.Generation(func)
+    generation.cancel()
+
+    assert generation.start().wait() == (1, "Generation cancelled.")
+    func.assert_not_called()
+
+
+def test_generation_interrupted(monkeypatch):
+    import threading
+
+    release = threading.Event()
+    generation = llm.Generation(lambda: (0, str(release.wait(5))))
+    response = MagicMock()
+    generation.track(response)
+    monkeypatch.setattr(
+        generation.finished, "wait", MagicMock(side_effect=KeyboardInterrupt)
+    )
+
+    with pytest.raises(KeyboardInterrupt):
+        generation.start().wait()
+    release.set()
+
+    assert generation.cancelled.is_set()
+    response.close.assert_called_once()
+
+
 @pytest.mark.parametrize(
     "method, raises",
     [
@@ -16,7 +159,7 @@ from commizard import llm_providers as llm
         ("doesn't exist", True),
     ],
 )
-@patch("commizard.llm_providers.requests.request")
+@patch("commizard.llm_providers.send_request")
 def test_http_request_init_method_processing(mock_request, method, raises):
     url = "https://example.com"
 
@@ -38,7 +181,7 @@ def test_http_request_init_method_processing(mock_request, method, raises):
         (True, "This is a text response"),
     ],
 )
-@patch("commizard.llm_providers.requests.request")
+@patch("commizard.llm_providers.send_request")
 def test_http_request_no_raises(mock_request, is_text, resp):
     url = "https://example.com"
     method = "POST"
@@ -71,7 +214,7 @@ def test_http_request_no_raises(mock_request, is_text, resp):
         (requests.RequestException, -5, "There was an ambiguous error"),
     ],
 )
-@patch("commizard.llm_providers.requests.request")
+@patch("commizard.llm_providers.send_request")
 def test_http_request_requestslib_exceptions(
     mock_request, exception, expected_retval, err_str
 ):
@@ -155,7 +298,7 @@ def test_http_request_requestslib_exceptions(
         ),
     ],
 )
-@patch("commizard.llm_providers.requests.request")
+@patch("commizard.llm_providers.send_request")
 def test_stream_request_init(
     mock_request, kwargs, expected_kwargs, error, status_code
 ):
@@ -180,7 +323,7 @@ def test_stream_request_init(
     "encoding, expected",
     [(None, "utf-8"), ("ANSI", "ANSI"), ("utf-8", "utf-8")],
 )
-@patch("commizard.llm_providers.requests.request")
+@patch("commizard.llm_providers.send_request")
 def test_stream_request_init_correct_encoding(mock_request, encoding, expected):
     url = "https://test.com"
     method = "TEST"
@@ -374,6 +517,43 @@ def test_request_load_model(mock_http_request, monkeypatch):
     )
 
 
+@patch("commizard.llm_providers.HttpRequest")
+def test_request_load_model_keep_alive(mock_http_request, monkeypatch):
+    monkeypatch.setattr(llm.config, "LLM_URL", "TEST/")
+    llm.request_load_model("gpt", "10m")
+    mock_http_request.assert_called_once_with(
+        "POST",
+        "TEST/api/generate",
+        json={"model": "gpt", "keep_alive": "10m"},
+        timeout=(0.3, 600),
+    )
+
+
+@pytest.mark.parametrize(
+    "model, keep_alive, expected_call",
+    [
+        (None, None, None),
+        ("gpt", None, ("gpt", None)),
+        ("gpt", "10m", ("gpt", "10m")),
+    ],
+)
+@patch("commizard.llm_providers.request_load_model")
+def test_warm_up_model(
+    mock_load, model, keep_alive, expected_call, monkeypatch
+):
+    monkeypatch.setattr(llm, "selected_model", model)
+    monkeypatch.setattr(llm.config, "KEEP_ALIVE", keep_alive)
+
+    res = llm.warm_up_model()
+
+    if expected_call is None:
+        assert res is None
+        mock_load.assert_not_called()
+    else:
+        assert res == mock_load.return_value
+        mock_load.assert_called_once_with(*expected_call)
+
+
 @pytest.mark.parametrize(
     "model_name, load_res, expected_return, selected_model_result",
     [
@@ -509,6 +689,140 @@ def test_get_error_message(error_code, expected_result):
     assert llm.get_error_message(error_code) == expected_result
 
 
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_sse_decoder(chunk_size):
+    raw = (
+        ": a comment\r\n"
+        "event: message\r\n"
+        'data: {"a": "ü🙂"}\r\n'
+        "\r\n"
+        "data:no space\n"
+        "data:  two lines\n"
+        "\n"
+        "\n"
+        "id: 3\n"
+        "data: [DONE]\n"
+        "\n"
+        "data: unterminated"
+    ).encode()
+    decoder = llm.SSEDecoder()
+    events = []
+    for i in range(0, len(raw), chunk_size):
+        events += decoder.feed(raw[i : i + chunk_size])
+
+    assert events == ['{"a": "ü🙂"}', "no space\n two lines", "[DONE]"]
+    assert decoder.flush() == ["unterminated"]
+    assert decoder.flush() == []
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        ("[DONE]", None),
+        ('{"choices":[{"index":0,"delta":{"content":"foo"}}]}', "foo"),
+        ('{"choices":[{"index":0,"delta":{}}]}', ""),
+        ('{"choices":[{"index":0}]}', ""),
+        ('{"choices":[{"delta":{"role":"assistant"}}]}', ""),
+    ],
+)
+def test_parse_sse_data(data, expected):
+    assert llm.parse_sse_data(data) == expected
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson", "msgspec"])
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        ('{"id":"1","choices":[{"delta":{"content":"ü🙂"}}]}', "ü🙂"),
+        ('{"choices":[{"delta":{"content":null},"finish_reason":"stop"}]}', ""),
+        ('{"choices":[{"delta":null}]}', ""),
+        ('{"choices":[{}]}', ""),
+        ('{"choices":[]}', IndexError),
+        ('{"error":"model not found"}', KeyError),
+        ('{"choices":[', json.decoder.JSONDecodeError),
+    ],
+)
+def test_delta_decoder(backend, data, expected):
+    pytest.importorskip(backend)
+    decode = llm.json_backends[backend]()
+    if isinstance(expected, str):
+        assert decode(data) == expected
+    else:
+        with pytest.raises(expected):
+            decode(data)
+
+
+def test_delta_decoder_fallback(monkeypatch):
+    def missing():
+        raise ImportError
+
+    monkeypatch.setitem(llm.json_backends, "msgspec", missing)
+    monkeypatch.setitem(llm.json_backends, "orjson", missing)
+    llm.delta_decoder.cache_clear()
+    try:
+        for backend in [None, "orjson", "simdjson"]:
+            decode = llm.delta_decoder(backend)
+            assert decode('{"choices":[{"delta":{"content":"a"}}]}') == "a"
+            assert decode.__qualname__.startswith("json_delta_decoder")
+    finally:
+        llm.delta_decoder.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        (
+            b'data: {"choices":[{"delta":{"content":"a"}}]}\n\n'
+            b'data: {"choices":[{"delta":{}}]}\n\n'
+            b'data: {"choices":[{"delta":{"content":"b"}}]}\n\n'
+            b"data: [DONE]\n\n"
+            b'data: {"choices":[{"delta":{"content":"c"}}]}\n\n',
+            ["a", "b"],
+        ),
+        # the stream ended without [DONE] or a last blank line
+        (
+            b'data: {"choices":[{"delta":{"content":"a"}}]}\n\n'
+            b'data: {"choices":[{"delta":{"content":"b"}}]}',
+            ["a", "b"],
+        ),
+    ],
+)
+def test_iter_deltas(raw, expected):
+    chunks = [raw[i : i + 5] for i in range(0, len(raw), 5)]
+    assert list(llm.iter_deltas(chunks)) == expected
+
+
+def test_stream_request_iter_bytes():
+    stream_object = llm.StreamRequest.__new__(llm.StreamRequest)
+    stream_object.error = (False, "")
+    stream_object.response = Mock()
+    stream_object.response.iter_content.return_value = iter([b"ab", b"c"])
+
+    assert list(stream_object.iter_bytes()) == [b"ab", b"c"]
+    stream_object.response.iter_content.assert_called_once_with(chunk_size=None)
+
+    # severed connection
+    stream_object.response.iter_content.side_effect = (
+        requests.exceptions.ChunkedEncodingError
+    )
+    with pytest.raises(llm.StreamError, match="closed the connection"):
+        list(stream_object.iter_bytes())
+
+    # error in the initial request
+    stream_object.error = (True, "Test error")
+    with pytest.raises(llm.StreamError, match="Test error"):
+        list(stream_object.iter_bytes())
+
+
+def sse_chunks(events: list[str], size: int = 7) -> list[bytes]:
+    """
+    Encode SSE events into a stream cut in chunks of size bytes, which split
+    lines (and characters) anywhere.
+    """
+    raw = "".join(event + "\n\n" for event in events).encode()
+    return [raw[i : i + size] for i in range(0, len(raw), size)]
+
+
 @pytest.mark.parametrize(
     "sse_events, expected_results",
     [
@@ -596,7 +910,7 @@ def test_stream_generate_no_error(
     monkeypatch.setattr(llm, "selected_model", "mymodel")
 
     stream_obj = MagicMock()
-    stream_obj.__iter__.return_value = iter(sse_events)
+    stream_obj.iter_bytes.return_value = sse_chunks(sse_events)
     stream_obj.__enter__.return_value = stream_obj
     mock_stream_request.return_value = stream_obj
 
@@ -606,6 +920,29 @@ def test_stream_generate_no_error(
     assert res == (0, "".join(expected_results))
 
 
+@patch("commizard.llm_providers.output.live_message")
+@patch("commizard.llm_providers.StreamRequest")
+def test_stream_generate_cached(
+    mock_stream_request, mock_live_stream, monkeypatch
+):
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    stream_obj = MagicMock()
+    stream_obj.iter_bytes.side_effect = lambda: sse_chunks(
+        ['data: {"choices":[{"delta":{"content":"Fix it"}}]}', "data: [DONE]"]
+    )
+    stream_obj.__enter__.return_value = stream_obj
+    mock_stream_request.return_value = stream_obj
+    print_chunk = mock_live_stream.return_value.__enter__.return_value
+
+    assert llm.stream_generate("testing") == (0, "Fix it")
+    print_chunk.reset_mock()
+    assert llm.stream_generate("testing") == (0, "Fix it")
+
+    mock_stream_request.assert_called_once()
+    # the cached message is still printed
+    print_chunk.assert_called_once_with("Fix it")
+
+
 @pytest.mark.parametrize(
     "sse_event, expected_return",
     [
@@ -643,7 +980,7 @@ def test_stream_generate_bad_response(
 ):
     monkeypatch.setattr(llm, "selected_model", "mymodel")
     stream_obj = MagicMock()
-    stream_obj.__iter__.return_value = iter(sse_event)
+    stream_obj.iter_bytes.return_value = sse_chunks(sse_event)
     stream_obj.__enter__.return_value = stream_obj
     mock_stream_request.return_value = stream_obj
 
@@ -769,6 +1106,152 @@ def test_generate(
     assert result == expected
 
 
+@patch("commizard.llm_providers.HttpRequest")
+def test_generate_cached(mock_http_request, monkeypatch):
+    fake_response = Mock()
+    fake_response.is_error.return_value = False
+    fake_response.return_code = 200
+    fake_response.response = {"choices": [{"message": {"content": "Fix it"}}]}
+    mock_http_request.return_value = fake_response
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+
+    assert llm.generate("Test prompt") == (0, "Fix it")
+    assert llm.generate("Test prompt") == (0, "Fix it")
+    mock_http_request.assert_called_once()
+
+    # a different model or prompt isn't a hit
+    monkeypatch.setattr(llm, "selected_model", "other")
+    llm.generate("Test prompt")
+    llm.generate("Other prompt")
+    assert mock_http_request.call_count == 3
+
+
+@patch("commizard.llm_providers.HttpRequest")
+def test_generate_system(mock_http_request, monkeypatch):
+    fake_response = Mock()
+    fake_response.is_error.return_value = False
+    fake_response.return_code = 200
+    fake_response.response = {"choices": [{"message": {"content": "Fix it"}}]}
+    mock_http_request.return_value = fake_response
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+
+    llm.generate("Test prompt")
+    llm.generate("Test prompt", system="Summarize the diff.")
+
+    # the same prompt after another system message isn't a hit
+    assert mock_http_request.call_count == 2
+    messages = mock_http_request.call_args.kwargs["json"]["messages"]
+    assert messages == [
+        {"role": "system", "content": "Summarize the diff."},
+        {"role": "user", "content": "Test prompt"},
+    ]
+
+
+@patch("commizard.llm_providers.HttpRequest")
+def test_generate_without_cache(mock_http_request, monkeypatch):
+    fake_response = Mock()
+    fake_response.is_error.return_value = False
+    fake_response.return_code = 200
+    fake_response.response = {"choices": [{"message": {"content": "Fix it"}}]}
+    mock_http_request.return_value = fake_response
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+
+    assert llm.generate("Test prompt", use_cache=False) == (0, "Fix it")
+    assert llm.generate("Test prompt", use_cache=False) == (0, "Fix it")
+    assert mock_http_request.call_count == 2
+    # nor was the response stored
+    llm.generate("Test prompt")
+    assert mock_http_request.call_count == 3
+
+
+@patch("commizard.llm_providers.request_chat")
+def test_generate_candidates(mock_chat, monkeypatch):
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    mock_chat.side_effect = [(0, "first"), (1, "error"), (0, "third")]
+
+    res = llm.generate_candidates("Test prompt", 3)
+
+    # the requests run concurrently, so they may be answered in any order
+    assert sorted(res) == [(0, "first"), (0, "third"), (1, "error")]
+    mock_chat.assert_called_with("Test prompt")
+    assert mock_chat.call_count == 3
+    # the candidates weren't cached
+    assert not llm.cache.contains("mymodel", "Test prompt", llm.system_prompt)
+
+
+def test_generate_candidates_concurrently(monkeypatch):
+    import threading
+
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    # each request only returns once all 3 were sent
+    barrier = threading.Barrier(3, timeout=5)
+
+    def fake_chat(prompt):
+        return 0, f"candidate {barrier.wait()}"
+
+    monkeypatch.setattr(llm, "request_chat", fake_chat)
+
+    res = llm.generate_candidates("Test prompt", 3)
+
+    assert sorted(res) == [
+        (0, "candidate 0"),
+        (0, "candidate 1"),
+        (0, "candidate 2"),
+    ]
+
+
+@patch("commizard.llm_providers.output.live_candidates")
+@patch("commizard.llm_providers.StreamRequest")
+def test_generate_candidates_stream(
+    mock_stream_request, mock_live, monkeypatch
+):
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    stream_obj = MagicMock()
+    stream_obj.iter_bytes.side_effect = lambda: sse_chunks(
+        ['data: {"choices":[{"delta":{"content":"Fix it"}}]}', "data: [DONE]"]
+    )
+    stream_obj.__enter__.return_value = stream_obj
+    mock_stream_request.return_value = stream_obj
+    print_chunk = mock_live.return_value.__enter__.return_value
+
+    res = llm.generate_candidates("Test prompt", 2, stream=True)
+
+    assert res == [(0, "Fix it"), (0, "Fix it")]
+    mock_live.assert_called_once_with(2)
+    assert mock_stream_request.call_count == 2
+    print_chunk.assert_has_calls(
+        [call(0, "Fix it"), call(1, "Fix it")], any_order=True
+    )
+    # the candidates weren't cached
+    assert not llm.cache.contains("mymodel", "Test prompt", llm.system_prompt)
+
+
+def test_generate_candidates_interrupted(monkeypatch):
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    cancel = MagicMock()
+    wait = MagicMock(side_effect=[(0, "first"), KeyboardInterrupt])
+    monkeypatch.setattr(llm.Generation, "start", lambda self, *a: self)
+    monkeypatch.setattr(llm.Generation, "wait", wait)
+    monkeypatch.setattr(llm.Generation, "cancel", cancel)
+
+    with pytest.raises(KeyboardInterrupt):
+        llm.generate_candidates("Test prompt", 3)
+
+    # all of them are cancelled, the finished one included
+    assert cancel.call_count == 3
+
+
+@patch("commizard.llm_providers.HttpRequest")
+def test_generate_candidates_none_selected(mock_http_request, monkeypatch):
+    monkeypatch.setattr(llm, "selected_model", None)
+
+    res = llm.generate_candidates("Test prompt", 2)
+
+    mock_http_request.assert_not_called()
+    assert len(res) == 2
+    assert all(stat == 1 for stat, _ in res)
+
+
 @patch("commizard.llm_providers.HttpRequest")
 def test_generate_none_selected(mock_http_request, monkeypatch):
     monkeypatch.setattr(llm, "selected_model", None)
@@ -779,3 +1262,130 @@ def test_generate_none_selected(mock_http_request, monkeypatch):
     res = llm.generate("Test prompt")
     mock_http_request.assert_not_called()
     assert res == (1, err_str)
+
+
+def test_chat_payload_history(monkeypatch):
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    history = [
+        {"role": "user", "content": "diff"},
+        {"role": "assistant", "content": "Fix it"},
+    ]
+
+    payload = llm.chat_payload("shorter", stream=True, history=history)
+
+    assert payload == {
+        "model": "mymodel",
+        "messages": [
+            {"role": "system", "content": llm.system_prompt},
+            *history,
+            {"role": "user", "content": "shorter"},
+        ],
+        "stream": True,
+    }
+    # the history itself is left as is
+    assert len(history) == 2
+
+
+@patch("commizard.llm_providers.HttpRequest")
+def test_generate_history_not_cached(mock_http_request, monkeypatch):
+    fake_response = Mock()
+    fake_response.is_error.return_value = False
+    fake_response.return_code = 200
+    fake_response.response = {"choices": [{"message": {"content": "Fix"}}]}
+    mock_http_request.return_value = fake_response
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    history = [{"role": "user", "content": "diff"}]
+
+    assert llm.generate("shorter", history=history) == (0, "Fix")
+    assert llm.generate("shorter", history=history) == (0, "Fix")
+
+    assert mock_http_request.call_count == 2
+    payload = mock_http_request.call_args.kwargs["json"]
+    assert payload["messages"][1] == {"role": "user", "content": "diff"}
+    assert not llm.cache.contains("mymodel", "shorter", llm.system_prompt)
+
+
+def test_conversation():
+    conv = llm.Conversation("PROMPT:diff", "Fix the parser\n")
+
+    assert conv.follow_up("shorter") == llm.refine_prompt.format(
+        feedback="shorter"
+    )
+    assert conv.follow_up("") == llm.retry_prompt
+    conv.add_turn("shorter", "Fix it")
+    assert conv.messages == [
+        {"role": "user", "content": "PROMPT:diff"},
+        {"role": "assistant", "content": "Fix the parser\n"},
+        {"role": "user", "content": "shorter"},
+        {"role": "assistant", "content": "Fix it"},
+    ]
+
+
+def test_regenerate_nothing_generated(monkeypatch):
+    monkeypatch.setattr(llm, "conversation", None)
+    assert llm.regenerate("shorter") == (
+        1,
+        "No message to regenerate. Use gen first.",
+    )
+
+
+@patch("commizard.llm_providers.generate")
+def test_regenerate_no_model(mock_gen, monkeypatch):
+    monkeypatch.setattr(llm, "conversation", llm.Conversation("sys", "diff"))
+    monkeypatch.setattr(llm, "selected_model", None)
+
+    assert llm.regenerate("shorter") == (1, llm.no_model_error)
+    mock_gen.assert_not_called()
+
+
+@pytest.mark.parametrize("stat", [0, 1])
+@patch("commizard.llm_providers.generate")
+def test_regenerate(mock_gen, stat, monkeypatch):
+    conv = llm.Conversation("PROMPT:diff", "Fix the parser")
+    monkeypatch.setattr(llm, "conversation", conv)
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    monkeypatch.setattr(llm.config, "STREAM", False)
+    mock_gen.return_value = (stat, "Fix it")
+    history = list(conv.messages)
+
+    assert llm.regenerate("shorter") == (stat, "Fix it")
+
+    prompt = llm.refine_prompt.format(feedback="shorter")
+    mock_gen.assert_called_once_with(prompt, history=conv.messages)
+    if stat == 0:
+        # appended, so the next request starts with this one
+        assert conv.messages == [
+            *history,
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": "Fix it"},
+        ]
+    else:
+        assert conv.messages == history
+
+
+@patch("commizard.llm_providers.output.live_message")
+@patch("commizard.llm_providers.StreamRequest")
+def test_regenerate_stream(mock_stream_request, mock_live, monkeypatch):
+    conv = llm.Conversation("PROMPT:diff", "Fix the parser")
+    monkeypatch.setattr(llm, "conversation", conv)
+    monkeypatch.setattr(llm, "selected_model", "mymodel")
+    monkeypatch.setattr(llm.config, "STREAM", True)
+    stream_obj = MagicMock()
+    stream_obj.iter_bytes.return_value = sse_chunks(
+        ['data: {"choices":[{"delta":{"content":"Fix it"}}]}', "data: [DONE]"]
+    )
+    stream_obj.__enter__.return_value = stream_obj
+    mock_stream_request.return_value = stream_obj
+    print_chunk = mock_live.return_value.__enter__.return_value
+
+    assert llm.regenerate() == (0, "Fix it")
+
+    print_chunk.assert_called_once_with("Fix it")
+    messages = mock_stream_request.call_args.kwargs["json"]["messages"]
+    assert messages == [
+        {"role": "system", "content": llm.system_prompt},
+        {"role": "user", "content": "PROMPT:diff"},
+        {"role": "assistant", "content": "Fix the parser"},
+        {"role": "user", "content": llm.retry_prompt},
+    ]
+    assert len(conv.messages) == 4
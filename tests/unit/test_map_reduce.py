@@ -0,0 +1,128 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from commizard import compaction, map_reduce
+
+
+def file_diff(name: str, n_hunks: int, hunk_len: int = 4) -> str:
+    lines = [f"--- a/{name}", f"+++ b/{name}"]
+    for i in range(n_hunks):
+        lines.append(f"@@ -{i * 100 + 1},0 +{i * 100 + 1},{hunk_len} @@")
+        lines += [f"+{name} hunk {i} line {j}" for j in range(hunk_len)]
+    return "\n".join(lines)
+
+
+def test_split_diff_groups_files():
+    diff = "\n".join(file_diff(f"f{i}.py", 1) for i in range(6))
+    per_file = compaction.estimate_tokens(file_diff("f0.py", 1)) + 1
+
+    chunks = map_reduce.split_diff(diff, per_file * 2)
+
+    assert len(chunks) == 3
+    assert "\n".join(chunks) == diff
+    assert chunks[0].startswith("--- a/f0.py")
+    assert "--- a/f1.py" in chunks[0]
+    assert chunks[1].startswith("--- a/f2.py")
+
+
+def test_split_diff_splits_large_files():
+    diff = file_diff("big.py", 3, hunk_len=20)
+    max_tokens = compaction.estimate_tokens(file_diff("big.py", 1, 20)) + 1
+
+    chunks = map_reduce.split_diff(diff, max_tokens)
+
+    assert len(chunks) == 3
+    for i, chunk in enumerate(chunks):
+        # the header is repeated in every part of the file
+        assert chunk.startswith("--- a/big.py\n+++ b/big.py\n@@")
+        assert f"big.py hunk {i} line 19" in chunk
+        assert compaction.estimate_tokens(chunk) <= max_tokens
+
+
+def test_split_diff_compacts_large_hunks():
+    diff = file_diff("big.py", 1, hunk_len=1000)
+
+    chunks = map_reduce.split_diff(diff, 100)
+
+    assert len(chunks) == 1
+    assert compaction.estimate_tokens(chunks[0]) <= 100
+    assert chunks[0].endswith("[hunk truncated]")
+
+
+@patch("commizard.map_reduce.llm_providers.generate")
+def test_summarize(mock_gen):
+    mock_gen.side_effect = lambda prompt, system: (0, f" {prompt[-1]} \n")
+
+    assert map_reduce.summarize(["a", "b", "c"]) == (0, ["a", "b", "c"])
+    assert mock_gen.call_count == 3
+    mock_gen.assert_any_call(
+        map_reduce.summary_prompt + "b",
+        system=map_reduce.summary_system_prompt,
+    )
+
+
+@patch("commizard.map_reduce.llm_providers.generate")
+def test_summarize_error(mock_gen):
+    mock_gen.side_effect = [(0, "a"), (1, "Cannot connect to the server")]
+
+    res = map_reduce.summarize(["a", "b"])
+
+    assert res == (1, ["Cannot connect to the server"])
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 3])
+@patch("commizard.map_reduce.llm_providers.generate")
+def test_summarize_concurrency(mock_gen, max_concurrency, monkeypatch):
+    monkeypatch.setattr(map_reduce.config, "MAX_CONCURRENCY", max_concurrency)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def fake_generate(prompt, system):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return 0, prompt
+
+    mock_gen.side_effect = fake_generate
+
+    stat, _ = map_reduce.summarize([str(i) for i in range(6)])
+
+    assert stat == 0
+    assert peak == max_concurrency
+
+
+@patch("commizard.map_reduce.summarize")
+@patch("commizard.map_reduce.split_diff")
+def test_build_prompt(mock_split, mock_summarize):
+    mock_split.return_value = ["chunk 1", "chunk 2"]
+    mock_summarize.return_value = (0, ["summary 1", "summary 2"])
+
+    stat, prompt = map_reduce.build_prompt("diff", 1000)
+
+    assert stat == 0
+    assert prompt == (
+        map_reduce.reduce_prompt + "Part 1:\nsummary 1\n\nPart 2:\nsummary 2"
+    )
+    mock_split.assert_called_once_with(
+        "diff",
+        1000
+        - compaction.estimate_tokens(
+            map_reduce.summary_system_prompt + map_reduce.summary_prompt
+        ),
+    )
+    mock_summarize.assert_called_once_with(["chunk 1", "chunk 2"])
+
+
+@patch("commizard.map_reduce.summarize")
+@patch("commizard.map_reduce.split_diff")
+def test_build_prompt_error(mock_split, mock_summarize):
+    mock_summarize.return_value = (1, ["request timed out"])
+
+    assert map_reduce.build_prompt("diff", 1000) == (1, "request timed out")
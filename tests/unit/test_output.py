@@ -108,3 +108,105 @@ def test_print_table(mock_print, cols, rows, title):
 def test_wrap_text(text, width, expected):
     result = output.wrap_text(text, width=width)
     assert result == expected
+
+
+def test_live_message(monkeypatch):
+    import io
+
+    from rich.console import Console
+
+    monkeypatch.setattr(
+        output, "console", Console(file=io.StringIO(), width=100)
+    )
+    message = (
+        "Add a title that's a lot longer than fifty characters\n\n"
+        + "A body line that's long enough to be wrapped. " * 3
+        + "\n\nLast paragraph."
+    )
+
+    with output.live_message() as print_chunk:
+        for i in range(0, len(message), 3):
+            print_chunk(message[i : i + 3])
+
+    assert output.console.file.getvalue().rstrip() == (
+        "Add a title that's a lot longer than fifty \n"
+        "characters\n"
+        "\n"
+        "A body line that's long enough to be wrapped. A body line that's long \n"
+        "enough to be wrapped. A body line that's long enough to be wrapped. \n"
+        "\n"
+        "Last paragraph."
+    )
+
+
+@patch("time.monotonic")
+@patch("rich.live.Live")
+def test_live_message_coalesces_chunks(mock_live, mock_time):
+    live = mock_live.return_value.__enter__.return_value
+    # 4 chunks arrive within each frame (2 seconds)
+    mock_time.side_effect = [i / 2 for i in range(1, 101)]
+
+    with output.live_message(refresh_per_second=0.5) as print_chunk:
+        for _ in range(100):
+            print_chunk("word ")
+
+    # one refresh per frame, plus the last one
+    assert live.refresh.call_count == 26
+
+
+@patch("rich.live.Live")
+def test_live_message_prints_paragraphs_once(mock_live):
+    live = mock_live.return_value.__enter__.return_value
+    tails = []
+    live.console.print.side_effect = lambda *args, **kwargs: tails.append(
+        view.renderable.plain
+    )
+
+    with output.live_message() as print_chunk:
+        view = mock_live.call_args.args[0]
+        print_chunk("Add a parser\n\nIt reads the ")
+        print_chunk("config.\n\nLast")
+
+    printed = [
+        c.args[0].plain for c in live.console.print.call_args_list if c.args
+    ]
+    assert printed == ["Add a parser", "It reads the config."]
+    # the live display had moved on to the next paragraph before each print
+    assert tails == ["It reads the ", "It reads the ", "Last", "Last"]
+    assert view.renderable.plain == "Last"
+
+
+def test_live_candidates(monkeypatch):
+    import io
+
+    from rich.console import Console
+
+    monkeypatch.setattr(
+        output, "console", Console(file=io.StringIO(), width=80)
+    )
+
+    with output.live_candidates(2) as print_chunk:
+        print_chunk(1, "Fix the ")
+        print_chunk(0, "Add a ")
+        print_chunk(1, "parser")
+        print_chunk(0, "test")
+
+    out = output.console.file.getvalue()
+    assert "Candidate 1" in out
+    assert "Candidate 2" in out
+    # the candidates are side by side
+    line = next(line for line in out.splitlines() if "Add a test" in line)
+    assert "Fix the parser" in line
+
+
+@patch("time.monotonic")
+@patch("rich.live.Live")
+def test_live_candidates_coalesces_chunks(mock_live, mock_time):
+    live = mock_live.return_value.__enter__.return_value
+    mock_time.side_effect = [i / 2 for i in range(1, 101)]
+
+    with output.live_candidates(3, refresh_per_second=0.5) as print_chunk:
+        for i in range(100):
+            print_chunk(i % 3, "word ")
+
+    assert live.refresh.call_count == 26
@@ -0,0 +1,229 @@
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from commizard import cache, git_utils, llm_providers, speculation
+
+SYSTEM = llm_providers.system_prompt
+
+
+@pytest.fixture
+def model(monkeypatch):
+    monkeypatch.setattr(llm_providers, "selected_model", "mymodel")
+
+
+def make_repo(path):
+    repo = str(path)
+    for args in (
+        ["init", "-q"],
+        ["config", "user.email", "test@example.com"],
+        ["config", "user.name", "test"],
+    ):
+        git_utils.run_git_command(args, repo)
+    (path / "app.py").write_text("a\n")
+    git_utils.run_git_command(["add", "-A"], repo)
+    git_utils.run_git_command(["commit", "-q", "-m", "initial"], repo)
+    return repo
+
+
+def test_fingerprint(tmp_path):
+    repo = make_repo(tmp_path)
+    assert speculation.fingerprint(repo) == ()
+
+    (tmp_path / "app.py").write_text("b\n")
+    first = speculation.fingerprint(repo)
+    assert first is not None
+    assert [f[:3] for f in first] == [(1, 1, "app.py")]
+    assert speculation.fingerprint(repo) == first
+
+    # the same line counts, but another edit
+    (tmp_path / "app.py").write_text("cc\n")
+    path = tmp_path / "app.py"
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert speculation.fingerprint(repo) != first
+
+    (tmp_path / "app.py").unlink()
+    assert speculation.fingerprint(repo) == ((0, 1, "app.py", None, None),)
+
+
+def test_fingerprint_not_a_repo(tmp_path):
+    assert speculation.fingerprint(str(tmp_path)) is None
+
+
+@patch("commizard.speculation.llm_providers.request_stream_chat")
+def test_speculation_stores(mock_chat, model):
+    mock_chat.return_value = (0, "Fix it")
+    job = speculation.Speculation("prompt")
+    job.run()
+
+    assert job.finished.is_set()
+    assert cache.lookup("mymodel", "prompt", SYSTEM) == "Fix it"
+
+    # nothing is requested once it's cached
+    speculation.Speculation("prompt").run()
+    mock_chat.assert_called_once()
+
+
+@patch("commizard.speculation.llm_providers.request_stream_chat")
+def test_speculation_error(mock_chat, model):
+    mock_chat.return_value = (1, "Timeout")
+    job = speculation.Speculation("prompt")
+    job.run()
+
+    assert job.finished.is_set()
+    assert not cache.contains("mymodel", "prompt", SYSTEM)
+
+
+def test_speculation_cancelled(model, monkeypatch):
+    response = MagicMock()
+
+    def fake_chat(prompt, print_chunk):
+        job.generation.track(response)
+        print_chunk("Fix ")
+        job.cancel()
+        return 0, "Fix it"
+
+    monkeypatch.setattr(llm_providers, "request_stream_chat", fake_chat)
+    job = speculation.Speculation("prompt")
+    job.run()
+
+    assert job.finished.is_set()
+    response.close.assert_called_once()
+    assert not cache.contains("mymodel", "prompt", SYSTEM)
+
+
+def test_speculation_cancelled_before_start(model, monkeypatch):
+    chat = MagicMock()
+    monkeypatch.setattr(llm_providers, "request_stream_chat", chat)
+    job = speculation.Speculation("prompt")
+    job.cancel()
+    job.run()
+
+    assert job.finished.is_set()
+    chat.assert_not_called()
+
+
+@pytest.fixture
+def watcher(monkeypatch):
+    fingerprints = MagicMock()
+    monkeypatch.setattr(speculation, "fingerprint", fingerprints)
+    monkeypatch.setattr(speculation.Speculation, "start", MagicMock())
+    build_prompt = MagicMock(return_value="prompt")
+    w = speculation.Watcher(build_prompt, "/repo", interval=1, debounce=2)
+    return w, fingerprints, build_prompt
+
+
+def test_watcher_debounces(watcher, model):
+    w, fingerprints, build_prompt = watcher
+    fingerprints.return_value = ("a",)
+
+    w.poll(0)
+    w.poll(1)
+    build_prompt.assert_not_called()
+    w.poll(2)
+    build_prompt.assert_called_once()
+    assert w.job is not None
+    assert w.job.prompt == "prompt"
+    w.job.start.assert_called_once()
+
+    # the same changes aren't speculated on twice
+    w.poll(5)
+    build_prompt.assert_called_once()
+
+
+def test_watcher_cancels_on_change(watcher, model):
+    w, fingerprints, build_prompt = watcher
+    fingerprints.return_value = ("a",)
+    w.poll(0)
+    w.poll(2)
+    job = w.job
+
+    fingerprints.return_value = ("b",)
+    w.poll(3)
+    assert job.cancelled.is_set()
+    assert w.job is None
+    w.poll(4)
+    assert w.job is None
+    w.poll(5)
+    assert w.job is not None
+
+    # back to the first changes, which may be cached by now
+    fingerprints.return_value = ("a",)
+    w.poll(6)
+    w.poll(8)
+    assert build_prompt.call_count == 3
+
+
+@pytest.mark.parametrize("fingerprint", [(), None])
+def test_watcher_nothing_to_speculate(watcher, fingerprint):
+    w, fingerprints, build_prompt = watcher
+    fingerprints.return_value = fingerprint
+
+    w.poll(0)
+    w.poll(10)
+
+    build_prompt.assert_not_called()
+    assert w.job is None
+
+
+def test_watcher_no_prompt(watcher):
+    w, fingerprints, build_prompt = watcher
+    fingerprints.return_value = ("a",)
+    build_prompt.return_value = None
+
+    w.poll(0)
+    w.poll(2)
+    w.poll(3)
+
+    build_prompt.assert_called_once()
+    assert w.job is None
+
+
+def test_watcher_stop(watcher, model):
+    w, fingerprints, _ = watcher
+    fingerprints.return_value = ("a",)
+    w.poll(0)
+    w.poll(2)
+    job = w.job
+
+    w.stop()
+
+    assert job.cancelled.is_set()
+    w.poll(10)
+    assert w.job is None
+
+
+def test_watcher_wait_for(watcher, model):
+    w, fingerprints, _ = watcher
+    fingerprints.return_value = ("a",)
+    w.poll(0)
+    w.poll(2)
+    job = w.job
+    job.finished = MagicMock()
+
+    w.wait_for("other prompt")
+    job.finished.wait.assert_not_called()
+    w.wait_for("prompt")
+    job.finished.wait.assert_called_once()
+
+
+@patch("commizard.speculation.llm_providers.request_stream_chat")
+def test_watcher_thread(mock_chat, tmp_path, model):
+    import time
+
+    mock_chat.return_value = (0, "Update app")
+    repo = make_repo(tmp_path)
+    (tmp_path / "app.py").write_text("b\n")
+    w = speculation.Watcher(lambda: "prompt", repo, interval=0.01, debounce=0)
+    w.start()
+    try:
+        deadline = time.monotonic() + 5
+        while not cache.contains("mymodel", "prompt", SYSTEM):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        w.stop()
+    w.thread.join(1)
+    assert not w.thread.is_alive()
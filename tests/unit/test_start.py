@@ -1,8 +1,12 @@
 import shutil
-from unittest.mock import patch
+import sys
+import threading
+from unittest.mock import MagicMock, patch
 
 import pytest
-from rich.color import Color
+from rich.color import Color, ColorSystem
+from rich.console import Console
+from rich.text import Text
 
 from commizard import start
 
@@ -81,6 +85,42 @@ def test_gradient_text_none_triplet():
             assert f"]{char}" not in result
 
 
+@pytest.mark.parametrize(
+    "color_system, code",
+    [("truecolor", "\x1b[38;2;255;0;0m"), ("256", "\x1b[38;5;196m")],
+)
+def test_gradient_banner(color_system, code):
+    start.gradient_banner.cache_clear()
+
+    banner = start.gradient_banner("#FF0000", "#0000FF", color_system)
+
+    # the first column is the starting color, and whitespace isn't colored
+    assert banner.splitlines()[2].startswith(f"{code}█\x1b[0m")
+    assert Text.from_ansi(banner).plain == start.text_banner
+    assert start.gradient_banner("#FF0000", "#0000FF", color_system) is banner
+    assert start.gradient_banner.cache_info().hits == 1
+
+
+def test_gradient_banner_matches_gradient_text():
+    banner = Text.from_ansi(start.gradient_banner("#FF5E00", "#00F2FE", "256"))
+    markup = Text.from_markup(
+        start.gradient_text(
+            start.text_banner, Color.parse("#FF5E00"), Color.parse("#00F2FE")
+        )
+    )
+    console = Console(color_system="256")
+
+    for i, char in enumerate(markup.plain):
+        if char.isspace():
+            continue
+        expected = markup.get_style_at_offset(console, i).color.downgrade(
+            ColorSystem.EIGHT_BIT
+        )
+        assert banner.get_style_at_offset(console, i).color.number == (
+            expected.number
+        )
+
+
 @pytest.mark.parametrize(
     "color_sys, expect_gradient, should_colorize",
     [
@@ -103,6 +143,8 @@ def test_print_welcome(
             else:
                 self.color_system = color_system
 
+            self.file = sys.stdout
+
         def print(self, msg):
             print(msg)
 
@@ -115,7 +157,9 @@ def test_print_welcome(
 
     if should_colorize:
         if expect_gradient:
-            assert "[#" in captured
+            # written as escape codes, without markup
+            assert "\x1b[38;" in captured
+            assert "[#" not in captured
         else:
             # Should contain fallback purple markup
             assert captured.startswith("[bold ")
@@ -171,3 +215,47 @@ def test_local_ai_available(mock_req, ret_code, resp, expected):
 def test_is_inside_working_tree(mock):
     start.is_inside_working_tree()
     mock.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "installed, inside, expected",
+    [
+        (False, True, "git not installed"),
+        (True, False, "not inside work tree"),
+        (True, True, None),
+    ],
+)
+@patch("commizard.start.is_inside_working_tree")
+@patch("commizard.start.check_git_installed")
+def test_check_git(mock_installed, mock_inside, installed, inside, expected):
+    mock_installed.return_value = installed
+    mock_inside.return_value = inside
+
+    assert start.check_git() == expected
+    if not installed:
+        mock_inside.assert_not_called()
+
+
+def test_background_check():
+    release = threading.Event()
+    check = start.BackgroundCheck(lambda: release.wait() and "ok")
+
+    assert not check.done()
+    release.set()
+    assert check.result() == "ok"
+    assert check.done()
+
+
+def test_background_check_exception(monkeypatch):
+    hook = MagicMock()
+    monkeypatch.setattr(threading, "excepthook", hook)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    check = start.BackgroundCheck(fail)
+
+    assert check.result() is None
+    assert check.done()
+    # nothing is printed over the prompt
+    hook.assert_not_called()
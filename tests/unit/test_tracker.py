@@ -0,0 +1,228 @@
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from commizard import config, git_utils, tracker
+
+linux_only = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is Linux only"
+)
+
+
+@pytest.fixture(autouse=True)
+def tracking(monkeypatch):
+    monkeypatch.setattr(config, "TRACK_CHANGES", True)
+    monkeypatch.setattr(tracker, "_tracker", None)
+    monkeypatch.setattr(tracker, "_failed", False)
+    yield
+    tracker.stop()
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    path = str(tmp_path)
+    for args in (
+        ["init", "-q"],
+        ["config", "user.email", "test@example.com"],
+        ["config", "user.name", "test"],
+    ):
+        git_utils.run_git_command(args, path)
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    (tmp_path / "src" / "pkg" / "app.py").write_text("a\n")
+    (tmp_path / "README").write_text("a\n")
+    git_utils.run_git_command(["add", "-A"], path)
+    git_utils.run_git_command(["commit", "-q", "-m", "initial"], path)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@linux_only
+def test_tracker_follows_changes(repo):
+    (repo / "README").write_text("b\n")
+    t = tracker.get_tracker()
+    assert t is not None
+    assert sorted(t.dirs.values()) == ["", "src", "src/pkg"]
+    assert t.changed_paths() == {"README"}
+
+    (repo / "src" / "pkg" / "app.py").write_text("b\n")
+    assert t.changed_paths() == {"README", "src/pkg/app.py"}
+
+    # the files of a new directory are covered by its path
+    (repo / "src" / "new").mkdir()
+    (repo / "src" / "new" / "mod.py").write_text("a\n")
+    assert t.changed_paths() == {"README", "src/pkg/app.py", "src/new"}
+    (repo / "src" / "new" / "sub").mkdir()
+    assert "src/new/sub" in t.changed_paths()
+
+
+@linux_only
+def test_tracker_rescans_after_index_change(repo):
+    t = tracker.get_tracker()
+    (repo / "README").write_text("b\n")
+    (repo / "src" / "pkg" / "app.py").write_text("b\n")
+    assert t.changed_paths() == {"README", "src/pkg/app.py"}
+
+    git_utils.run_git_command(["add", "README"], str(repo))
+    assert t.changed_paths() == {"src/pkg/app.py"}
+    # unstaged again, without touching the working tree
+    git_utils.run_git_command(["reset", "-q"], str(repo))
+    assert t.changed_paths() == {"README", "src/pkg/app.py"}
+
+
+@linux_only
+def test_tracker_watches_newly_tracked_dirs(repo):
+    (repo / "newpkg").mkdir()
+    (repo / "newpkg" / "f.txt").write_text("a\n")
+    t = tracker.get_tracker()
+    assert t.changed_paths() == set()
+
+    git_utils.run_git_command(["add", "newpkg"], str(repo))
+    assert t.changed_paths() == set()
+    (repo / "newpkg" / "f.txt").write_text("b\n")
+    assert t.changed_paths() == {"newpkg/f.txt"}
+
+
+@linux_only
+def test_tracker_watches_nested_new_dirs(repo):
+    t = tracker.get_tracker()
+    # created at once, like a checkout does, before any event is read
+    (repo / "a" / "b" / "c").mkdir(parents=True)
+    assert t.changed_paths() == {"a"}
+    assert {"a", "a/b", "a/b/c"} <= set(t.dirs.values())
+
+
+@linux_only
+def test_tracker_rewatches_after_move(repo):
+    t = tracker.get_tracker()
+    (repo / "src" / "pkg").rename(repo / "src" / "moved")
+    assert t.changed_paths() == {"src/pkg/app.py"}
+    assert sorted(t.dirs.values()) == ["", "src"]
+
+    (repo / "src" / "moved").rename(repo / "src" / "pkg")
+    assert t.changed_paths() == set()
+    (repo / "src" / "pkg" / "app.py").write_text("b\n")
+    assert t.changed_paths() == {"src/pkg/app.py"}
+
+
+@linux_only
+def test_tracker_too_many_paths(repo, monkeypatch):
+    monkeypatch.setattr(config, "TRACK_MAX_PATHS", 1)
+    t = tracker.get_tracker()
+    (repo / "README").write_text("b\n")
+    assert t.changed_paths() == {"README"}
+
+    (repo / "src" / "pkg" / "app.py").write_text("b\n")
+    assert t.changed_paths() is None
+    # reseeded without the files that are unchanged again
+    (repo / "src" / "pkg" / "app.py").write_text("a\n")
+    assert t.changed_paths() == {"README"}
+
+
+@pytest.mark.parametrize("mask", [tracker.IN_Q_OVERFLOW])
+def test_handle_needs_scan(mask):
+    t = tracker.ChangeTracker("/repo", "/repo/.git")
+    t.dirty = {"README"}
+    t.handle(-1, mask, "")
+    assert t.dirty is None
+
+
+def test_handle():
+    t = tracker.ChangeTracker("/repo", "/repo/.git")
+    t.git_wd = 1
+    t.dirs = {2: "", 3: "src"}
+    t.dirty = set()
+
+    t.handle(3, tracker.IN_MODIFY, "app.py")
+    t.handle(2, tracker.IN_CREATE, ".git")
+    t.handle(1, tracker.IN_MOVED_TO, "HEAD")
+    t.handle(9, tracker.IN_MODIFY, "unknown.py")
+    assert t.dirty == {"src/app.py"}
+
+    t.handle(3, tracker.IN_IGNORED, "")
+    assert t.dirs == {2: ""}
+
+    t.handle(1, tracker.IN_MOVED_TO, "index")
+    assert t.dirty is None
+    assert t.stale
+
+
+def test_get_tracker_disabled(monkeypatch):
+    monkeypatch.setattr(config, "TRACK_CHANGES", False)
+    assert tracker.get_tracker() is None
+
+
+def test_get_tracker_not_a_repo(tmp_path, monkeypatch):
+    run = MagicMock(side_effect=git_utils.run_git_command)
+    monkeypatch.setattr(git_utils, "run_git_command", run)
+    monkeypatch.chdir(tmp_path)
+
+    assert tracker.get_tracker() is None
+    assert tracker.get_tracker() is None
+    run.assert_called_once()
+
+
+@patch("commizard.tracker.Inotify")
+def test_get_tracker_no_inotify(mock_inotify, repo):
+    mock_inotify.side_effect = OSError("inotify is only available on Linux")
+
+    assert tracker.get_tracker() is None
+    assert tracker.get_tracker() is None
+    mock_inotify.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "scope",
+    [git_utils.DiffScope(staged=True), git_utils.DiffScope(paths=["src"])],
+)
+@patch("commizard.tracker.get_tracker")
+def test_narrow_scope_other_scopes(mock_get, scope):
+    assert tracker.narrow_scope(scope) is scope
+    mock_get.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "paths, expected",
+    [
+        (None, git_utils.DiffScope(exclude=["x.lock"])),
+        (set(), None),
+        (
+            {"src/a.py", "README"},
+            git_utils.DiffScope(
+                paths=[":(top,literal)README", ":(top,literal)src/a.py"],
+                exclude=["x.lock"],
+            ),
+        ),
+    ],
+)
+@patch("commizard.tracker.get_tracker")
+def test_narrow_scope(mock_get, paths, expected):
+    mock_get.return_value.changed_paths.return_value = paths
+
+    assert tracker.narrow_scope(git_utils.DiffScope(exclude=["x.lock"])) == (
+        expected
+    )
+
+
+def test_narrow_scope_error(monkeypatch):
+    broken = MagicMock()
+    broken.changed_paths.side_effect = OSError("No space left on device")
+    monkeypatch.setattr(tracker, "_tracker", broken)
+    scope = git_utils.DiffScope()
+
+    assert tracker.narrow_scope(scope) is scope
+    broken.close.assert_called_once()
+    # full scans from now on
+    assert tracker.get_tracker() is None
+
+
+@linux_only
+def test_narrowed_diff(repo, monkeypatch):
+    (repo / "README").write_text("b\n")
+    monkeypatch.chdir(repo / "src")
+
+    scope = tracker.narrow_scope(git_utils.DiffScope())
+
+    assert scope is not None
+    diff, _ = git_utils.stream_clean_diff(scope=scope)
+    assert diff == "--- a/README\n+++ b/README\n@@ -1 +1 @@\n-a\n+b"